@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# Structured access log for server.py and user_api.py: one JSON object per
+# request and line, with the time, client, method, path, route, status, body
+# bytes and latency.
+#
+# Request threads only append a tuple to a deque (append and len are atomic,
+# so no lock is taken) and never wait on the disk: once CAPACITY records are
+# queued, new ones are dropped and counted in access_log_dropped_total. A
+# writer thread wakes every FLUSH_INTERVAL seconds, formats everything queued
+# and writes it with one call. The file is rotated when it would grow past
+# MAX_BYTES or is older than ROTATE_SECONDS, keeping BACKUPS old files
+# (access.log.1 is the newest).
+#
+# ACCESS_LOG sets the file; "off" turns logging off. With --workers each
+# worker writes its own file, named after its number.
+import atexit
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+import metrics
+
+CAPACITY = 65536
+FLUSH_INTERVAL = 0.2
+MAX_BYTES = int(os.environ.get("ACCESS_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+ROTATE_SECONDS = float(os.environ.get("ACCESS_LOG_ROTATE_SECONDS", "86400"))
+BACKUPS = int(os.environ.get("ACCESS_LOG_BACKUPS", "5"))
+
+_quote = json.encoder.encode_basestring_ascii
+# Client addresses and route labels never need escaping; the method and
+# path come from the client and do
+_LINE = ('{"time":%.3f,"client":"%s","method":%s,"path":%s,"route":"%s","status":%d,"bytes":%d,'
+         '"latency_ms":%.3f}\n')
+
+DROPPED = metrics.REGISTRY.counter("access_log_dropped_total", "Access log records dropped with the queue full.")
+_written = 0
+metrics.REGISTRY.counter("access_log_written_total", "Access log records written.", function=lambda: _written)
+
+
+def open_log(name, worker_number=None):
+    # The AccessLog of server `name`, or None when ACCESS_LOG is "off". The
+    # default file is data/logs/<name>-access.log next to the scripts.
+    path = os.environ.get(
+        "ACCESS_LOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "logs", f"{name}-access.log"))
+    if not path or path == "off":
+        return None
+    if worker_number is not None:
+        root, extension = os.path.splitext(path)
+        path = f"{root}-worker{worker_number}{extension}"
+    return AccessLog(path)
+
+
+class AccessLog:
+    def __init__(self, path, capacity=CAPACITY, flush_interval=FLUSH_INTERVAL, max_bytes=MAX_BYTES,
+                 rotate_seconds=ROTATE_SECONDS, backups=BACKUPS):
+        self.path = path
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backups = backups
+        self._records = collections.deque()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._open()
+        self._failed = False
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._write_loop, name="access-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, record):
+        # record: (time, client, method, path, route, status, bytes, latency
+        # in seconds). Called on request threads.
+        if len(self._records) >= self.capacity:
+            DROPPED.inc()
+            return
+        self._records.append(record)
+
+    def close(self):
+        if not self._stopping.is_set():
+            self._stopping.set()
+            self._thread.join()
+            if self._file is not None:
+                self._file.close()
+
+    def _open(self):
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+        # Age of a file is counted from when this process opened it
+        self._opened = time.monotonic()
+
+    def _write_loop(self):
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        # Writes every queued record; only the writer thread calls it
+        global _written
+        records = self._records
+        count = len(records)
+        if not count:
+            return
+        popleft = records.popleft
+        values = []
+        add = values.extend
+        for _ in range(count):
+            timestamp, client, method, path, route, status, size, latency = popleft()
+            add((timestamp, client, _quote(method or ""), _quote(path), route, status, size, latency * 1000))
+        # One format call for the whole batch
+        data = ((_LINE * count) % tuple(values)).encode()
+        try:
+            if self._file is None:
+                self._open()
+            elif self._size and (self._size + len(data) > self.max_bytes
+                               or time.monotonic() - self._opened >= self.rotate_seconds):
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+        except OSError as error:
+            DROPPED.inc(amount=count)
+            if not self._failed:
+                print(f"access log: cannot write {self.path}: {error}", file=sys.stderr, flush=True)
+            self._failed = True
+            return
+        self._size += len(data)
+        self._failed = False
+        _written += count
+
+    def _rotate(self):
+        self._file.close()
+        # Reopened on the next flush if anything below fails
+        self._file = None
+        for number in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{number}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{number + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# Cost of the access log (access_log.py).
+#
+# In process: the time a request thread spends queueing a record, and the
+# writer thread's time per record (formatting, writing, rotating), from
+# which the share of one core the writer needs at --target-rate requests
+# per second follows. The queue is also filled past its capacity once, to
+# check that records are dropped and counted rather than blocking.
+#
+# End to end: server.py and user_api.py are loaded with ACCESS_LOG=off and
+# then with the log on; the latency and throughput difference is what the
+# log costs a request.
+#
+#   python bench/bench_access_log.py
+#   python bench/bench_access_log.py --records 1000000 --duration 10 --concurrency 64
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import access_log  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import httpbench  # noqa: E402
+
+TARGETS = [("server.py", "/api/status"), ("user_api.py", "/api/users/user1")]
+
+
+def _record(number):
+    return (time.time(), "127.0.0.1", "GET", f"/api/users/user{number % 1000}", "/api/users/{id}", 200, 123,
+            0.000321)
+
+
+def _in_process(records, target_rate):
+    directory = tempfile.mkdtemp(prefix="bench-access-log-")
+    # A long flush interval, so the writer does not run while records are queued
+    log = access_log.AccessLog(os.path.join(directory, "access.log"), capacity=records + 1, flush_interval=3600,
+                               max_bytes=16 * 1024 * 1024)
+    batch = [_record(number) for number in range(records)]
+    start = time.perf_counter()
+    for record in batch:
+        log.log(record)
+    queued = time.perf_counter() - start
+    start = time.perf_counter()
+    log.flush()
+    written = time.perf_counter() - start
+    log.close()
+    queue_us = queued / records * 1e6
+    write_us = written / records * 1e6
+    print(f"queue   {queue_us:.3f} us per record on the request thread")
+    print(f"write   {write_us:.3f} us per record on the writer thread ({records / written:,.0f} records/s)")
+    print(f"budget  at {target_rate:,} req/s: {(queue_us + write_us) * target_rate / 1e4:.2f}% of one core")
+
+    log = access_log.AccessLog(os.path.join(directory, "full.log"), capacity=1000, flush_interval=3600)
+    dropped = access_log.DROPPED.expose()[-1]
+    for number in range(5000):
+        log.log(_record(number))
+    print(f"full    5,000 records into a queue of 1,000: {len(log._records):,} queued, "
+          f"{access_log.DROPPED.expose()[-1]} (was {dropped.split()[-1]})")
+    log.close()
+    return queue_us + write_us
+
+
+def _load(script, path, access_log_path, concurrency, duration):
+    port = httpbench.free_port()
+    process = httpbench.start_server(script, port, env={"ACCESS_LOG": access_log_path})
+    try:
+        requests = [("GET", path, httpbench.build_request("GET", path))]
+        # Warm up
+        asyncio.run(httpbench.run_load("127.0.0.1", port, requests, concurrency, 1.0))
+        return asyncio.run(httpbench.run_load("127.0.0.1", port, requests, concurrency, duration)).summary()
+    finally:
+        httpbench.stop_server(process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument("--target-rate", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--rounds", type=int, default=2,
+                        help="off/on pairs per server; the best of each is compared")
+    args = parser.parse_args()
+
+    cost_us = _in_process(args.records, args.target_rate)
+
+    print()
+    print(f"{'script':<12} {'log':<4} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for script, path in TARGETS:
+        runs = {"off": [], "on": []}
+        for _ in range(args.rounds):
+            # Alternated, so drift on the machine hits both alike
+            runs["off"].append(_load(script, path, "off", args.concurrency, args.duration))
+            log_path = os.path.join(tempfile.mkdtemp(prefix="bench-access-log-"), "access.log")
+            runs["on"].append(_load(script, path, log_path, args.concurrency, args.duration))
+        best = {}
+        for mode, summaries in runs.items():
+            best[mode] = max(summaries, key=lambda summary: summary["req_per_s"])
+            summary = best[mode]
+            print(f"{script:<12} {mode:<4} {summary['req_per_s']:>10} {summary['p50_ms']:>8} {summary['p99_ms']:>8}")
+        off, on = best["off"], best["on"]
+        # The CPU a request costs, if the server keeps one core busy
+        request_us = 1e6 / off["req_per_s"]
+        print(f"{script:<12} cost {100 * (1 - on['req_per_s'] / off['req_per_s']):>+9.1f}% req/s, "
+              f"{100 * (on['p50_ms'] / off['p50_ms'] - 1):+.1f}% p50; "
+              f"in process {cost_us:.2f} us = {100 * cost_us / request_us:.1f}% of {request_us:.0f} us per request")
+
+
+if __name__ == "__main__":
+    main()
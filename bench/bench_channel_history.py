@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Per-channel history paging with channel_index.ChannelIndex.
+#
+# Builds an index of --messages entries spread over --channels channels, with
+# one extra "hot" channel holding a tenth of all messages, then times cursor
+# pages at random depths. Page cost should be the same for the hot channel as
+# for a small one.
+#
+#   python bench/bench_channel_history.py --messages 10000000 --channels 10000
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import channel_index  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import httpbench  # noqa: E402
+
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _time_pages(index, channel_id, size, limit, samples):
+    channel = index._channels[channel_id]
+    timings = []
+    for _ in range(samples):
+        depth = random.randrange(size)
+        # Cursor for the entry at `depth`, as a client would hold after paging
+        cursor = channel_index.encode_cursor(channel.times[depth], channel.offsets[depth])
+        start = time.perf_counter()
+        index.page(channel_id, cursor, limit)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return httpbench.percentile(timings, 0.5) * 1e6, httpbench.percentile(timings, 0.99) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=10_000_000)
+    parser.add_argument("--channels", type=int, default=10_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--samples", type=int, default=20000)
+    args = parser.parse_args()
+
+    index = channel_index.ChannelIndex()
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    base = 1_700_000_000_000_000
+    for offset in range(args.messages):
+        if offset % 10 == 0:
+            index.add("hot", base + offset, offset)
+        else:
+            index.add(f"channel-{offset % args.channels}", base + offset, offset)
+    build = time.perf_counter() - start
+    print(f"build   {args.messages:,} entries / {args.channels:,} channels: "
+          f"{build:.1f} s ({args.messages / build:,.0f}/s), +{_rss_mb() - rss_before:,.0f} MB RSS")
+
+    sizes = index.channels()
+    small = "channel-1"
+    for channel_id in (small, "hot"):
+        p50, p99 = _time_pages(index, channel_id,
+                               sizes[channel_id], args.limit, args.samples)
+        print(f"page    {channel_id:<10} ({sizes[channel_id]:>9,} msgs, limit {args.limit}): "
+              f"p50 {p50:.1f} us  p99 {p99:.1f} us")
+
+    start = time.perf_counter()
+    for _ in range(args.samples):
+        index.page(f"channel-{random.randrange(args.channels)}", None, args.limit)
+    print(f"latest  page, random channel: {(time.perf_counter() - start) / args.samples * 1e6:.1f} us/page")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# Heartbeat leases and timing-wheel expiry in presence.PresenceStore.
+#
+# Tracks --users online users, then measures: heartbeats per second, the cost
+# of an expiry tick when nothing is due (it must not depend on the number of
+# users), expiry of a small due slice, and expiry of every user at once in
+# rounds of presence.MAX_EXPIRED_PER_ROUND.
+#
+#   python bench/bench_heartbeat.py --users 1000000
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import presence  # noqa: E402
+
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--heartbeats", type=int, default=500_000)
+    parser.add_argument("--ttl", type=float, default=60.0)
+    args = parser.parse_args()
+
+    users = {f"user-{number}": {"id": f"user-{number}", "username": f"user-{number}", "is_online": False}
+             for number in range(args.users)}
+    store = presence.PresenceStore(users, ttl=args.ttl)
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    version, results = store.apply_batch([(user_id, True) for user_id in users])
+    elapsed = time.perf_counter() - start
+    print(f"online  {args.users:,} users in one batch: {elapsed:.2f} s, +{_rss_mb() - rss_before:.0f} MB RSS")
+
+    ids = list(users)
+    sample = [random.choice(ids) for _ in range(args.heartbeats)]
+    store.expire()
+    start = time.perf_counter()
+    for user_id in sample:
+        store.heartbeat(user_id)
+    elapsed = time.perf_counter() - start
+    print(f"beat    {args.heartbeats:,} heartbeats: {elapsed / args.heartbeats * 1e6:.2f} us each, "
+          f"{args.heartbeats / elapsed:,.0f}/s")
+
+    store.expire()
+    now = time.monotonic()
+    ticks = 1000
+    start = time.perf_counter()
+    for tick in range(ticks):
+        store.expire(now + tick * 0.001)
+    elapsed = time.perf_counter() - start
+    print(f"tick    nothing due: {elapsed / ticks * 1e6:.2f} us per expire()")
+
+    # Renew everyone but a few users, so one tick has a small slice due
+    renewed = time.monotonic()
+    for position, user_id in enumerate(ids[1000:]):
+        store.heartbeat(user_id)
+        if position % 10000 == 0:
+            # What the expiry thread does every tick
+            store.expire()
+    start = time.perf_counter()
+    expired = 0
+    while True:
+        count = store.expire(renewed + args.ttl - 1)
+        expired += count
+        if count < presence.MAX_EXPIRED_PER_ROUND:
+            break
+    print(f"expire  small slice: {expired:,} users in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    rounds = expired = 0
+    while True:
+        round_start = time.perf_counter()
+        count = store.expire(now + args.ttl * 3)
+        longest = time.perf_counter() - round_start
+        expired += count
+        rounds += 1
+        if count < presence.MAX_EXPIRED_PER_ROUND:
+            break
+    elapsed = time.perf_counter() - start
+    print(f"expire  everyone: {expired:,} users in {elapsed:.2f} s over {rounds} rounds "
+          f"(last round {longest * 1000:.1f} ms), version {store.version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# Connection churn: persistent connections against a new connection per request.
+#
+# Clients fire bursts at /api/status on server.py and at /api/users on
+# user_api.py, the requests the Swift clients make together. In "reuse" mode
+# each client keeps one connection for the whole run. In "churn" mode every
+# request sends Connection: close, so each one pays for a TCP handshake and a
+# teardown, as every request did while the handlers spoke HTTP/1.0 without
+# Content-Length.
+#
+#   python bench/bench_keepalive.py
+#   python bench/bench_keepalive.py --engines thread asyncio --concurrency 1 64 --duration 10
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import httpbench  # noqa: E402
+
+TARGETS = [("server.py", "/api/status"), ("user_api.py", "/api/users")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--engines", nargs="+", default=["thread", "asyncio"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 64])
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--threads", type=int, default=32)
+    args = parser.parse_args()
+
+    httpbench.raise_fd_limit(max(args.concurrency) * 4 + 256)
+    results = []
+    for script, path in TARGETS:
+        for engine in args.engines:
+            for concurrency in args.concurrency:
+                for mode in ("churn", "reuse"):
+                    raw = httpbench.build_request("GET", path, keep_alive=mode == "reuse")
+                    port = httpbench.free_port()
+                    process = httpbench.start_server(script, port, "--engine", engine, "--threads", str(args.threads))
+                    try:
+                        result = asyncio.run(httpbench.run_load(
+                            "127.0.0.1", port, [("GET", path, raw)], concurrency, args.duration))
+                    finally:
+                        httpbench.stop_server(process)
+                    row = {"path": path, "engine": engine, "concurrency": concurrency, "mode": mode}
+                    row.update(result.summary())
+                    results.append(row)
+                    print(json.dumps(row), flush=True)
+
+    print()
+    print(f"{'path':<12} {'engine':<8} {'clients':>7} {'mode':<6} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'conns':>8} {'errors':>7}")
+    for row in results:
+        print(f"{row['path']:<12} {row['engine']:<8} {row['concurrency']:>7} {row['mode']:<6} {row['req_per_s']:>10} "
+              f"{row['p50_ms']:>9} {row['p99_ms']:>9} {row['connections']:>8} {row['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
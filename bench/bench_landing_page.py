@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# Bytes on the wire and CPU per request for the server.py landing page,
+# rendering it on every hit (the old behaviour) versus serving LANDING_PAGE.
+#
+#   python bench/bench_landing_page.py --requests 2000
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import httpbench  # noqa: E402
+
+sys.path.insert(0, httpbench.ROOT)
+import server  # noqa: E402
+
+
+class RenderPerRequestHandler(server.SupabaseChatHTTPRequestHandler):
+    # What do_GET did before the page was cached
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-type", "text/html")
+        self.end_headers()
+        self.wfile.write(server.render_landing_page().encode())
+
+
+def _request(headers=None):
+    return httpbench.build_request("GET", "/", headers)
+
+
+def _measure(handler_class, raw, requests):
+    response = httpbench.call_handler(handler_class, raw)
+    start = time.process_time()
+    for _ in range(requests):
+        httpbench.call_handler(handler_class, raw)
+    cpu = time.process_time() - start
+    return response.split(b" ", 2)[1].decode(), len(response), cpu / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    cached = server.SupabaseChatHTTPRequestHandler
+    identity_etag = server.LANDING_PAGE.variants["identity"][1]
+    scenarios = [("render per request", RenderPerRequestHandler, _request()),
+                 ("cached identity", cached, _request())]
+    for encoding in ("gzip", "br", "zstd"):
+        if encoding in server.LANDING_PAGE.variants:
+            scenarios.append((f"cached {encoding}", cached, _request({"Accept-Encoding": encoding})))
+    scenarios.append(("cached revalidate", cached, _request({"If-None-Match": identity_etag})))
+
+    print(f"{'scenario':<20} {'status':>6} {'wire bytes':>11} {'cpu us/req':>11}")
+    for name, handler_class, raw in scenarios:
+        status, size, cpu_us = _measure(handler_class, raw, args.requests)
+        print(f"{name:<20} {status:>6} {size:>11} {cpu_us:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# Write throughput, read throughput and recovery time for message_log.py.
+#
+#   python bench/bench_message_log.py --messages 200000 --writers 1 8 64
+#   python bench/bench_message_log.py --no-fsync
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import message_log  # noqa: E402
+
+
+def _message(number):
+    return {"id": f"msg-{number}", "user_id": f"user{number % 1000}",
+            "content": f"Message number {number} with a bit of chat text attached",
+            "created_at": "2025-04-01T14:22:00Z"}
+
+
+def _write(directory, total, writers, batch, fsync, segment_bytes):
+    log = message_log.MessageLog(directory, segment_bytes=segment_bytes, fsync=fsync)
+    per_writer = total // writers
+
+    def writer(worker):
+        base = worker * per_writer
+        for start in range(0, per_writer, batch):
+            records = [_message(base + i) for i in range(start, min(start + batch, per_writer))]
+            if batch == 1:
+                log.append(records[0])
+            else:
+                log.append_batch(records)
+
+    threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    log.close()
+    return per_writer * writers / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--batch", type=int, default=1, help="records per append call")
+    parser.add_argument("--segment-mb", type=int, default=16)
+    parser.add_argument("--no-fsync", action="store_true")
+    args = parser.parse_args()
+    segment_bytes = args.segment_mb * 1024 * 1024
+    fsync = not args.no_fsync
+
+    root = tempfile.mkdtemp(prefix="bench-message-log-")
+    try:
+        for writers in args.writers:
+            directory = os.path.join(root, f"w{writers}")
+            rate = _write(directory, args.messages, writers, args.batch, fsync, segment_bytes)
+            print(f"append  writers={writers:<4} batch={args.batch:<4} fsync={fsync}: {rate:,.0f} msg/s")
+
+        directory = os.path.join(root, f"w{args.writers[-1]}")
+        log = message_log.MessageLog(directory, segment_bytes=segment_bytes, fsync=fsync)
+        count = len(log)
+        start = time.perf_counter()
+        for _ in log.scan():
+            pass
+        print(f"scan    {count:,} records: {count / (time.perf_counter() - start):,.0f} msg/s")
+        offsets = [random.randrange(count) for _ in range(100000)]
+        start = time.perf_counter()
+        for offset in offsets:
+            log.read(offset)
+        print(f"random  reads: {len(offsets) / (time.perf_counter() - start):,.0f} msg/s")
+        log.close()
+
+        # Simulate a crash in the middle of a write, then time recovery
+        tail = message_log.segment_path(directory, message_log.list_segments(directory)[-1])
+        with open(tail, "ab") as file:
+            file.write(message_log.RECORD_HEADER.pack(500, 0) + b"torn")
+        start = time.perf_counter()
+        log = message_log.MessageLog(directory, segment_bytes=segment_bytes, fsync=fsync)
+        recovered = len(log)
+        log.close()
+        print(f"recover {len(message_log.list_segments(directory))} segments, tail replayed: "
+              f"{(time.perf_counter() - start) * 1000:.1f} ms, {recovered:,} records "
+              f"({'ok' if recovered == count else 'MISMATCH'})")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
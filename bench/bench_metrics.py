@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# Cost of recording request metrics (metrics.RequestMetricsMixin).
+#
+# Runs --requests fake requests through a handler with the mixin, whose base
+# class does no work beyond setting the path and a status, and through the
+# same handler without the mixin; the difference is what the metrics add to a
+# request: two clock reads, the route label and the histogram observation.
+# The budget is BUDGET_US per request, and the script exits with status 1
+# when recording costs more. The same is then measured with --threads
+# threads recording at once (each on its own shard, so they must not slow
+# each other beyond the GIL), and the time to render /metrics is reported
+# for the label sets recorded.
+#
+#   python bench/bench_metrics.py --requests 1000000 --threads 8 --repeat 5
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics  # noqa: E402
+
+PATHS = ["/api/users", "/api/users/user1", "/api/heartbeat?user_id=user1", "/api/toggle-status?user_id=user2",
+         "/api/users/status", "/", "/favicon.ico"]
+ROUTES = frozenset(("/", "/api/users", "/api/users/stream", "/api/users/status", "/api/heartbeat",
+                    "/api/toggle-status", "/metrics"))
+STATUSES = [200, 200, 200, 200, 304, 404]
+BUDGET_US = 1.0
+# Requests per timed batch: the two handlers take turns on each batch, so a
+# burst of load from other processes lands on both rather than on one
+BATCH = 2000
+
+
+class _Handler:
+    # What http.server.BaseHTTPRequestHandler and serving.KeepAliveHandlerMixin
+    # do around the mixin, minus the I/O
+    path = ""
+    status = 200
+    response_status = 0
+
+    def parse_request(self):
+        return True
+
+    def send_response_only(self, code, message=None):
+        self.response_status = code
+
+    def handle_one_request(self):
+        if self.parse_request():
+            self.send_response_only(self.status)
+
+
+class _MeteredHandler(metrics.RequestMetricsMixin, _Handler):
+    # The route mapping user_api.UserStatusHandler uses
+    def metrics_route(self, path):
+        path = path.partition("?")[0]
+        if path in ROUTES:
+            return path
+        if path.startswith("/api/users/"):
+            return "/api/users/{id}"
+        return "other"
+
+
+def _requests(count):
+    return [(random.choice(PATHS), random.choice(STATUSES)) for _ in range(count)]
+
+
+def _run(handler, requests):
+    start = time.perf_counter()
+    for path, status in requests:
+        handler.path = path
+        handler.status = status
+        handler.handle_one_request()
+    return time.perf_counter() - start
+
+
+def _per_request_us(requests, repeat=1):
+    # Best of `repeat` runs of each batch, so that noise from other
+    # processes does not count as metrics cost
+    baseline, metered = _Handler(), _MeteredHandler()
+    cost = 0.0
+    for start in range(0, len(requests), BATCH):
+        batch = requests[start:start + BATCH]
+        plain = timed = float("inf")
+        for _ in range(repeat):
+            plain = min(plain, _run(baseline, batch))
+            timed = min(timed, _run(metered, batch))
+        cost += timed - plain
+    return cost / len(requests) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=1_000_000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    requests = _requests(args.requests)
+    # Warm up: creates the shards and label cells
+    _per_request_us(requests[:10000])
+    cost = _per_request_us(requests, args.repeat)
+    print(f"record  1 thread: {cost:.3f} us per request")
+
+    per_thread = max(args.requests // args.threads, 1)
+    costs = []
+
+    def worker():
+        costs.append(_per_request_us(_requests(per_thread)))
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    # Threads share the GIL, so each thread's cost includes waiting for it;
+    # the wall-clock share per request is the comparable number
+    print(f"record  {args.threads} threads: {sum(costs) / len(costs):.3f} us per request per thread, "
+          f"{elapsed / (per_thread * args.threads) * 1e6:.3f} us wall clock per request (metered + baseline)")
+
+    start = time.perf_counter()
+    body = metrics.REGISTRY.expose()
+    elapsed = time.perf_counter() - start
+    series = len(metrics.REQUEST_DURATION.totals())
+    count = sum(count for count, _ in metrics.REQUEST_DURATION.totals().values())
+    print(f"expose  {series} label sets, {args.threads + 2} shards: {elapsed * 1000:.2f} ms, {len(body):,} bytes, "
+          f"{count:,} requests counted")
+    if cost >= BUDGET_US:
+        print(f"SLOW: recording costs {cost:.3f} us per request, over the {BUDGET_US} us budget", file=sys.stderr)
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# Batched presence updates through user_api.UserStatusHandler.
+#
+# Fills the store with --users users, then times POST /api/users/status with
+# --batch updates per request (half of them flipping a user, the rest no-ops
+# or unknown ids), end to end through the handler: body parsing, validation,
+# the locked apply, the coalesced SSE event and the JSON response. The
+# equivalent GET /api/toggle-status calls are timed for comparison.
+#
+#   python bench/bench_presence_batch.py --users 100000 --batch 50000
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import user_api  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import httpbench  # noqa: E402
+
+
+def _post(body):
+    raw = (f"POST /api/users/status HTTP/1.1\r\nHost: bench\r\n"
+           f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+    return httpbench.call_handler(user_api.UserStatusHandler, raw)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--batch", type=int, default=user_api.MAX_BATCH_SIZE)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--toggles", type=int, default=5000)
+    args = parser.parse_args()
+    # Keep the per-request access log out of the measurements
+    user_api.UserStatusHandler.log_message = lambda self, *args: None
+
+    for number in range(args.users):
+        user_id = f"bench-{number}"
+        user_api.users[user_id] = {"id": user_id, "username": user_id, "is_online": False}
+    user_api.snapshot_cache.reload()
+
+    timings = []
+    for _ in range(args.requests):
+        items = []
+        for _ in range(args.batch):
+            number = random.randrange(args.users + args.users // 20)
+            items.append({"user_id": f"bench-{number}", "is_online": random.random() < 0.5})
+        body = json.dumps(items).encode()
+        start = time.perf_counter()
+        response = _post(body)
+        timings.append(time.perf_counter() - start)
+        assert response.split(b" ", 2)[1] == b"200", response[:200]
+    timings.sort()
+    per_request = httpbench.percentile(timings, 0.5)
+    print(f"batch   {args.batch:,} updates: p50 {per_request * 1000:7.1f} ms  "
+          f"p99 {httpbench.percentile(timings, 0.99) * 1000:7.1f} ms  "
+          f"{args.batch / per_request:,.0f} updates/s  version {user_api.store.version}")
+
+    start = time.perf_counter()
+    for number in range(args.toggles):
+        raw = f"GET /api/toggle-status?user_id=bench-{number} HTTP/1.1\r\nHost: bench\r\n\r\n".encode()
+        httpbench.call_handler(user_api.UserStatusHandler, raw)
+    elapsed = time.perf_counter() - start
+    print(f"toggle  {args.toggles:,} requests: {elapsed / args.toggles * 1e6:7.1f} us each  "
+          f"{args.toggles / elapsed:,.0f} updates/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# presence_table.PresenceTable against the dict of user dicts it replaced.
+#
+# Builds --users users (--online of them online) both ways and reports the
+# memory each took (RSS growth, and the table's own count), then times what
+# user_api.py does with them: finding a user and setting them online (a
+# heartbeat or a toggle), counting online users, listing their ids, a page
+# of --page online and of --page offline users from the middle
+# (/api/users?online=...&cursor=), and reading one user as a dict.
+#
+#   python bench/bench_presence_table.py --users 10000000
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import presence_table  # noqa: E402
+
+
+def _rss_mb():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def _users(count, online):
+    rng = random.Random(1)
+    for number in range(count):
+        yield {"id": f"user-{number:08d}", "username": f"name_{number}", "is_online": rng.random() < online,
+               "last_seen": "2025-04-01T14:22:00Z"}
+
+
+def _timed(label, fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    print(f"{label:<36} {(time.perf_counter() - start) / repeat * 1e3:9.2f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--online", type=float, default=0.05)
+    parser.add_argument("--operations", type=int, default=200_000)
+    parser.add_argument("--page", type=int, default=100)
+    args = parser.parse_args()
+
+    rss = _rss_mb()
+    start = time.perf_counter()
+    table = presence_table.PresenceTable(_users(args.users, args.online))
+    built = time.perf_counter() - start
+    table_mb = _rss_mb() - rss
+    print(f"table  {args.users:,} users: +{table_mb:.0f} MB RSS ({table_mb * 2 ** 20 / args.users:.0f} bytes each), "
+          f"{table.nbytes / 2 ** 20:.0f} MB counted, built in {built:.1f} s")
+
+    rss = _rss_mb()
+    start = time.perf_counter()
+    users = {user["id"]: user for user in _users(args.users, args.online)}
+    built = time.perf_counter() - start
+    dicts_mb = _rss_mb() - rss
+    print(f"dicts  {args.users:,} users: +{dicts_mb:.0f} MB RSS ({dicts_mb * 2 ** 20 / args.users:.0f} bytes each), "
+          f"built in {built:.1f} s")
+    print()
+
+    counted = _timed("count online  dicts", lambda: sum(1 for user in users.values() if user["is_online"]))
+    assert counted == _timed("count online  table index", table.count_online, 10)
+    listed = _timed("list online   dicts", lambda: [user_id for user_id, user in users.items() if user["is_online"]])
+    assert listed == _timed("list online   table index", table.online_ids)
+
+    def page_dicts(online):
+        page = []
+        for position, user in enumerate(users.values()):
+            if position >= args.users // 2 and user["is_online"] == online:
+                page.append(dict(user))
+                if len(page) == args.page:
+                    return page
+        return page
+
+    def page_table(online):
+        return [table.row(slot) for slot in table.page(online, args.users // 2, args.page)[0]]
+
+    for online, label in ((True, "page online "), (False, "page offline")):
+        paged = _timed(f"{label}  dicts", lambda: page_dicts(online))
+        assert paged == _timed(f"{label}  table index", lambda: page_table(online), 100)
+
+    rng = random.Random(2)
+    ids = [f"user-{rng.randrange(args.users):08d}" for _ in range(args.operations)]
+    seen = int(time.time())
+
+    def set_dicts():
+        for user_id in ids:
+            user = users.get(user_id)
+            user["is_online"] = True
+            user["last_seen"] = "2025-04-01T14:23:00Z"
+
+    def set_table():
+        for user_id in ids:
+            table.set_online(table.slot(user_id), True, seen)
+
+    def read_dicts():
+        for user_id in ids:
+            dict(users[user_id])
+
+    def read_table():
+        for user_id in ids:
+            table[user_id]
+
+    print()
+    for label, fn in (("set online    dicts", set_dicts), ("set online    table", set_table),
+                      ("read a user   dicts", read_dicts), ("read a user   table", read_table)):
+        start = time.perf_counter()
+        fn()
+        print(f"{label:<36} {(time.perf_counter() - start) / len(ids) * 1e6:9.2f} us each")
+
+
+if __name__ == "__main__":
+    main()
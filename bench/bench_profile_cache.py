@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# profile_cache.ProfileCache in front of a slow profile loader.
+#
+# The loader sleeps --latency ms per call, like a round trip to Supabase.
+# Pages of --page messages by authors drawn (skewed towards the active
+# ones) from --users users are looked up:
+#
+# per message  one load per message, as without the cache
+# cold/warm    get_many() per page, first on an empty cache, then warm
+# stale        the same once every entry has expired: served at once while
+#              one background thread reloads them
+#
+# and the cache's memory estimate is compared with the RSS it took, filled
+# with --fill profiles.
+#
+#   python bench/bench_profile_cache.py --users 100000 --pages 2000 --latency 2
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import profile_cache  # noqa: E402
+
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _profile(user_id):
+    return {"id": user_id, "username": f"name_{user_id}",
+            "avatar_url": f"https://ui-avatars.com/api/?name={user_id}&background=random"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--page", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--fill", type=int, default=200_000)
+    args = parser.parse_args()
+
+    loads = [0]
+
+    def load(ids):
+        loads[0] += 1
+        time.sleep(args.latency / 1000)
+        return {user_id: _profile(user_id) for user_id in ids}
+
+    rng = random.Random(1)
+    # Most messages are from a few hundred active users
+    pages = [[f"user{int(args.users * rng.random() ** 4)}" for _ in range(args.page)] for _ in range(args.pages)]
+
+    sample = pages[:max(args.pages // 20, 1)]
+    start = time.perf_counter()
+    for page in sample:
+        for user_id in page:
+            load([user_id])
+    per_page = (time.perf_counter() - start) / len(sample)
+    print(f"per message  {per_page * 1e3:.2f} ms per page of {args.page}")
+
+    cache = profile_cache.ProfileCache(load, ttl=3600, stale=3600)
+    for label in ("cold", "warm"):
+        loads[0] = 0
+        start = time.perf_counter()
+        for page in pages:
+            cache.get_many(page)
+        elapsed = (time.perf_counter() - start) / len(pages)
+        print(f"{label:<12} {elapsed * 1e3:.3f} ms per page, {loads[0]:,} loads for {len(pages):,} pages, "
+              f"hit ratio {cache.hit_ratio:.3f}")
+
+    # Expire everything, keeping it servable
+    cache.ttl = 0
+    cache.clear()
+    for page in pages:
+        cache.get_many(page)
+    cache.ttl = 3600
+    loads[0] = 0
+    start = time.perf_counter()
+    for page in pages:
+        cache.get_many(page)
+    elapsed = (time.perf_counter() - start) / len(pages)
+    print(f"stale        {elapsed * 1e3:.3f} ms per page, {cache.stale_hits:,} stale hits; "
+          f"{loads[0]:,} background loads so far")
+
+    rss = _rss_mb()
+    big = profile_cache.ProfileCache(lambda ids: {user_id: _profile(user_id) for user_id in ids},
+                                     capacity=args.fill)
+    batch = 1000
+    for start in range(0, args.fill, batch):
+        big.get_many([f"fill{number}" for number in range(start, start + batch)])
+    print(f"memory       {len(big):,} profiles: estimate {big.bytes / 2 ** 20:.0f} MB, "
+          f"RSS +{_rss_mb() - rss:.0f} MB ({big.bytes / len(big):.0f} bytes each estimated)")
+
+
+if __name__ == "__main__":
+    main()
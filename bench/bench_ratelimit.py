@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# Overhead of ratelimit.RateLimiter per request.
+#
+# Times check() for a route without a limit (what most requests pay), for
+# one client well under its limit, and for --clients distinct clients
+# (each taking over a slot in the fixed table), then a flood of --flood
+# new keys, reporting that memory does not grow. A simulated clock checks
+# that a client gets exactly its burst at once and then its rate.
+#
+#   python bench/bench_ratelimit.py --clients 100000 --flood 2000000
+import argparse
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ratelimit  # noqa: E402
+
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _time(count, function):
+    start = time.perf_counter()
+    function()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500_000)
+    parser.add_argument("--clients", type=int, default=100_000)
+    parser.add_argument("--flood", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    limiter = ratelimit.RateLimiter({"/api/login": (1e9, 10, "ip"), "/api/toggle-status": (5, 20, "ip")})
+    check = limiter.check
+    table_mb = (limiter._keys.itemsize * len(limiter._keys) + limiter._tats.itemsize * len(limiter._tats)) / 2 ** 20
+
+    def unlimited():
+        for _ in range(args.requests):
+            check("/api/users", "10.0.0.1")
+
+    def one_client():
+        for _ in range(args.requests):
+            check("/api/login", "10.0.0.1")
+
+    clients = [f"10.{number >> 16 & 255}.{number >> 8 & 255}.{number & 255}" for number in range(args.clients)]
+
+    def many_clients():
+        for client in clients:
+            check("/api/login", client)
+
+    print(f"table   {len(limiter._keys):,} slots, {table_mb:.1f} MB")
+    print(f"check   unlimited route: {_time(args.requests, unlimited):.3f} us")
+    print(f"check   one client: {_time(args.requests, one_client):.3f} us")
+    print(f"check   {args.clients:,} clients: {_time(args.clients, many_clients):.3f} us")
+
+    rss = _rss_mb()
+    flood = (f"flood-{number}" for number in range(args.flood))
+
+    def flood_keys():
+        for client in flood:
+            check("/api/login", client)
+
+    print(f"flood   {args.flood:,} new keys: {_time(args.flood, flood_keys):.3f} us each, "
+          f"RSS +{_rss_mb() - rss:.1f} MB")
+
+    # Burst, then the rate, on a simulated clock
+    now = 1000.0
+    allowed = sum(1 for _ in range(50) if not check("/api/toggle-status", "10.9.9.9", now))
+    later = sum(1 for step in range(100) if not check("/api/toggle-status", "10.9.9.9", now + 1 + step / 100))
+    wait = check("/api/toggle-status", "10.9.9.9", now + 1.99)
+    print(f"limit   5/s burst 20: {allowed} of 50 at once, {later} more over the next second "
+          f"then told to wait {wait:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
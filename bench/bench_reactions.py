@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# reactions.ReactionIndex against counting the reaction rows.
+#
+# Fills the index with --reactions reactions from --users users on
+# --messages messages over --channels channels (skewed, as a few messages
+# get most of them), then times what requests pay: a reaction added and
+# removed, /api/reactions's summaries of a page of --page messages, and
+# /api/reactions/hottest's top --top of a channel. Without the index, the
+# same answers come from going over the rows (as a query over
+# message_reactions would), which is timed too, and checked to agree.
+#
+#   python bench/bench_reactions.py --reactions 2000000 --messages 200000 --channels 100
+import argparse
+import collections
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reactions  # noqa: E402
+
+REACTIONS = ("👍", "❤️", "😂", "🎉", "😮", "😢", "🔥", "👀")
+
+
+def _per_call(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reactions", type=int, default=500_000)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--page", type=int, default=50)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--operations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    channel_of = [f"channel{number % args.channels}" for number in range(args.messages)]
+    rows = set()
+    while len(rows) < args.reactions:
+        rows.add((f"msg-{int(args.messages * rng.random() ** 3)}", f"user{rng.randrange(args.users)}",
+                  REACTIONS[int(len(REACTIONS) * rng.random() ** 2)]))
+    rows = list(rows)
+
+    index = reactions.ReactionIndex()
+    start = time.perf_counter()
+    for message_id, user_id, reaction in rows:
+        index.add(message_id, channel_of[int(message_id[4:])], user_id, reaction)
+    elapsed = time.perf_counter() - start
+    print(f"load     {index.rows:,} reactions on {len(index):,} messages: {elapsed:.2f} s "
+          f"({elapsed / index.rows * 1e6:.2f} us each)")
+
+    changes = rng.sample(rows, min(args.operations, len(rows)))
+    removed = _per_call(lambda row: index.remove(*row), changes)
+    added = _per_call(lambda row: index.add(row[0], channel_of[int(row[0][4:])], *row[1:]), changes)
+    print(f"change   add {added:.2f} us, remove {removed:.2f} us")
+
+    pages = [[f"msg-{rng.randrange(args.messages)}" for _ in range(args.page)] for _ in range(1000)]
+    summaries = _per_call(lambda page: index.summaries(page, "user0"), pages)
+    channels = [f"channel{rng.randrange(args.channels)}" for _ in range(1000)]
+    hottest = _per_call(lambda channel_id: index.hottest(channel_id, args.top), channels)
+    print(f"indexed  summaries of {args.page} messages {summaries:.1f} us, "
+          f"hottest {args.top} in a channel {hottest:.1f} us")
+
+    # Without the index: one pass over the rows for each answer
+    def scan_summaries(page):
+        wanted = set(page)
+        counts = collections.defaultdict(collections.Counter)
+        for message_id, _, reaction in rows:
+            if message_id in wanted:
+                counts[message_id][reaction] += 1
+        return counts
+
+    def scan_hottest(channel_id):
+        totals = collections.Counter(message_id for message_id, _, _ in rows
+                                     if channel_of[int(message_id[4:])] == channel_id)
+        return totals.most_common(args.top)
+
+    start = time.perf_counter()
+    counted = scan_summaries(pages[0])
+    scanned_summaries = time.perf_counter() - start
+    start = time.perf_counter()
+    top = scan_hottest(channels[0])
+    scanned_hottest = time.perf_counter() - start
+    print(f"scan     summaries {scanned_summaries * 1e3:.0f} ms, hottest {scanned_hottest * 1e3:.0f} ms")
+
+    same = all(index.summary(message_id)["counts"] == dict(counted[message_id].most_common()) or
+               sorted(index.summary(message_id)["counts"].items()) == sorted(counted[message_id].items())
+               for message_id in pages[0])
+    same = same and [total for _, total in index.hottest(channels[0], args.top)] == [total for _, total in top]
+    print(f"check    {'same answers' if same else 'ANSWERS DIFFER'}")
+
+
+if __name__ == "__main__":
+    main()
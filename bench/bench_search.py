@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# Indexing rate and query latency for search_index.SearchIndex.
+#
+# Messages are drawn from a Zipf-distributed vocabulary, so there is a mix of
+# very common and rare terms, spread over --channels channels.
+#
+#   python bench/bench_search.py --messages 10000000
+#   python bench/bench_search.py --messages 1000000 --queries 2000
+import argparse
+import itertools
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import search_index  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import httpbench  # noqa: E402
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "do", "gu", "he", "ji", "wy"]
+
+
+def _vocabulary(size):
+    words = []
+    for length in range(2, 6):
+        for parts in itertools.product(SYLLABLES, repeat=length):
+            words.append("".join(parts))
+            if len(words) == size:
+                return words
+    return words
+
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _time_queries(index, queries, channels, limit):
+    timings = []
+    for query, channel in queries:
+        start = time.perf_counter()
+        index.search(query, channel, limit)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return (httpbench.percentile(timings, 0.5) * 1000, httpbench.percentile(timings, 0.99) * 1000,
+            timings[-1] * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=10_000_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--channels", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(7)
+    words = _vocabulary(args.vocabulary)
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    index = search_index.SearchIndex()
+    rss_before = _rss_mb()
+    indexing = 0.0
+    batch = 10000
+    for start in range(0, args.messages, batch):
+        count = min(batch, args.messages - start)
+        texts = [" ".join(random.choices(words, cum_weights=weights, k=random.randint(6, 16)))
+                 for _ in range(count)]
+        begin = time.perf_counter()
+        for offset, text in enumerate(texts, start):
+            index.add(offset, text, f"channel-{offset % args.channels}")
+        indexing += time.perf_counter() - begin
+    print(f"index   {args.messages:,} messages: {args.messages / indexing:,.0f} msg/s, "
+          f"+{_rss_mb() - rss_before:,.0f} MB RSS, {len(index._postings):,} terms")
+
+    common = words[:20]
+    mid = words[200:2000]
+    rare = words[10000:]
+    scenarios = {
+        "rare term": [(random.choice(rare), None) for _ in range(args.queries)],
+        "mid term": [(random.choice(mid), None) for _ in range(args.queries)],
+        "common term": [(random.choice(common), None) for _ in range(args.queries)],
+        "two terms": [(f"{random.choice(mid)} {random.choice(mid)}", None) for _ in range(args.queries)],
+        "type-ahead prefix": [(f"{random.choice(common)} {random.choice(mid)[:3]}", None)
+                              for _ in range(args.queries)],
+        "mid term, channel": [(random.choice(mid), f"channel-{random.randrange(args.channels)}")
+                              for _ in range(args.queries)],
+    }
+    for name, queries in scenarios.items():
+        p50, p99, worst = _time_queries(index, queries, args.channels, args.limit)
+        print(f"query   {name:<18} p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  max {worst:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
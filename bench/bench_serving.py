@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# Compares the serving engines in serving.py under concurrent keep-alive load.
+#
+#   python bench/bench_serving.py
+#   python bench/bench_serving.py --engines thread asyncio --concurrency 64 --duration 10
+#
+# Every client keeps its connection open when the server allows it and
+# reconnects otherwise. --slow-clients opens connections that send half a
+# request line and then stall, which is what freezes the "single" engine.
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import httpbench  # noqa: E402
+
+SERVER_ROUTES = ["/api/status", "/api/data", "/api/status", "/"]
+
+
+async def _stall(host, port, count, ready):
+    connections = []
+    for _ in range(count):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(b"GET /api/sta")
+        connections.append(writer)
+    ready.set()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for writer in connections:
+            writer.close()
+
+
+async def _measure(port, concurrency, duration, slow_clients):
+    requests = [("GET", path, httpbench.build_request("GET", path)) for path in SERVER_ROUTES]
+    stall = None
+    if slow_clients:
+        ready = asyncio.Event()
+        stall = asyncio.ensure_future(_stall("127.0.0.1", port, slow_clients, ready))
+        await ready.wait()
+    try:
+        # Wait for results with a hard cap so a stalled engine still reports
+        return await asyncio.wait_for(
+            httpbench.run_load("127.0.0.1", port, requests, concurrency, duration),
+            timeout=duration + 30)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        if stall is not None:
+            stall.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--engines", nargs="+", default=["single", "thread", "asyncio"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 64, 512])
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--slow-clients", type=int, default=0)
+    args = parser.parse_args()
+
+    httpbench.raise_fd_limit(max(args.concurrency) + args.slow_clients + 256)
+    results = []
+    for engine in args.engines:
+        for concurrency in args.concurrency:
+            port = httpbench.free_port()
+            process = httpbench.start_server(
+                "server.py", port, "--engine", engine, "--threads", str(args.threads))
+            try:
+                result = asyncio.run(_measure(port, concurrency, args.duration, args.slow_clients))
+            finally:
+                httpbench.stop_server(process)
+            row = {"engine": engine, "concurrency": concurrency}
+            row.update(result.summary() if result else {"timed_out": True})
+            results.append(row)
+            print(json.dumps(row), flush=True)
+
+    print()
+    print(f"{'engine':<8} {'clients':>7} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for row in results:
+        if row.get("timed_out"):
+            print(f"{row['engine']:<8} {row['concurrency']:>7} {'timed out':>10}")
+            continue
+        print(f"{row['engine']:<8} {row['concurrency']:>7} {row['req_per_s']:>10} "
+              f"{row['p50_ms']:>9} {row['p99_ms']:>9} {row['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# sessions.SessionStore at a million sessions.
+#
+# Creates --sessions sessions and reports the time per create and the memory
+# they take, then times what /api/status does per request: parsing and
+# verifying the cookie and looking the session up, alone and from --threads
+# threads at once (lookups take no lock, so threads only share the GIL).
+# Finally creates as many again, to show the store stays at its capacity by
+# evicting the least recently used sessions.
+#
+#   python bench/bench_sessions.py --sessions 1000000 --threads 8
+import argparse
+import email.message
+import os
+import random
+import resource
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sessions  # noqa: E402
+
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _headers(session_id):
+    headers = email.message.Message()
+    headers["Cookie"] = f"theme=dark; {sessions.COOKIE_NAME}={sessions.sign(session_id)}"
+    return headers
+
+
+def _status(store, headers_list):
+    # What the handler does for /api/status, minus the response
+    start = time.perf_counter()
+    found = 0
+    for headers in headers_list:
+        session_id = sessions.session_id_from(headers)
+        if session_id is not None and store.get(session_id) is not None:
+            found += 1
+    return time.perf_counter() - start, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    store = sessions.SessionStore(capacity=args.sessions)
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    now = int(time.time())
+    ids = [store.create(now) for _ in range(args.sessions)]
+    elapsed = time.perf_counter() - start
+    print(f"create  {args.sessions:,} sessions: {elapsed / args.sessions * 1e6:.2f} us each, "
+          f"+{_rss_mb() - rss_before:.0f} MB RSS ({(_rss_mb() - rss_before) * 1024 * 1024 / args.sessions:.0f} "
+          f"bytes per session, ids included)")
+
+    sample = random.sample(ids, min(args.lookups, len(ids)))
+    start = time.perf_counter()
+    for session_id in sample:
+        store.get(session_id)
+    elapsed = time.perf_counter() - start
+    print(f"lookup  {len(sample):,} store.get(): {elapsed / len(sample) * 1e6:.3f} us each")
+
+    headers_list = [_headers(session_id) for session_id in sample]
+    elapsed, found = _status(store, headers_list)
+    print(f"status  cookie + signature + lookup: {elapsed / len(headers_list) * 1e6:.3f} us each ({found:,} found)")
+
+    per_thread = len(headers_list) // args.threads
+    results = []
+    threads = [threading.Thread(target=lambda part=part: results.append(_status(store, part)))
+               for part in (headers_list[i * per_thread:(i + 1) * per_thread] for i in range(args.threads))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    print(f"status  {args.threads} threads: {per_thread * args.threads / elapsed:,.0f} lookups/s in total "
+          f"({sum(found for _, found in results):,} found)")
+
+    start = time.perf_counter()
+    for _ in range(args.sessions):
+        store.create(now)
+    elapsed = time.perf_counter() - start
+    print(f"evict   {args.sessions:,} more creates at capacity: {elapsed / args.sessions * 1e6:.2f} us each, "
+          f"{len(store):,} held, {store.evicted:,} evicted, {_rss_mb():.0f} MB peak RSS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# unread_counts.UnreadCounts over a message log.
+#
+# Writes --messages messages over --channels channels from --users users to
+# a throwaway log, then rebuilds the counts from it in this process and with
+# each of --processes worker processes, checking they agree, and reports the
+# memory per message. Then times what requests pay: a message added, a
+# receipt, and /api/unread's lookup of every channel's count for a user,
+# against counting one user's unread messages by scanning the log.
+#
+#   python bench/bench_unread.py --messages 2000000 --channels 1000 --processes 2,4,8
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import message_log  # noqa: E402
+import unread_counts  # noqa: E402
+
+
+def _write_log(directory, messages, channels, users):
+    rng = random.Random(1)
+    log = message_log.MessageLog(directory, fsync=False)
+    batch = []
+    for number in range(messages):
+        batch.append({"id": f"msg-{number:032x}", "user_id": f"user{rng.randrange(users)}",
+                      "channel_id": f"channel{int(channels * rng.random() ** 2)}", "content": f"message {number}",
+                      "created_at": "2025-04-01T14:22:00Z"})
+        if len(batch) == 10000:
+            log.append_batch(batch)
+            batch = []
+    if batch:
+        log.append_batch(batch)
+    return log
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=500_000)
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--processes", default="2,4")
+    parser.add_argument("--operations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    log = _write_log(tempfile.mkdtemp(prefix="bench-unread-"), args.messages, args.channels, args.users)
+    print(f"log      {len(log):,} messages in {args.channels:,} channels")
+
+    start = time.perf_counter()
+    serial = unread_counts.UnreadCounts()
+    for _, message in log.scan(0, len(log)):
+        serial.add_message(message)
+    elapsed = time.perf_counter() - start
+    # The id table, the bulk of it (RSS would count the log's pages too)
+    table = sys.getsizeof(serial._messages) + sum(sys.getsizeof(key) + sys.getsizeof(value)
+                                                  for key, value in serial._messages.items())
+    print(f"rebuild  in process: {elapsed:.2f} s ({elapsed / len(log) * 1e6:.2f} us per message), "
+          f"{table / len(log):.0f} bytes per message")
+    expected = [serial.unread(f"user{number}") for number in range(0, args.users, max(args.users // 100, 1))]
+
+    for processes in [int(value) for value in args.processes.split(",") if value]:
+        counts = unread_counts.UnreadCounts()
+        start = time.perf_counter()
+        finish = counts.count_log(log, 0, len(log), processes=processes)
+        if finish is None:
+            print(f"rebuild  {processes} processes: not split (one process, or too few messages)")
+            continue
+        finish()
+        parallel = time.perf_counter() - start
+        same = expected == [counts.unread(f"user{number}")
+                            for number in range(0, args.users, max(args.users // 100, 1))]
+        print(f"rebuild  {processes} processes: {parallel:.2f} s ({elapsed / parallel:.2f}x), "
+              f"{'same counts' if same else 'COUNTS DIFFER'}")
+
+    users = [f"user{number}" for number in range(args.users)]
+    start = time.perf_counter()
+    for user_id in users[:args.operations]:
+        serial.unread(user_id)
+    count = min(args.operations, len(users))
+    print(f"unread   {args.channels:,} channels: {(time.perf_counter() - start) / count * 1e6:.1f} us per user")
+
+    recent = [message for _, message in log.scan(len(log) - min(args.operations, len(log)), len(log))]
+    start = time.perf_counter()
+    for message in recent:
+        serial.mark_read(message["user_id"], message["channel_id"], message["id"])
+    print(f"receipt  {(time.perf_counter() - start) / len(recent) * 1e6:.2f} us each")
+
+    start = time.perf_counter()
+    for number, message in enumerate(recent):
+        serial.add_message(dict(message, id=f"new-{number}"))
+    print(f"append   {(time.perf_counter() - start) / len(recent) * 1e6:.2f} us per message")
+
+    # Without the counters: counting every channel's messages for one user
+    totals = dict.fromkeys(serial.unread("user0"), 0)
+    start = time.perf_counter()
+    for _, message in log.scan(0, len(log)):
+        totals[message["channel_id"]] += 1
+    print(f"scan     one user's counts by reading the log: {(time.perf_counter() - start) * 1e3:.0f} ms")
+    log.close()
+
+
+if __name__ == "__main__":
+    main()
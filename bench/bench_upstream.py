@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# postgrest.py against the local stand-in (bench/postgrest_standin.py).
+#
+# pool      --requests sequential reads of one profile over the keep-alive
+#           pool, and with a new connection per request as before pooling
+# stampede  --threads threads reading the same rows at once, --rounds times,
+#           with --latency ms per upstream request: the upstream requests
+#           actually made, with and without coalescing
+# breaker   the stand-in is stopped: the time calls take until the breaker
+#           opens, then per call while it is open
+#
+#   python bench/bench_upstream.py --requests 5000 --threads 32 --latency 5
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import postgrest  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import httpbench  # noqa: E402
+
+
+def _stats(port):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("GET", "/_standin/stats")
+    stats = json.loads(connection.getresponse().read())
+    connection.close()
+    return stats
+
+
+def _delta(port, before):
+    after = _stats(port)
+    return after["requests"] - before["requests"] - 1, after["connections"] - before["connections"] - 1
+
+
+def _pool(port, requests):
+    client = postgrest.PostgrestClient(f"http://127.0.0.1:{port}", "")
+    path = client._path("profiles", {"id": postgrest.eq("user1")})
+    before = _stats(port)
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.profiles(["user1"])
+    pooled = time.perf_counter() - start
+    made, opened = _delta(port, before)
+    print(f"pool     keep-alive: {pooled / requests * 1e6:.0f} us per read, {made:,} requests "
+          f"over {opened} connection(s)")
+
+    before = _stats(port)
+    start = time.perf_counter()
+    for _ in range(requests):
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection.request("GET", path, headers={"Accept": "application/json"})
+        json.loads(connection.getresponse().read())
+        connection.close()
+    fresh = time.perf_counter() - start
+    made, opened = _delta(port, before)
+    print(f"pool     connection per request: {fresh / requests * 1e6:.0f} us per read, {made:,} requests "
+          f"over {opened:,} connections ({fresh / pooled:.1f}x the time)")
+    client.close()
+
+
+def _stampede(port, threads, rounds, coalesce):
+    client = postgrest.PostgrestClient(f"http://127.0.0.1:{port}", "", pool_size=threads)
+    if not coalesce:
+        client._flights.do = lambda key, function: function()
+    barrier = threading.Barrier(threads)
+
+    def reader():
+        for _ in range(rounds):
+            barrier.wait()
+            client.profiles(columns="id,username,avatar_url")
+
+    workers = [threading.Thread(target=reader) for _ in range(threads)]
+    before = _stats(port)
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    made, _ = _delta(port, before)
+    client.close()
+    print(f"stampede {'coalesced' if coalesce else 'not coalesced':<13} {threads * rounds:,} reads -> "
+          f"{made:,} upstream requests, {elapsed / rounds * 1e3:.1f} ms per round")
+
+
+def _breaker(port, process):
+    client = postgrest.PostgrestClient(f"http://127.0.0.1:{port}", "", timeout=1.0)
+    client.profiles(["user1"])
+    httpbench.stop_server(process)
+    start = time.perf_counter()
+    failures = 0
+    while not client.breaker.is_open:
+        try:
+            client.profiles(["user1"])
+        except postgrest.UpstreamUnavailable:
+            failures += 1
+    opening = time.perf_counter() - start
+    calls = 10_000
+    start = time.perf_counter()
+    for _ in range(calls):
+        try:
+            client.profiles(["user1"])
+        except postgrest.UpstreamUnavailable:
+            pass
+    open_us = (time.perf_counter() - start) / calls * 1e6
+    print(f"breaker  opened after {failures} failures in {opening * 1e3:.1f} ms; "
+          f"then {open_us:.2f} us per call failed at once")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=5.0, help="ms per upstream request in the stampede")
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args()
+
+    port = httpbench.free_port()
+    process = httpbench.start_server("bench/postgrest_standin.py", port, "--users", str(args.users))
+    try:
+        _pool(port, args.requests)
+    finally:
+        httpbench.stop_server(process)
+
+    port = httpbench.free_port()
+    process = httpbench.start_server("bench/postgrest_standin.py", port, "--users", str(args.users),
+                                     "--latency", str(args.latency), "--threads", str(args.threads * 2))
+    try:
+        _stampede(port, args.threads, args.rounds, coalesce=False)
+        _stampede(port, args.threads, args.rounds, coalesce=True)
+        _breaker(port, process)
+    finally:
+        httpbench.stop_server(process)
+
+
+if __name__ == "__main__":
+    main()
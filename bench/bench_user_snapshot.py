@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# Read-heavy load on GET /api/users and /api/users/{id} at --users users.
+#
+# Runs --operations requests through user_api.UserStatusHandler from
+# --threads threads, with one toggle per --ratio reads (99:1 by default) and
+# --list-share of the reads asking for the full list. The same mix is then
+# run through a handler that encodes every response from the store, as
+# /api/users did before the snapshot cache, for comparison.
+#
+#   python bench/bench_user_snapshot.py --users 100000 --ratio 99
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http import HTTPStatus
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import user_api  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import httpbench  # noqa: E402
+
+
+class _UncachedHandler(user_api.UserStatusHandler):
+    def do_GET(self):
+        if self.path == "/api/users":
+            self._send_json(HTTPStatus.OK, user_api.get_user_statuses())
+        elif self.path.startswith("/api/users/"):
+            self._send_json(HTTPStatus.OK, user_api.store.get(self.path.split("/")[-1]))
+        else:
+            super().do_GET()
+
+
+def _requests(args):
+    ids = list(user_api.users)
+    requests = []
+    for _ in range(args.operations):
+        if random.random() < 1 / (args.ratio + 1):
+            path = f"/api/toggle-status?user_id={random.choice(ids)}"
+        elif random.random() < args.list_share:
+            path = "/api/users"
+        else:
+            path = f"/api/users/{random.choice(ids)}"
+        requests.append(f"GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+    return requests
+
+
+def _run(handler_class, requests, threads):
+    chunks = [requests[number::threads] for number in range(threads)]
+    received = [0] * threads
+
+    def worker(number):
+        for raw in chunks[number]:
+            received[number] += len(httpbench.call_handler(handler_class, raw))
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start, sum(received)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--ratio", type=int, default=99, help="reads per write")
+    parser.add_argument("--list-share", type=float, default=0.5)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+    user_api.UserStatusHandler.log_message = lambda self, *args: None
+
+    for number in range(args.users):
+        user_id = f"bench-{number}"
+        user_api.users[user_id] = {"id": user_id, "username": user_id, "is_online": False, "last_seen": None}
+    user_api.snapshot_cache.reload()
+    version, body = user_api.snapshot_cache.users()
+    assert body == json.dumps(user_api.get_user_statuses()).encode()
+    print(f"list    {args.users:,} users, {len(body) / 1e6:.1f} MB per /api/users response")
+
+    requests = _requests(args)
+    for name, handler_class in (("cached", user_api.UserStatusHandler), ("encoded", _UncachedHandler)):
+        rebuilds = user_api.snapshot_cache.rebuilds
+        elapsed, received = _run(handler_class, requests, args.threads)
+        print(f"{name:8}{args.operations:,} requests: {args.operations / elapsed:9,.0f} req/s  "
+              f"{received / elapsed / 1e9:5.2f} GB/s  list rebuilds {user_api.snapshot_cache.rebuilds - rebuilds}")
+
+
+if __name__ == "__main__":
+    main()
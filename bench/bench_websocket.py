@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# Broadcast benchmark for the /ws hub in server.py: connects many local
+# WebSocket clients, has one of them send chat messages and measures delivery
+# latency to every client and aggregate deliveries per second.
+#
+#   python bench/bench_websocket.py --clients 5000 --messages 50
+#   python bench/bench_websocket.py --clients 5000 --deflate
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import httpbench  # noqa: E402
+
+sys.path.insert(0, httpbench.ROOT)
+import websocket_hub  # noqa: E402
+
+CONNECT_BATCH = 500
+
+
+class Client:
+    def __init__(self, arrivals):
+        self.arrivals = arrivals
+        self.writer = None
+        self.task = None
+
+    async def connect(self, port, deflate, cookie):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        headers = {
+            "Upgrade": "websocket",
+            "Connection": "Upgrade",
+            "Sec-WebSocket-Key": base64.b64encode(os.urandom(16)).decode(),
+            "Sec-WebSocket-Version": "13",
+            "Cookie": cookie,
+        }
+        if deflate:
+            headers["Sec-WebSocket-Extensions"] = "permessage-deflate"
+        writer.write(httpbench.build_request("GET", "/ws", headers))
+        head = await reader.readuntil(b"\r\n\r\n")
+        if b" 101 " not in head.split(b"\r\n", 1)[0]:
+            raise RuntimeError(head.decode(errors="replace"))
+        negotiated = b"permessage-deflate" in head
+        self.writer = writer
+        self.task = asyncio.ensure_future(self._read(reader, negotiated))
+
+    async def _read(self, reader, deflate):
+        parser = websocket_hub.FrameParser(expect_masked=False, deflate_enabled=deflate,
+                                           max_message_bytes=1 << 20)
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                now = time.perf_counter()
+                for opcode, payload in parser.feed(data):
+                    if opcode == websocket_hub.OP_TEXT:
+                        event = json.loads(payload)
+                        if event.get("type") == "message":
+                            sequence = int(event["message"]["content"].split(" ", 1)[0])
+                            self.arrivals.setdefault(sequence, []).append(now)
+        except ConnectionError:
+            return
+
+    def send(self, text):
+        self.writer.write(websocket_hub.encode_frame(websocket_hub.OP_TEXT, text.encode(), mask=True))
+
+
+async def _bench(port, client_count, messages, rate, deflate, padding, timeout):
+    arrivals = {}
+    clients = []
+    # Messages are sent as the session's user
+    cookie = httpbench.login_cookie(port)
+    start = time.perf_counter()
+    for offset in range(0, client_count, CONNECT_BATCH):
+        batch = [Client(arrivals) for _ in range(min(CONNECT_BATCH, client_count - offset))]
+        await asyncio.gather(*(client.connect(port, deflate, cookie) for client in batch))
+        clients.extend(batch)
+    connect_seconds = time.perf_counter() - start
+
+    sender = clients[0]
+    sent = {}
+    filler = "x" * padding
+    start = time.perf_counter()
+    for sequence in range(messages):
+        sent[sequence] = time.perf_counter()
+        sender.send(json.dumps({"content": f"{sequence} {filler}"}))
+        if rate:
+            await asyncio.sleep(1 / rate)
+        else:
+            await asyncio.sleep(0)
+    deadline = time.monotonic() + timeout
+    expected = client_count * messages
+    while sum(len(times) for times in arrivals.values()) < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(arrival - sent[sequence]
+                       for sequence, times in arrivals.items() for arrival in times)
+    for client in clients:
+        client.task.cancel()
+        client.writer.close()
+    return {
+        "clients": client_count,
+        "messages": messages,
+        "deflate": deflate,
+        "delivered": len(latencies),
+        "expected": expected,
+        "connect_seconds": round(connect_seconds, 2),
+        "deliveries_per_s": round(len(latencies) / elapsed, 1),
+        "messages_per_s": round(messages / elapsed, 2),
+        "latency_p50_ms": round(httpbench.percentile(latencies, 0.50) * 1000, 2),
+        "latency_p99_ms": round(httpbench.percentile(latencies, 0.99) * 1000, 2),
+        "latency_max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=0, help="messages/s to send; 0 sends back to back")
+    parser.add_argument("--padding", type=int, default=200, help="extra characters per message")
+    parser.add_argument("--deflate", action="store_true")
+    parser.add_argument("--engine", default="asyncio")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    httpbench.raise_fd_limit(args.clients + 1024)
+    port = httpbench.free_port()
+    process = httpbench.start_server("server.py", port, "--engine", args.engine)
+    try:
+        result = asyncio.run(_bench(port, args.clients, args.messages, args.rate,
+                                    args.deflate, args.padding, args.timeout))
+    finally:
+        httpbench.stop_server(process)
+    result["engine"] = args.engine
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# Scaling of --workers N, and read consistency across workers.
+#
+# For each worker count, starts server.py and user_api.py with --workers N and
+# drives them from --load-processes client processes (so the load generator
+# is not the bottleneck), then reports throughput, the speedup over one worker
+# and the efficiency (speedup / N). The request mix is the read traffic of
+# the Swift clients; reads are served by the workers, from their replicas.
+#
+# With more than one worker, the consistency check then toggles a user and
+# immediately reads it back on --readers new connections, which the kernel
+# spreads over the workers: every read must see the toggle, whichever worker
+# made it.
+#
+# Scaling stops at the number of cores; os.cpu_count() is printed with the
+# results.
+#
+#   python bench/bench_workers.py
+#   python bench/bench_workers.py --workers 1 2 4 8 --duration 10 --concurrency 256
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import httpbench  # noqa: E402
+
+TARGETS = {
+    "server.py": ["/api/status", "/api/channels/general/messages?limit=20"],
+    "user_api.py": ["/api/users/user1", "/api/users"],
+}
+
+
+def _load(port, paths, concurrency, duration):
+    # One load generator process
+    requests = [("GET", path, httpbench.build_request("GET", path)) for path in paths]
+    result = asyncio.run(httpbench.run_load("127.0.0.1", port, requests, concurrency, duration))
+    return result.latencies, result.errors, result.elapsed
+
+
+def _measure(port, paths, processes, concurrency, duration):
+    per_process = max(concurrency // processes, 1)
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        runs = pool.starmap(_load, [(port, paths, per_process, duration)] * processes)
+    latencies = sorted(latency for run in runs for latency in run[0])
+    elapsed = max(run[2] for run in runs)
+    return {
+        "requests": len(latencies),
+        "errors": sum(run[1] for run in runs),
+        "req_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(httpbench.percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(httpbench.percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+async def _get(port, path):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(httpbench.build_request("GET", path, keep_alive=False))
+        status, _, body, _ = await httpbench.read_response(reader)
+        return status, body
+    finally:
+        writer.close()
+
+
+async def _check_consistency(port, rounds, readers):
+    # Returns (reads, stale reads): after each toggle, readers on fresh
+    # connections must all see the new state
+    reads = stale = 0
+    for _ in range(rounds):
+        status, body = await _get(port, "/api/toggle-status?user_id=user2")
+        expected = json.loads(body)["is_online"]
+        results = await asyncio.gather(*(_get(port, "/api/users/user2") for _ in range(readers)))
+        for status, body in results:
+            reads += 1
+            if status != 200 or json.loads(body)["is_online"] != expected:
+                stale += 1
+    return reads, stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--scripts", nargs="+", choices=sorted(TARGETS), default=sorted(TARGETS))
+    parser.add_argument("--engine", default="thread")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--load-processes", type=int, default=max(os.cpu_count() // 2, 1))
+    parser.add_argument("--concurrency", type=int, default=128)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--readers", type=int, default=16)
+    args = parser.parse_args()
+
+    httpbench.raise_fd_limit(args.concurrency * 2 + 256)
+    rows = []
+    for script in args.scripts:
+        baseline = None
+        for workers in args.workers:
+            port = httpbench.free_port()
+            process = httpbench.start_server(script, port, "--engine", args.engine, "--threads",
+                                             str(args.threads), "--workers", str(workers))
+            try:
+                # Let every worker bind before measuring
+                time.sleep(0.5)
+                row = {"script": script, "workers": workers}
+                row.update(_measure(port, TARGETS[script], args.load_processes, args.concurrency, args.duration))
+                if script == "user_api.py" and workers > 1:
+                    reads, stale = asyncio.run(_check_consistency(port, args.rounds, args.readers))
+                    row.update({"consistency_reads": reads, "stale_reads": stale})
+            finally:
+                httpbench.stop_server(process)
+            baseline = baseline or row["req_per_s"]
+            row["speedup"] = round(row["req_per_s"] / baseline, 2)
+            row["efficiency"] = round(row["speedup"] / workers, 2)
+            rows.append(row)
+            print(json.dumps(row), flush=True)
+
+    print()
+    print(f"cpu_count {os.cpu_count()}, {args.load_processes} load processes, {args.concurrency} connections")
+    print(f"{'script':<12} {'workers':>7} {'req/s':>10} {'speedup':>8} {'eff':>5} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'stale':>9}")
+    for row in rows:
+        stale = f"{row['stale_reads']}/{row['consistency_reads']}" if "stale_reads" in row else "-"
+        print(f"{row['script']:<12} {row['workers']:>7} {row['req_per_s']:>10} {row['speedup']:>8} "
+              f"{row['efficiency']:>5} {row['p50_ms']:>8} {row['p99_ms']:>8} {row['errors']:>7} {stale:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# HDR-style latency histogram.
+#
+# Values (integers, here microseconds) are counted in log-linear buckets: each
+# power of two is split into enough linear sub-buckets to keep
+# `significant_digits` decimal digits, so a percentile is never off by more
+# than 1 part in 10**significant_digits whatever the range, and memory only
+# grows with the number of distinct buckets hit. Histograms from several load
+# processes merge exactly, and the JSON form keeps every bucket so a result
+# file can be re-read and compared later.
+import math
+
+
+class Histogram:
+    def __init__(self, significant_digits=3):
+        self.significant_digits = significant_digits
+        # Sub-buckets per power of two: enough for the requested precision
+        self._magnitude = math.ceil(math.log2(2 * 10 ** significant_digits))
+        self._sub_buckets = 1 << self._magnitude
+        self._half = self._sub_buckets >> 1
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        if value < self._sub_buckets:
+            return value
+        bucket = value.bit_length() - self._magnitude
+        return bucket * self._half + (value >> bucket)
+
+    def _range(self, index):
+        # (lowest, highest) value counted in bucket `index`
+        if index < self._sub_buckets:
+            return index, index
+        bucket = (index - self._sub_buckets) // self._half + 1
+        sub_bucket = index - bucket * self._half
+        return sub_bucket << bucket, ((sub_bucket + 1) << bucket) - 1
+
+    def record(self, value, count=1):
+        value = max(int(value), 0)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def merge(self, other):
+        if other.significant_digits != self.significant_digits:
+            raise ValueError("histograms must have the same precision to merge")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def percentile(self, percent):
+        # Highest value equivalent to the one at `percent`, as HdrHistogram
+        # reports it; 0 when empty
+        if not self.count:
+            return 0
+        rank = max(math.ceil(percent / 100 * self.count), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._range(index)[1], self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self, percentiles=(50, 90, 99, 99.9, 99.99)):
+        return {
+            "significant_digits": self.significant_digits,
+            "count": self.count,
+            "min": self.min or 0,
+            "mean": round(self.mean(), 1),
+            "max": self.max,
+            "percentiles": {f"{percent:g}": self.percentile(percent) for percent in percentiles},
+            # [lowest value of the bucket, count], in value order
+            "buckets": [[self._range(index)[0], self.counts[index]] for index in sorted(self.counts)],
+            "total": self.total,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["significant_digits"])
+        for value, count in data["buckets"]:
+            index = histogram._index(value)
+            histogram.counts[index] = histogram.counts.get(index, 0) + count
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.min = data["min"] if data["count"] else None
+        histogram.max = data["max"]
+        return histogram
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# Small asyncio HTTP load client and server launcher shared by the benchmarks.
+import asyncio
+import http.client
+import io
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(script, port, *args, env=None):
+    # Launch server.py / user_api.py in its own process so the load client
+    # does not share a GIL with the code being measured. Messages and the
+    # access log written during a run go to a throwaway directory, and rate
+    # limits are off, as every request comes from one address.
+    env = dict({"MESSAGE_LOG_DIR": tempfile.mkdtemp(prefix="bench-messages-"),
+                "ACCESS_LOG": os.path.join(tempfile.mkdtemp(prefix="bench-logs-"), "access.log"),
+                "RATE_LIMITS": "off"}, **(env or {}))
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, script), "--port", str(port), *args],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env=dict(os.environ, **env))
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"{script} did not start on port {port}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def login_cookie(port):
+    # "session=..." for a new server.py session, to send as the Cookie header
+    # of requests that write as a user
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        connection.request("GET", "/api/login")
+        response = connection.getresponse()
+        response.read()
+        return response.getheader("Set-Cookie").split(";", 1)[0]
+    finally:
+        connection.close()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def build_request(method, path, headers=None, body=b"", host="127.0.0.1", keep_alive=True):
+    lines = [f"{method} {path} HTTP/1.1", f"Host: {host}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    for name, value in (headers or {}).items():
+        lines.append(f"{name}: {value}")
+    if body:
+        lines.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+
+
+async def read_response(reader, method="GET"):
+    # Returns (status, headers, body, keep_alive)
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    version, status = lines[0].split(" ", 2)[:2]
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    status = int(status)
+    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+    if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+        body = b""
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await reader.readline()
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b"".join(chunks)
+    else:
+        body = await reader.read()
+        keep_alive = False
+    return status, headers, body, keep_alive
+
+
+class LoadResult:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.connections = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        return {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "connections": self.connections,
+            "req_per_s": round(len(latencies) / self.elapsed, 1) if self.elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            "bytes_per_request": round(self.bytes / len(latencies)) if latencies else 0,
+        }
+
+
+async def _client(host, port, requests, deadline, result):
+    # requests: list of (method, path, raw_bytes); cycled for the duration
+    reader = writer = None
+    index = 0
+    while time.monotonic() < deadline:
+        method, _, raw = requests[index % len(requests)]
+        index += 1
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+                result.connections += 1
+            writer.write(raw)
+            status, _, body, keep_alive = await read_response(reader, method)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            result.errors += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.01)
+            continue
+        result.latencies.append(time.perf_counter() - start)
+        result.bytes += len(body)
+        if status >= 500:
+            result.errors += 1
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(host, port, requests, concurrency, duration):
+    result = LoadResult()
+    deadline = time.monotonic() + duration
+    start = time.monotonic()
+    await asyncio.gather(*(
+        _client(host, port, requests[i % len(requests):] + requests[:i % len(requests)], deadline, result)
+        for i in range(concurrency)))
+    result.elapsed = time.monotonic() - start
+    return result
+
+
+def raise_fd_limit(wanted):
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+
+class _Sink(io.RawIOBase):
+    def __init__(self, connection):
+        self._connection = connection
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._connection.sent += data
+        return len(data)
+
+
+class _FakeConnection:
+    # Just enough of a socket for StreamRequestHandler.setup()
+    def __init__(self, raw):
+        self._raw = raw
+        self.sent = bytearray()
+
+    def makefile(self, mode, buffering=-1, *args, **kwargs):
+        if "r" in mode:
+            return io.BytesIO(self._raw)
+        return io.BufferedWriter(_Sink(self), buffering if buffering > 0 else io.DEFAULT_BUFFER_SIZE)
+
+    def sendall(self, data):
+        self.sent += data
+
+    def settimeout(self, timeout):
+        pass
+
+    def setsockopt(self, *args):
+        pass
+
+
+class _FakeServer:
+    server_address = ("127.0.0.1", 0)
+
+
+def call_handler(handler_class, raw, server=None):
+    # Runs one handler instance over an in-memory connection and returns the
+    # raw response bytes, for CPU-only measurements without a network stack
+    connection = _FakeConnection(raw)
+    handler_class(connection, ("127.0.0.1", 0), server or _FakeServer())
+    return bytes(connection.sent)
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# Load generator and benchmark suite for server.py and user_api.py.
+#
+# Starts each server in its own process and drives it with asyncio clients
+# running a weighted mix of its routes (WORKLOADS), then reports throughput,
+# error rates and HDR-style latency histograms (bench/histogram.py), overall
+# and per route, as JSON. The request sequence is seeded, the first --warmup
+# seconds are not counted, and the result file records the commit and the
+# machine, so runs of different commits can be compared:
+#
+#   python bench/loadgen.py --output before.json
+#   (change something)
+#   python bench/loadgen.py --output after.json --compare before.json
+#
+# --compare prints the change per scenario and route and exits with status 1
+# when throughput dropped, or p99 latency or the error rate rose, by more
+# than --tolerance.
+#
+# By default every client sends its next request as soon as the previous one
+# is answered (closed loop). With --rate the clients together send that many
+# requests per second on a fixed schedule, and latency is measured from when
+# a request was due rather than when it was sent, so a stalled server is not
+# hidden by clients that stopped sending (coordinated omission).
+#
+#   python bench/loadgen.py --scripts user_api.py --workload presence --rate 2000
+#   python bench/loadgen.py --engines thread asyncio --processes 4 --concurrency 256
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import histogram  # noqa: E402
+import httpbench  # noqa: E402
+
+_MESSAGE = json.dumps({"content": "load generator message"}).encode()
+_STATUS_BATCH = json.dumps([{"user_id": f"user{number}", "is_online": number % 2 == 0}
+                            for number in (1, 2, 3)]).encode()
+_JSON = {"Content-Type": "application/json"}
+
+# Routes as (name, weight, method, path, headers, body), per script and
+# workload. "mixed" covers every route. Routes in SESSION_ROUTES are sent
+# with the cookie of a session logged in before the run.
+WORKLOADS = {
+    "server.py": {
+        "mixed": [
+            ("landing", 10, "GET", "/", {"Accept-Encoding": "gzip"}, b""),
+            ("data", 20, "GET", "/api/data", {}, b""),
+            ("status", 30, "GET", "/api/status", {}, b""),
+            ("login", 5, "GET", "/api/login", {}, b""),
+            ("logout", 5, "GET", "/api/logout", {}, b""),
+            ("channel", 15, "GET", "/api/channels/general/messages?limit=50", {}, b""),
+            ("search", 10, "GET", "/api/search?q=chat", {}, b""),
+            ("post-message", 5, "POST", "/api/messages", _JSON, _MESSAGE),
+        ],
+        "read": [
+            ("landing", 10, "GET", "/", {"Accept-Encoding": "gzip"}, b""),
+            ("data", 20, "GET", "/api/data", {}, b""),
+            ("status", 50, "GET", "/api/status", {}, b""),
+            ("channel", 20, "GET", "/api/channels/general/messages?limit=50", {}, b""),
+        ],
+        "session": [
+            ("status", 80, "GET", "/api/status", {}, b""),
+            ("login", 10, "GET", "/api/login", {}, b""),
+            ("logout", 10, "GET", "/api/logout", {}, b""),
+        ],
+    },
+    "user_api.py": {
+        "mixed": [
+            ("landing", 5, "GET", "/", {}, b""),
+            ("users", 30, "GET", "/api/users", {}, b""),
+            ("user", 30, "GET", "/api/users/user1", {}, b""),
+            ("users-since", 5, "GET", "/api/users?since=0", {}, b""),
+            ("toggle", 10, "GET", "/api/toggle-status?user_id=user2", {}, b""),
+            ("heartbeat", 15, "POST", "/api/heartbeat?user_id=user3", {}, b""),
+            ("status-batch", 5, "POST", "/api/users/status", _JSON, _STATUS_BATCH),
+        ],
+        "read": [
+            ("users", 50, "GET", "/api/users", {}, b""),
+            ("user", 50, "GET", "/api/users/user1", {}, b""),
+        ],
+        "presence": [
+            ("users", 20, "GET", "/api/users", {}, b""),
+            ("user", 20, "GET", "/api/users/user1", {}, b""),
+            ("toggle", 30, "GET", "/api/toggle-status?user_id=user2", {}, b""),
+            ("heartbeat", 30, "POST", "/api/heartbeat?user_id=user3", {}, b""),
+        ],
+    },
+}
+
+
+SESSION_ROUTES = frozenset(("post-message",))
+
+
+class _Stats:
+    # Latencies in microseconds, per route and overall, and outcomes
+    def __init__(self, routes):
+        self.latency = histogram.Histogram()
+        self.routes = {name: {"latency": histogram.Histogram(), "statuses": {}, "errors": 0}
+                       for name in routes}
+        self.errors = 0
+        self.connections = 0
+        self.bytes = 0
+
+    def record(self, route, latency_us, status):
+        stats = self.routes[route]
+        if status is None or status >= 400:
+            self.errors += 1
+            stats["errors"] += 1
+        key = str(status) if status is not None else "error"
+        stats["statuses"][key] = stats["statuses"].get(key, 0) + 1
+        if status is not None:
+            self.latency.record(latency_us)
+            stats["latency"].record(latency_us)
+
+    def to_dict(self):
+        return {
+            "latency": self.latency.to_dict(),
+            "errors": self.errors,
+            "connections": self.connections,
+            "bytes": self.bytes,
+            "routes": {name: {"latency": stats["latency"].to_dict(), "statuses": stats["statuses"],
+                              "errors": stats["errors"]}
+                       for name, stats in self.routes.items()},
+        }
+
+    @classmethod
+    def merge(cls, parts):
+        merged = cls(parts[0]["routes"])
+        for part in parts:
+            merged.latency.merge(histogram.Histogram.from_dict(part["latency"]))
+            merged.errors += part["errors"]
+            merged.connections += part["connections"]
+            merged.bytes += part["bytes"]
+            for name, route in part["routes"].items():
+                stats = merged.routes[name]
+                stats["latency"].merge(histogram.Histogram.from_dict(route["latency"]))
+                stats["errors"] += route["errors"]
+                for status, count in route["statuses"].items():
+                    stats["statuses"][status] = stats["statuses"].get(status, 0) + count
+        return merged
+
+
+def _plan(routes, seed, length=4096):
+    # A seeded sequence of (route, method, raw request) following the weights
+    rng = random.Random(seed)
+    requests = [(name, method, httpbench.build_request(method, path, headers, body))
+                for name, _, method, path, headers, body in routes]
+    weights = [route[1] for route in routes]
+    return rng.choices(requests, weights, k=length)
+
+
+async def _client(port, plan, start, warmup_end, deadline, interval, stats):
+    reader = writer = None
+    due = start
+    index = 0
+    while True:
+        if interval:
+            # Open loop: wait for this request's slot on the schedule
+            due += interval
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        route, method, raw = plan[index % len(plan)]
+        index += 1
+        sent = due if interval else now
+        status = None
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                stats.connections += 1
+            writer.write(raw)
+            status, _, body, keep_alive = await httpbench.read_response(reader, method)
+            stats.bytes += len(body)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            keep_alive = False
+        if sent >= warmup_end:
+            stats.record(route, (time.monotonic() - sent) * 1e6, status)
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+        if status is None:
+            await asyncio.sleep(0.01)
+    if writer is not None:
+        writer.close()
+
+
+async def _generate(port, routes, concurrency, duration, warmup, rate, seed):
+    stats = _Stats([route[0] for route in routes])
+    start = time.monotonic()
+    warmup_end = start + warmup
+    deadline = warmup_end + duration
+    # Per-client schedule, staggered so requests are spread evenly
+    interval = concurrency / rate if rate else 0
+    await asyncio.gather(*(
+        _client(port, _plan(routes, seed * 1000 + number), start + (interval * number / concurrency),
+                warmup_end, deadline, interval, stats)
+        for number in range(concurrency)))
+    return stats.to_dict()
+
+
+def _load_process(port, routes, concurrency, duration, warmup, rate, seed):
+    return asyncio.run(_generate(port, routes, concurrency, duration, warmup, rate, seed))
+
+
+def run_scenario(script, workload, engine, workers, args):
+    routes = WORKLOADS[script][workload]
+    port = httpbench.free_port()
+    process = httpbench.start_server(script, port, "--engine", engine, "--threads", str(args.threads),
+                                     "--workers", str(workers))
+    try:
+        if any(route[0] in SESSION_ROUTES for route in routes):
+            cookie = httpbench.login_cookie(port)
+            routes = [(name, weight, method, path, dict(headers, Cookie=cookie) if name in SESSION_ROUTES else headers,
+                       body)
+                      for name, weight, method, path, headers, body in routes]
+        processes = args.processes
+        concurrency = max(args.concurrency // processes, 1)
+        rate = args.rate / processes if args.rate else 0
+        jobs = [(port, routes, concurrency, args.duration, args.warmup, rate, args.seed + number)
+                for number in range(processes)]
+        if processes == 1:
+            parts = [_load_process(*jobs[0])]
+        else:
+            with multiprocessing.get_context("spawn").Pool(processes) as pool:
+                parts = pool.starmap(_load_process, jobs)
+    finally:
+        httpbench.stop_server(process)
+    stats = _Stats.merge(parts)
+    requests = sum(sum(route["statuses"].values()) for route in stats.routes.values())
+    result = {
+        "scenario": f"{script} {workload} {engine} x{workers}",
+        "script": script,
+        "workload": workload,
+        "engine": engine,
+        "workers": workers,
+        "requests": requests,
+        "req_per_s": round(requests / args.duration, 1),
+        "error_rate": round(stats.errors / requests, 6) if requests else 0.0,
+    }
+    result.update(stats.to_dict())
+    for name, route in result["routes"].items():
+        count = sum(route["statuses"].values())
+        route["requests"] = count
+        route["req_per_s"] = round(count / args.duration, 1)
+        route["error_rate"] = round(route["errors"] / count, 6) if count else 0.0
+    return result
+
+
+def _git(*command):
+    try:
+        return subprocess.run(["git", *command], cwd=httpbench.ROOT, capture_output=True, text=True,
+                              timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def _metadata(args):
+    return {
+        "commit": _git("rev-parse", "HEAD") or None,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "date": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": {name: value for name, value in vars(args).items() if name not in ("output", "compare")},
+    }
+
+
+def _change(new, old):
+    return (new - old) / old if old else 0.0
+
+
+def compare(report, baseline, tolerance):
+    # Prints the change from baseline; returns the regressions found
+    old_results = {result["scenario"]: result for result in baseline["results"]}
+    print(f"\nagainst {baseline['meta'].get('commit') or 'baseline'} "
+          f"(tolerance {tolerance:.0%})")
+    print(f"{'scenario / route':<48} {'req/s':>10} {'change':>8} {'p99 us':>10} {'change':>8} {'errors':>8}")
+    regressions = []
+    for result in report["results"]:
+        old = old_results.get(result["scenario"])
+        if old is None:
+            print(f"{result['scenario']:<48} (not in baseline)")
+            continue
+        rows = [(result["scenario"], result, old)]
+        rows += [(f"  {name}", route, old["routes"][name])
+                 for name, route in result["routes"].items() if name in old["routes"]]
+        for label, new_row, old_row in rows:
+            throughput = _change(new_row["req_per_s"], old_row["req_per_s"])
+            p99 = _change(new_row["latency"]["percentiles"]["99"], old_row["latency"]["percentiles"]["99"])
+            errors = new_row["error_rate"] - old_row["error_rate"]
+            flags = []
+            if throughput < -tolerance:
+                flags.append("throughput")
+            if p99 > tolerance:
+                flags.append("p99")
+            if errors > tolerance / 100:
+                flags.append("errors")
+            if flags:
+                regressions.append((label.strip(), flags))
+            print(f"{label:<48} {new_row['req_per_s']:>10} {throughput:>+8.1%} "
+                  f"{new_row['latency']['percentiles']['99']:>10} {p99:>+8.1%} {new_row['error_rate']:>8.2%}"
+                  f"{'  REGRESSION: ' + ', '.join(flags) if flags else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scripts", nargs="+", choices=sorted(WORKLOADS), default=sorted(WORKLOADS))
+    parser.add_argument("--workload", default="mixed",
+                        help="route mix: " + ", ".join(sorted({name for mixes in WORKLOADS.values() for name in mixes})))
+    parser.add_argument("--engines", nargs="+", default=["thread"])
+    parser.add_argument("--workers", nargs="+", type=int, default=[1])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=64, help="connections, over all load processes")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="total requests/s on a fixed schedule (default: closed loop)")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds sent first and not measured")
+    parser.add_argument("--processes", type=int, default=1, help="load generator processes")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    httpbench.raise_fd_limit(args.concurrency * 2 + 256)
+    report = {"meta": _metadata(args), "results": []}
+    for script in args.scripts:
+        if args.workload not in WORKLOADS[script]:
+            parser.error(f"{script} has no {args.workload!r} workload")
+        for engine in args.engines:
+            for workers in args.workers:
+                result = run_scenario(script, args.workload, engine, workers, args)
+                report["results"].append(result)
+                percentiles = result["latency"]["percentiles"]
+                print(f"{result['scenario']:<40} {result['req_per_s']:>10} req/s  p50 {percentiles['50']:>8} us  "
+                      f"p99 {percentiles['99']:>8} us  p99.9 {percentiles['99.9']:>8} us  "
+                      f"errors {result['error_rate']:.2%}", file=sys.stderr, flush=True)
+
+    encoded = json.dumps(report, indent=1)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(encoded + "\n")
+    else:
+        print(encoded)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# In-memory stand-in for the Supabase REST API (PostgREST), for running
+# server.py and user_api.py and benchmarking postgrest.py offline.
+#
+# Serves the tables in create.sql under /rest/v1/<table>, seeded with
+# --users profiles (and their user_status rows) and --messages messages.
+# Understands what postgrest.py sends: select=, order=, limit=, offset= and
+# eq/neq/gt/gte/lt/lte/in/is filters on GET, PATCH and DELETE, and inserts
+# of a row or a list of rows on POST. Embedded resources in select= are
+# ignored. --latency adds a delay to every request, standing in for the
+# network and the database; --key makes it check the apikey header.
+# GET /_standin/stats counts the requests and connections it has served.
+#
+#   python bench/postgrest_standin.py --port 54321 --users 1000 --latency 2
+#   SUPABASE_URL=http://127.0.0.1:54321 python server.py
+import argparse
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import serving  # noqa: E402
+
+TABLES = ("profiles", "messages", "channels", "channel_messages", "channel_members", "user_status",
+          "read_receipts", "message_reactions")
+_EPOCH = datetime(2025, 4, 1, tzinfo=timezone.utc)
+
+
+def _timestamp(moment=None):
+    return (moment or datetime.now(timezone.utc)).isoformat()
+
+
+def seed(users, messages):
+    tables = {table: [] for table in TABLES}
+    for number in range(1, users + 1):
+        user_id = f"user{number}"
+        tables["profiles"].append({
+            "id": user_id, "username": f"user_{number}", "display_name": None,
+            "avatar_url": f"https://ui-avatars.com/api/?name=User{number}&background=random",
+            "status": "offline", "last_seen": _timestamp(_EPOCH), "created_at": _timestamp(_EPOCH),
+            "updated_at": _timestamp(_EPOCH)})
+        tables["user_status"].append({"id": user_id, "is_online": False, "last_status_change": _timestamp(_EPOCH)})
+    for number in range(1, messages + 1):
+        created = _timestamp(_EPOCH + timedelta(seconds=number))
+        tables["messages"].append({
+            "id": f"msg{number}", "user_id": f"user{number % max(users, 1) + 1}",
+            "content": f"Message {number}", "is_edited": False, "created_at": created, "updated_at": created})
+    return tables
+
+
+def _text(value):
+    # A column value as PostgREST filters see it
+    if value is None:
+        return "null"
+    if value is True or value is False:
+        return "true" if value else "false"
+    return str(value)
+
+
+def _in_values(argument):
+    # "(a,"b,c",d)" -> ["a", "b,c", "d"]
+    if not (argument.startswith("(") and argument.endswith(")")):
+        raise ValueError(f"in. needs a list in parentheses, not {argument!r}")
+    values, current, quoted, escaped = [], [], False, False
+    for char in argument[1:-1]:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == "\\" and quoted:
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char == "," and not quoted:
+            values.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    values.append("".join(current))
+    return set(values)
+
+
+def _compare(left, right):
+    try:
+        return (float(left) > float(right)) - (float(left) < float(right))
+    except ValueError:
+        return (left > right) - (left < right)
+
+
+_OPERATORS = {
+    "eq": lambda value, argument: value == argument,
+    "neq": lambda value, argument: value != argument,
+    "gt": lambda value, argument: _compare(value, argument) > 0,
+    "gte": lambda value, argument: _compare(value, argument) >= 0,
+    "lt": lambda value, argument: _compare(value, argument) < 0,
+    "lte": lambda value, argument: _compare(value, argument) <= 0,
+    "is": lambda value, argument: value == argument,
+}
+
+
+def parse_query(query):
+    # (filters, columns or None, order, limit, offset); filters are
+    # (column, test(text) -> bool)
+    filters, columns, order, limit, offset = [], None, [], None, 0
+    for name, value in parse_qsl(query, keep_blank_values=True):
+        if name == "select":
+            # Embedded resources ("profiles!fk(username)") are not served
+            names = [column.strip() for column in value.split(",") if "(" not in column and ")" not in column]
+            columns = None if "*" in names else names
+        elif name == "order":
+            for part in value.split(","):
+                column, _, direction = part.partition(".")
+                order.append((column, direction.startswith("desc")))
+        elif name == "limit":
+            limit = int(value)
+        elif name == "offset":
+            offset = int(value)
+        else:
+            operator, _, argument = value.partition(".")
+            if operator == "in":
+                members = _in_values(argument)
+                filters.append((name, members.__contains__))
+            elif operator in _OPERATORS:
+                test = _OPERATORS[operator]
+                filters.append((name, lambda text, test=test, argument=argument: test(text, argument)))
+            else:
+                raise ValueError(f"unknown operator {operator!r} in {name}={value}")
+    return filters, columns, order, limit, offset
+
+
+class Standin:
+    def __init__(self, tables, latency=0.0, key=None):
+        self.tables = tables
+        self.latency = latency
+        self.key = key
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    def select(self, table, query):
+        filters, columns, order, limit, offset = parse_query(query)
+        with self.lock:
+            rows = [row for row in self.tables[table]
+                    if all(test(_text(row.get(column))) for column, test in filters)]
+        for column, descending in reversed(order):
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column) or ""), reverse=descending)
+        rows = rows[offset:None if limit is None else offset + limit]
+        if columns is not None:
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+        return rows
+
+    def insert(self, table, rows):
+        now = _timestamp()
+        stored = []
+        with self.lock:
+            for row in rows if isinstance(rows, list) else [rows]:
+                row = dict(row)
+                row.setdefault("id", str(uuid.uuid4()))
+                row.setdefault("created_at", now)
+                self.tables[table].append(row)
+                stored.append(dict(row))
+        return stored
+
+    def update(self, table, query, values):
+        filters = parse_query(query)[0]
+        changed = []
+        with self.lock:
+            for row in self.tables[table]:
+                if all(test(_text(row.get(column))) for column, test in filters):
+                    row.update(values)
+                    changed.append(dict(row))
+        return changed
+
+    def delete(self, table, query):
+        filters = parse_query(query)[0]
+        with self.lock:
+            kept, deleted = [], []
+            for row in self.tables[table]:
+                matches = all(test(_text(row.get(column))) for column, test in filters)
+                (deleted if matches else kept).append(row)
+            self.tables[table] = kept
+        return deleted
+
+
+class StandinHandler(serving.KeepAliveHandlerMixin, http.server.BaseHTTPRequestHandler):
+    standin = None
+
+    def setup(self):
+        super().setup()
+        if not self.requests_served:
+            with self.standin.lock:
+                self.standin.connections += 1
+
+    def do_GET(self):
+        self._serve("GET")
+
+    def do_POST(self):
+        self._serve("POST")
+
+    def do_PATCH(self):
+        self._serve("PATCH")
+
+    def do_DELETE(self):
+        self._serve("DELETE")
+
+    def _serve(self, method):
+        standin = self.standin
+        with standin.lock:
+            standin.requests += 1
+        parts = urlsplit(self.path)
+        if parts.path == "/_standin/stats":
+            self._send_json(HTTPStatus.OK, {"requests": standin.requests, "connections": standin.connections})
+            return
+        if standin.latency:
+            time.sleep(standin.latency)
+        if standin.key is not None and self.headers.get("apikey") != standin.key:
+            self._send_json(HTTPStatus.UNAUTHORIZED, {"message": "Invalid API key"})
+            return
+        table = parts.path[len("/rest/v1/"):] if parts.path.startswith("/rest/v1/") else None
+        if table not in standin.tables:
+            self._send_json(HTTPStatus.NOT_FOUND,
+                            {"code": "42P01", "message": f'relation "public.{table}" does not exist'})
+            return
+        try:
+            body = None
+            length = int(self.headers.get("Content-Length", 0))
+            if length:
+                body = json.loads(self.rfile.read(length))
+            if method == "GET":
+                status, rows = HTTPStatus.OK, standin.select(table, parts.query)
+            elif method == "POST":
+                status, rows = HTTPStatus.CREATED, standin.insert(table, body)
+            elif method == "PATCH":
+                status, rows = HTTPStatus.OK, standin.update(table, parts.query, body)
+            else:
+                status, rows = HTTPStatus.OK, standin.delete(table, parts.query)
+        except (ValueError, TypeError, AttributeError) as error:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"code": "PGRST100", "message": str(error)})
+            return
+        if method != "GET" and "return=representation" not in self.headers.get("Prefer", ""):
+            self.send_response(HTTPStatus.NO_CONTENT if method != "POST" else HTTPStatus.CREATED)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send_json(status, rows)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--messages", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=0.0, help="milliseconds added to every request")
+    parser.add_argument("--key", help="apikey header to require")
+    parser.add_argument("--threads", type=int, default=serving.DEFAULT_THREADS)
+    args = parser.parse_args()
+
+    StandinHandler.standin = Standin(seed(args.users, args.messages), args.latency / 1000, args.key)
+    with serving.make_server(("127.0.0.1", args.port), StandinHandler, engine="thread",
+                             threads=args.threads) as httpd:
+        print(f"PostgREST stand-in at http://127.0.0.1:{args.port} ({args.users:,} users, "
+              f"{args.messages:,} messages)", flush=True)
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# Soak test for /api/users/stream: opens many local SSE subscribers against
+# user_api.py, toggles a user repeatedly and measures how long each presence
+# event takes to reach every subscriber. Also reports the server's thread
+# count and RSS to show idle subscribers do not cost a thread each.
+#
+#   python bench/soak_sse.py --subscribers 10000 --events 20
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import httpbench  # noqa: E402
+
+CONNECT_BATCH = 500
+
+
+def _process_stats(pid):
+    stats = {}
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            name, _, value = line.partition(":")
+            if name in ("Threads", "VmRSS"):
+                stats[name] = value.strip()
+    return stats
+
+
+class Subscriber:
+    def __init__(self, received):
+        self.received = received
+        self.ready = asyncio.Event()
+        self.task = None
+
+    async def run(self, port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(httpbench.build_request("GET", "/api/users/stream"))
+        await reader.readuntil(b"\r\n\r\n")
+        try:
+            while True:
+                block = await reader.readuntil(b"\n\n")
+                now = time.perf_counter()
+                event_id = None
+                for line in block.split(b"\n"):
+                    if line.startswith(b"id: "):
+                        event_id = int(line[4:])
+                    elif line == b"event: snapshot":
+                        self.ready.set()
+                if event_id is not None:
+                    self.received.setdefault(event_id, []).append(now)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _toggle(port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(httpbench.build_request("GET", "/api/toggle-status?user_id=user1"))
+    await httpbench.read_response(reader)
+    writer.close()
+
+
+async def _soak(port, pid, subscriber_count, events, timeout):
+    received = {}
+    subscribers = []
+    start = time.perf_counter()
+    for offset in range(0, subscriber_count, CONNECT_BATCH):
+        batch = [Subscriber(received) for _ in range(min(CONNECT_BATCH, subscriber_count - offset))]
+        for subscriber in batch:
+            subscriber.task = asyncio.ensure_future(subscriber.run(port))
+        await asyncio.wait_for(asyncio.gather(*(s.ready.wait() for s in batch)), timeout)
+        subscribers.extend(batch)
+    connect_seconds = time.perf_counter() - start
+    idle_stats = _process_stats(pid)
+
+    version = max(received)
+    latencies = []
+    spreads = []
+    for _ in range(events):
+        version += 1
+        sent = time.perf_counter()
+        await _toggle(port)
+        deadline = time.monotonic() + timeout
+        while len(received.get(version, ())) < subscriber_count and time.monotonic() < deadline:
+            await asyncio.sleep(0.001)
+        arrivals = received.get(version, [])
+        latencies.extend(arrival - sent for arrival in arrivals)
+        if arrivals:
+            spreads.append(max(arrivals) - sent)
+
+    for subscriber in subscribers:
+        subscriber.task.cancel()
+    latencies.sort()
+    delivered = len(latencies)
+    return {
+        "subscribers": subscriber_count,
+        "events": events,
+        "delivered": delivered,
+        "expected": subscriber_count * events,
+        "connect_seconds": round(connect_seconds, 2),
+        "fanout_p50_ms": round(httpbench.percentile(latencies, 0.50) * 1000, 2),
+        "fanout_p99_ms": round(httpbench.percentile(latencies, 0.99) * 1000, 2),
+        "fanout_max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+        "all_delivered_mean_ms": round(sum(spreads) / len(spreads) * 1000, 2) if spreads else None,
+        "server_threads_idle": idle_stats.get("Threads"),
+        "server_rss_idle": idle_stats.get("VmRSS"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--engine", default="asyncio")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    httpbench.raise_fd_limit(args.subscribers + 1024)
+    port = httpbench.free_port()
+    process = httpbench.start_server("user_api.py", port, "--engine", args.engine)
+    try:
+        result = asyncio.run(_soak(port, process.pid, args.subscribers, args.events, args.timeout))
+    finally:
+        httpbench.stop_server(process)
+    result["engine"] = args.engine
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
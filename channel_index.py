@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# In-memory per-channel index over the message log.
+#
+# Each channel keeps two parallel arrays sorted by (created_at, log offset):
+# creation times in microseconds and the offsets of the messages in the log.
+# A page of history is a binary search for the cursor plus a slice, so its
+# cost does not depend on how long the channel's history is.
+import base64
+import bisect
+import threading
+from array import array
+from datetime import datetime
+
+DEFAULT_CHANNEL = "general"
+
+
+def timestamp_micros(created_at):
+    # "2025-04-01T14:22:00Z" -> microseconds since the epoch
+    moment = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    return int(moment.timestamp()) * 1_000_000 + moment.microsecond
+
+
+def encode_cursor(created_at_us, offset):
+    return base64.urlsafe_b64encode(f"{created_at_us}:{offset}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    # Raises ValueError for anything that is not a cursor we handed out
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        created_at_us, offset = base64.urlsafe_b64decode(padded.encode()).decode().split(":")
+        return int(created_at_us), int(offset)
+    except (UnicodeDecodeError, ValueError, TypeError) as error:
+        raise ValueError(f"invalid cursor: {cursor!r}") from error
+
+
+class _Channel:
+    __slots__ = ("times", "offsets")
+
+    def __init__(self):
+        self.times = array("q")
+        self.offsets = array("q")
+
+    def position(self, created_at_us, offset):
+        # Number of entries ordered before (created_at_us, offset)
+        times, offsets = self.times, self.offsets
+        low = bisect.bisect_left(times, created_at_us)
+        high = bisect.bisect_right(times, created_at_us, low)
+        # Ties on the timestamp are ordered by log offset
+        return low + bisect.bisect_left(offsets[low:high], offset) if high > low else low
+
+    def add(self, created_at_us, offset):
+        times = self.times
+        if not times or (created_at_us, offset) > (times[-1], self.offsets[-1]):
+            times.append(created_at_us)
+            self.offsets.append(offset)
+            return
+        # Late arrival: keep the arrays sorted
+        position = self.position(created_at_us, offset)
+        times.insert(position, created_at_us)
+        self.offsets.insert(position, offset)
+
+
+class ChannelIndex:
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def add(self, channel_id, created_at_us, offset):
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                channel = self._channels[channel_id] = _Channel()
+            channel.add(created_at_us, offset)
+
+    def add_message(self, offset, message):
+        self.add(message.get("channel_id", DEFAULT_CHANNEL), timestamp_micros(message["created_at"]), offset)
+
+    def channels(self):
+        with self._lock:
+            return {channel_id: len(channel.times) for channel_id, channel in self._channels.items()}
+
+    def page(self, channel_id, before=None, limit=50):
+        # Returns (offsets oldest first, next cursor or None) for the `limit`
+        # entries ordered before the `before` cursor (or the newest entries)
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                return [], None
+            end = len(channel.times) if before is None else channel.position(*decode_cursor(before))
+            start = max(end - limit, 0)
+            offsets = channel.offsets[start:end].tolist()
+            next_cursor = encode_cursor(channel.times[start], channel.offsets[start]) if start > 0 and offsets else None
+        return offsets, next_cursor
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# Pre-fork mode for server.py and user_api.py (--workers N).
+#
+# The supervisor process forks an owner process and N workers, then only
+# waits, restarting any of them that exits. Each worker runs a normal serving
+# engine on its own listening socket bound with SO_REUSEPORT, so the kernel
+# spreads new connections across the workers.
+#
+# State that must exist once (the presence store, the message log writer)
+# lives in the owner. Workers call its operations over a Unix socket and keep
+# read replicas fed by it: every change is published on a named feed with a
+# version, sent to every worker in order, and the version is also written to
+# memory shared by all the processes. A worker receives the changes a call
+# made before the call's reply, and a read first waits until the worker's
+# replica has reached the version in shared memory, so no worker serves
+# anything older than the latest change made anywhere when the read started.
+#
+# The supervisor never starts a thread, so forking from it is safe; owner and
+# workers are forked with the modules already imported.
+import itertools
+import json
+import mmap
+import os
+import queue
+import shutil
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Seconds a read waits for its worker's replica to catch up, and a call for
+# its reply, before giving up with OwnerUnavailable
+SYNC_TIMEOUT = 5.0
+CALL_TIMEOUT = 30.0
+# Seconds to wait for the owner to start listening
+OWNER_START_TIMEOUT = 30.0
+# Restart delay for a process that exits soon after it started, doubled on
+# every quick exit in a row
+RESTART_DELAY = 0.1
+MAX_RESTART_DELAY = 5.0
+# A process that ran this long is restarted at once
+STABLE_SECONDS = 5.0
+# Threads in the owner running operations, so a long one (a big presence
+# batch) does not hold up the worker's other calls
+OWNER_THREADS = 8
+
+_VERSION = struct.Struct("<q")
+# Exceptions that keep their type when an operation raises them in the owner
+_REMOTE_ERRORS = {error.__name__: error for error in (ValueError, KeyError, TypeError)}
+
+
+class OwnerUnavailable(ConnectionError):
+    pass
+
+
+class _Stop(Exception):
+    pass
+
+
+class Cluster:
+    # Created before run(), so every process has the same feeds and shared
+    # memory. In the owner, serve() and publish() are used; in workers,
+    # connect(), call() and sync().
+
+    def __init__(self, workers, feeds):
+        self.workers = workers
+        self._feeds = {name: slot for slot, name in enumerate(feeds)}
+        # Latest published version per feed; only the owner writes it
+        self._versions = mmap.mmap(-1, max(len(feeds), 1) * _VERSION.size)
+        self._directory = tempfile.mkdtemp(prefix="cluster-")
+        self.address = os.path.join(self._directory, "owner.sock")
+        self._supervisor = os.getpid()
+        # Owner side
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._snapshots = {}
+        # Worker side: number from 0 to workers - 1, kept across restarts
+        self.worker_number = None
+        self._client = None
+
+    def version(self, feed):
+        # Latest version published on `feed`, by this owner or a previous one
+        return _VERSION.unpack_from(self._versions, self._feeds[feed] * _VERSION.size)[0]
+
+    # Supervisor
+
+    def run(self, owner, worker):
+        # Forks owner() and, once it listens, `workers` copies of worker();
+        # both should run until the process is terminated. Returns on
+        # SIGINT/SIGTERM after stopping them.
+        processes = {}
+
+        def stop(signum, frame):
+            # Raised rather than flagged: waitpid() is retried after signals
+            raise _Stop
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        try:
+            pid = self._fork(owner)
+            processes[pid] = ("owner", None, time.monotonic(), RESTART_DELAY)
+            self._wait_for_owner(pid)
+            for number in range(self.workers):
+                pid = self._fork(worker, number)
+                processes[pid] = (f"worker {number}", number, time.monotonic(), RESTART_DELAY)
+            while True:
+                pid, status = os.waitpid(-1, 0)
+                if pid not in processes:
+                    continue
+                name, number, started, delay = processes.pop(pid)
+                print(f"cluster: {name} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, "
+                      "restarting", file=sys.stderr, flush=True)
+                if time.monotonic() - started < STABLE_SECONDS:
+                    time.sleep(delay)
+                    delay = min(delay * 2, MAX_RESTART_DELAY)
+                else:
+                    delay = RESTART_DELAY
+                pid = self._fork(owner) if number is None else self._fork(worker, number)
+                processes[pid] = (name, number, time.monotonic(), delay)
+        except _Stop:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            for pid in processes:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            for pid in processes:
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+    def _fork(self, target, number=None):
+        pid = os.fork()
+        if pid:
+            return pid
+        code = 0
+        self.worker_number = number
+        try:
+            # Ctrl+C reaches the whole process group, but only the supervisor
+            # decides when to stop
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            threading.Thread(target=self._watch_supervisor, name="cluster-watchdog", daemon=True).start()
+            target()
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _watch_supervisor(self):
+        # Exits this process if the supervisor died without stopping it
+        while os.getppid() == self._supervisor:
+            time.sleep(1)
+        os._exit(1)
+
+    def _wait_for_owner(self, pid):
+        deadline = time.monotonic() + OWNER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if os.waitpid(pid, os.WNOHANG)[0]:
+                raise RuntimeError("cluster owner process exited during startup")
+            try:
+                with socket.socket(socket.AF_UNIX) as sock:
+                    sock.connect(self.address)
+                return
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError("cluster owner process did not start")
+
+    # Owner
+
+    def serve(self, operations, snapshots):
+        # Runs in the owner process until it is terminated. `operations` maps
+        # names to callables taking JSON-compatible arguments. `snapshots`
+        # maps each feed to (lock, snapshot): snapshot() returns (version,
+        # data) for the current state and is called, for each connecting
+        # worker, with `lock` held, the lock its publish() calls are made
+        # under, so the worker misses no event and gets none twice.
+        self._snapshots = snapshots
+        executor = ThreadPoolExecutor(max_workers=OWNER_THREADS, thread_name_prefix="cluster-owner")
+        cluster = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                connection = _OwnerConnection(self.request)
+                try:
+                    cluster._attach(connection)
+                    for line in self.request.makefile("rb"):
+                        request = json.loads(line)
+                        executor.submit(cluster._run, connection, operations, request)
+                except OSError:
+                    # The worker exited; the supervisor restarts it
+                    pass
+                finally:
+                    with cluster._lock:
+                        cluster._connections.discard(connection)
+                    connection.close()
+
+        # Bound under another name and renamed, so the socket appears at once,
+        # with the owner ready, and replaces the one of a previous owner
+        address = f"{self.address}.{os.getpid()}"
+        server = socketserver.ThreadingUnixStreamServer(address, Handler)
+        server.daemon_threads = True
+        os.replace(address, self.address)
+        server.serve_forever()
+
+    def _attach(self, connection):
+        with self._lock:
+            self._connections.add(connection)
+        for feed, (lock, snapshot) in self._snapshots.items():
+            with lock, self._lock:
+                version, data = snapshot()
+                self._set_version(feed, max(version, self.version(feed)))
+                connection.send({"feed": feed, "version": version, "data": data, "snapshot": True})
+                connection.feeds.add(feed)
+
+    def _run(self, connection, operations, request):
+        try:
+            reply = {"id": request["id"], "result": operations[request["op"]](*request["args"])}
+        except Exception as error:
+            name = type(error).__name__
+            reply = {"id": request["id"], "error": name if name in _REMOTE_ERRORS else "RuntimeError",
+                     "message": str(error)}
+        connection.send(reply)
+
+    def publish(self, feed, version, data):
+        # Sends one change to every worker. Versions must not go down; call
+        # with the feed's snapshot lock held so changes go out in order.
+        with self._lock:
+            self._set_version(feed, version)
+            event = {"feed": feed, "version": version, "data": data}
+            for connection in self._connections:
+                if feed in connection.feeds:
+                    connection.send(event)
+
+    def _set_version(self, feed, version):
+        _VERSION.pack_into(self._versions, self._feeds[feed] * _VERSION.size, version)
+
+    # Worker
+
+    def connect(self, handlers):
+        # Starts receiving the feeds; handlers[feed](version, data, snapshot)
+        # runs on one background thread, in order. A snapshot replaces the
+        # replica's state, anything else is one change.
+        self._client = _Client(self, handlers)
+        self._client.start()
+
+    def call(self, op, *args):
+        # Runs an operation in the owner and returns its result; by then the
+        # changes it published are in this worker's replicas
+        return self._client.call(op, args)
+
+    def sync(self, feed):
+        # Waits until this worker's replica of `feed` has every change
+        # published before the call
+        self._client.sync(feed, self.version(feed))
+
+
+class _OwnerConnection:
+    # A worker's connection in the owner. Replies and feed events are queued
+    # and written by one thread, so publishing never blocks on a slow worker
+    # and a reply always follows the events its operation published.
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._queue = queue.SimpleQueue()
+        self.feeds = set()
+        threading.Thread(target=self._write_loop, name="cluster-writer", daemon=True).start()
+
+    def send(self, message):
+        self._queue.put(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+    def close(self):
+        self._queue.put(None)
+
+    def _write_loop(self):
+        while True:
+            lines = [self._queue.get()]
+            # Write whatever else is already queued in the same call
+            while len(lines) < 1024:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            closing = None in lines
+            try:
+                self._sock.sendall(b"".join(line for line in lines if line is not None))
+            except OSError:
+                closing = True
+            if closing:
+                return
+
+
+class _Client:
+    # A worker's connection to the owner, reconnecting when the owner is
+    # restarted; a new owner sends fresh snapshots of every feed
+
+    def __init__(self, cluster, handlers):
+        self._cluster = cluster
+        self._handlers = handlers
+        self._ids = itertools.count()
+        self._pending = {}
+        self._send_lock = threading.Lock()
+        self._sock = None
+        # Version of each feed applied to the replica; None until a snapshot
+        # from the current owner has been applied
+        self._applied = dict.fromkeys(handlers)
+        self._changed = threading.Condition()
+
+    def start(self):
+        threading.Thread(target=self._run, name="cluster-client", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                sock = socket.socket(socket.AF_UNIX)
+                sock.connect(self._cluster.address)
+            except OSError:
+                sock.close()
+                time.sleep(0.05)
+                continue
+            with self._send_lock:
+                self._sock = sock
+            try:
+                for line in sock.makefile("rb"):
+                    self._received(json.loads(line))
+            except OSError:
+                pass
+            except Exception:
+                # A bad line or a failing feed handler: the replica may have
+                # missed a change, so drop the connection and start over from
+                # the snapshots a new one brings
+                print("cluster: dropping the owner connection after an error", file=sys.stderr, flush=True)
+                traceback.print_exc()
+            finally:
+                with self._send_lock:
+                    self._sock = None
+                sock.close()
+                with self._changed:
+                    self._applied = dict.fromkeys(self._handlers)
+                    pending, self._pending = self._pending, {}
+                for future in pending.values():
+                    future.set_exception(OwnerUnavailable("cluster owner connection lost"))
+
+    def _received(self, message):
+        if "feed" in message:
+            feed = message["feed"]
+            self._handlers[feed](message["version"], message["data"], message.get("snapshot", False))
+            with self._changed:
+                self._applied[feed] = message["version"]
+                self._changed.notify_all()
+            return
+        with self._changed:
+            future = self._pending.pop(message["id"], None)
+        if future is None:
+            return
+        if "error" in message:
+            future.set_exception(_REMOTE_ERRORS.get(message["error"], RuntimeError)(message["message"]))
+        else:
+            future.set_result(message["result"])
+
+    def call(self, op, args):
+        future = Future()
+        request_id = next(self._ids)
+        line = json.dumps({"id": request_id, "op": op, "args": args}, separators=(",", ":")).encode() + b"\n"
+        with self._send_lock:
+            if self._sock is None:
+                raise OwnerUnavailable("cluster owner is not connected")
+            with self._changed:
+                self._pending[request_id] = future
+            try:
+                self._sock.sendall(line)
+            except OSError as error:
+                with self._changed:
+                    self._pending.pop(request_id, None)
+                raise OwnerUnavailable("cluster owner connection lost") from error
+        try:
+            return future.result(CALL_TIMEOUT)
+        except TimeoutError:
+            raise OwnerUnavailable(f"cluster owner did not answer {op} in time") from None
+        finally:
+            # Gone already if answered; a late answer then finds nothing
+            with self._changed:
+                self._pending.pop(request_id, None)
+
+    def sync(self, feed, version):
+        def caught_up():
+            applied = self._applied[feed]
+            return applied is not None and applied >= version
+
+        if caught_up():
+            return
+        with self._changed:
+            if not self._changed.wait_for(caught_up, SYNC_TIMEOUT):
+                raise OwnerUnavailable(f"replica of {feed} is behind the cluster owner")
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# Live diagnostics for server.py and user_api.py: GET /debug/profile and
+# GET /debug/heap.
+#
+# Both are off unless DEBUG_TOKEN is set in the environment, and then answer
+# only requests carrying it in an X-Debug-Token header; otherwise they are
+# 404s like any unknown path. With --workers, each process profiles itself.
+#
+# /debug/profile?seconds=N samples the stack of every other thread every
+# SAMPLE_INTERVAL seconds (wall clock, so time spent blocked shows up too)
+# and returns the top functions and the collapsed stacks. Sampling reads
+# frames with sys._current_frames() from the requesting handler's thread;
+# nothing is traced, so the other threads run at full speed. Threads parked
+# in a known idle wait are left out unless idle=1. With format=collapsed the
+# body is only the stacks, one "frame;frame;... count" line each, as
+# flamegraph.pl and speedscope read them. The handler serving the request is
+# busy while it samples, which stalls the single engine.
+#
+# /debug/heap starts tracemalloc on the first call and then reports the
+# allocations that grew most since the previous call (group=lineno,
+# filename or traceback). Tracing slows allocation down;
+# /debug/heap?stop=1 turns it off again.
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlparse
+
+DEBUG_TOKEN = os.environ.get("DEBUG_TOKEN")
+SAMPLE_INTERVAL = 0.005
+DEFAULT_PROFILE_SECONDS = 5
+MAX_PROFILE_SECONDS = 60
+DEFAULT_TOP = 25
+MAX_TOP = 500
+# Frames kept per allocation by tracemalloc
+HEAP_FRAMES = 10
+HEAP_GROUPS = ("lineno", "filename", "traceback")
+# Leaf frames (file, function) of threads waiting for work or sleeping
+IDLE_FRAMES = frozenset((
+    ("presence.py", "_expiry_loop"),
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("socket.py", "readinto"),
+    ("socket.py", "accept"),
+    ("thread.py", "_worker"),
+    ("socketserver.py", "serve_forever"),
+))
+
+# One profile at a time: two would sample each other
+_profile_lock = threading.Lock()
+_heap_lock = threading.Lock()
+_heap_snapshot = None
+_heap_started = None
+
+
+def _frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def profile(seconds, interval=SAMPLE_INTERVAL, include_idle=False, top=DEFAULT_TOP):
+    # Samples every thread but the caller's for `seconds`
+    me = threading.get_ident()
+    stacks = {}
+    threads = set()
+    samples = 0
+    # Frame names are cached per code object: most samples repeat the same stacks
+    names = {}
+    deadline = time.monotonic() + seconds
+    while True:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            leaf = codes[0]
+            if not include_idle and (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+                continue
+            stack = []
+            for code in reversed(codes):
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = _frame_name(code)
+                stack.append(name)
+            stack = tuple(stack)
+            stacks[stack] = stacks.get(stack, 0) + 1
+            threads.add(ident)
+            samples += 1
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(interval, remaining))
+
+    own = {}
+    total = {}
+    for stack, count in stacks.items():
+        own[stack[-1]] = own.get(stack[-1], 0) + count
+        # A recursive function counts once per sample
+        for name in set(stack):
+            total[name] = total.get(name, 0) + count
+    ranked = sorted(total, key=lambda name: (-own.get(name, 0), -total[name], name))[:top]
+    return {
+        "seconds": seconds,
+        "interval": interval,
+        "samples": samples,
+        "threads": len(threads),
+        "top": [{"function": name, "self": own.get(name, 0), "total": total[name],
+                 "self_percent": round(100 * own.get(name, 0) / samples, 2) if samples else 0.0}
+                for name in ranked],
+        "collapsed": [f"{';'.join(stack)} {count}"
+                      for stack, count in sorted(stacks.items(), key=lambda item: -item[1])],
+    }
+
+
+def heap(group="lineno", top=DEFAULT_TOP):
+    # Growth since the previous call; the first call only starts tracing
+    global _heap_snapshot, _heap_started
+    with _heap_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(HEAP_FRAMES)
+            _heap_snapshot = None
+            _heap_started = time.time()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            # Our own snapshot filtering allocates too
+            tracemalloc.Filter(False, tracemalloc.__file__, all_frames=True),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        previous, _heap_snapshot = _heap_snapshot, snapshot
+    current, peak = tracemalloc.get_traced_memory()
+    result = {
+        "tracing_since": _heap_started,
+        "traced_bytes": current,
+        "peak_bytes": peak,
+        "baseline": previous is None,
+        "top": [],
+    }
+    if previous is None:
+        return result
+    for stat in snapshot.compare_to(previous, group)[:top]:
+        # Oldest frame first, as Python prints tracebacks
+        frames = [f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in stat.traceback]
+        result["top"].append({
+            "where": frames if group == "traceback" else frames[-1],
+            "size_diff": stat.size_diff,
+            "size": stat.size,
+            "count_diff": stat.count_diff,
+            "count": stat.count,
+        })
+    return result
+
+
+def stop_heap():
+    global _heap_snapshot, _heap_started
+    with _heap_lock:
+        tracemalloc.stop()
+        _heap_snapshot = _heap_started = None
+
+
+def _send(handler, status, body, content_type="application/json"):
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+    handler.send_response(status)
+    handler.send_header("Content-Type", content_type)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.send_header("Cache-Control", "no-store")
+    handler.end_headers()
+    if handler.command != "HEAD":
+        handler.wfile.write(body)
+
+
+def _number(query, name, default, low, high, kind=int):
+    value = kind(query.get(name, [default])[0])
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def handle(handler):
+    # Serves GET /debug/... on `handler`
+    if DEBUG_TOKEN is None:
+        _send(handler, HTTPStatus.NOT_FOUND, {"error": "Not found"})
+        return
+    if not hmac.compare_digest(handler.headers.get("X-Debug-Token", "").encode(), DEBUG_TOKEN.encode()):
+        _send(handler, HTTPStatus.FORBIDDEN, {"error": "X-Debug-Token is missing or wrong"})
+        return
+    parsed_url = urlparse(handler.path)
+    query = parse_qs(parsed_url.query)
+    try:
+        top = _number(query, "top", DEFAULT_TOP, 1, MAX_TOP)
+        if parsed_url.path == "/debug/profile":
+            seconds = _number(query, "seconds", DEFAULT_PROFILE_SECONDS, 0.01, MAX_PROFILE_SECONDS, float)
+            include_idle = query.get("idle", ["0"])[0] == "1"
+            collapsed = query.get("format", [""])[0] == "collapsed"
+        elif parsed_url.path == "/debug/heap":
+            group = query.get("group", ["lineno"])[0]
+            if group not in HEAP_GROUPS:
+                raise ValueError(f"group must be one of {', '.join(HEAP_GROUPS)}")
+        else:
+            _send(handler, HTTPStatus.NOT_FOUND, {"error": "Not found"})
+            return
+    except ValueError as error:
+        _send(handler, HTTPStatus.BAD_REQUEST, {"error": str(error)})
+        return
+
+    if parsed_url.path == "/debug/heap":
+        if query.get("stop", ["0"])[0] == "1":
+            stop_heap()
+            _send(handler, HTTPStatus.OK, {"tracing": False})
+        else:
+            _send(handler, HTTPStatus.OK, heap(group, top))
+        return
+
+    if not _profile_lock.acquire(blocking=False):
+        _send(handler, HTTPStatus.CONFLICT, {"error": "a profile is already running"})
+        return
+    try:
+        result = profile(seconds, include_idle=include_idle, top=top)
+    finally:
+        _profile_lock.release()
+    if collapsed:
+        _send(handler, HTTPStatus.OK, "".join(line + "\n" for line in result["collapsed"]).encode(),
+              "text/plain; charset=utf-8")
+    else:
+        _send(handler, HTTPStatus.OK, result)
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# Append-only, segmented on-disk log of chat messages.
+#
+# Layout of a log directory:
+#   <base offset>.log  records: <u32 length><u32 crc32><JSON payload>
+#   <base offset>.idx  one <u64 file position> per record in the segment
+# Offsets are dense and start at 0. When the active segment passes
+# segment_bytes a new one is started; older segments are never written again
+# and are read through mmap.
+#
+# append()/append_batch() return once the records are durable. Writers that
+# arrive while an fsync is in flight are committed together by the next one
+# (group commit), so the fsync cost is shared by every concurrent writer.
+#
+# On open only the last segment is checked: records are re-read and their
+# checksums verified, a torn tail left by a crash is truncated and the index
+# is rebuilt from what survived.
+#
+# Other processes can open the same directory read-only while one process
+# writes to it, and call refresh() as the writer reports new records.
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+
+SEGMENT_BYTES = 64 * 1024 * 1024
+RECORD_HEADER = struct.Struct("<II")
+INDEX_ENTRY = struct.Struct("<Q")
+_SUFFIX = ".log"
+_INDEX_SUFFIX = ".idx"
+
+
+class CorruptRecordError(Exception):
+    pass
+
+
+def _segment_name(base_offset):
+    return f"{base_offset:020d}"
+
+
+def encode_record(payload):
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def iter_segment_records(path):
+    # Yields (file position, payload) for every intact record of a segment
+    # file, stopping at the first torn or corrupt one
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        position = 0
+        while position + RECORD_HEADER.size <= size:
+            length, checksum = RECORD_HEADER.unpack_from(data, position)
+            start = position + RECORD_HEADER.size
+            end = start + length
+            if end > size:
+                return
+            payload = data[start:end]
+            if zlib.crc32(payload) != checksum:
+                return
+            yield position, payload
+            position = end
+
+
+def list_segments(directory):
+    # Base offsets of the segments in a log directory, oldest first
+    bases = []
+    for name in os.listdir(directory):
+        if name.endswith(_SUFFIX) and name[:-len(_SUFFIX)].isdigit():
+            bases.append(int(name[:-len(_SUFFIX)]))
+    return sorted(bases)
+
+
+def segment_path(directory, base_offset):
+    return os.path.join(directory, _segment_name(base_offset) + _SUFFIX)
+
+
+class _Segment:
+    def __init__(self, directory, base_offset):
+        self.base_offset = base_offset
+        self.path = segment_path(directory, base_offset)
+        self.index_path = os.path.join(directory, _segment_name(base_offset) + _INDEX_SUFFIX)
+        self.positions = array("Q")
+        self._data = None
+        self._data_length = 0
+        self._map_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def load_index(self):
+        # Reads the entries past those already loaded; a writer may be
+        # halfway through one, so only whole entries are taken
+        with open(self.index_path, "rb") as index:
+            index.seek(len(self.positions) * INDEX_ENTRY.size)
+            data = index.read()
+        self.positions.frombytes(data[:len(data) - len(data) % INDEX_ENTRY.size])
+
+    def recover(self):
+        # Rebuild the index from intact records and cut anything after them
+        end = 0
+        self.positions = array("Q")
+        for position, payload in iter_segment_records(self.path):
+            self.positions.append(position)
+            end = position + RECORD_HEADER.size + len(payload)
+        with open(self.path, "r+b") as file:
+            file.truncate(end)
+            os.fsync(file.fileno())
+        with open(self.index_path, "wb") as index:
+            index.write(self.positions.tobytes())
+            os.fsync(index.fileno())
+        return end
+
+    def _mapping(self, needed):
+        # The active segment grows, so map it again when a read goes past the
+        # end of the current mapping. Caller holds _map_lock, which it keeps
+        # while using the mapping: a remap closes the old one.
+        if self._data is None or self._data_length < needed:
+            if self._data is not None:
+                self._data.close()
+            with open(self.path, "rb") as file:
+                self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._data_length = len(self._data)
+        return self._data
+
+    def read(self, index):
+        position = self.positions[index]
+        start = position + RECORD_HEADER.size
+        with self._map_lock:
+            length, checksum = RECORD_HEADER.unpack_from(self._mapping(start), position)
+            payload = self._mapping(start + length)[start:start + length]
+        if zlib.crc32(payload) != checksum:
+            raise CorruptRecordError(f"checksum mismatch in {self.path} at {position}")
+        return payload
+
+    def close(self):
+        with self._map_lock:
+            if self._data is not None:
+                self._data.close()
+                self._data = None
+
+
+class MessageLog:
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, fsync=True, readonly=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._segments = []
+        self._bases = []
+        if readonly:
+            # Nothing is checked or truncated: the writer owns the files.
+            # Records become readable through refresh().
+            self._visible = 0
+            return
+        os.makedirs(directory, exist_ok=True)
+        for base in list_segments(directory):
+            segment = _Segment(directory, base)
+            self._segments.append(segment)
+            self._bases.append(base)
+        for segment in self._segments[:-1]:
+            segment.load_index()
+        if self._segments:
+            active = self._segments[-1]
+            size = active.recover()
+        else:
+            active = self._add_segment(0)
+            size = 0
+
+        self._file = open(active.path, "ab")
+        self._index_file = open(active.index_path, "ab")
+        self._size = size
+        self._next_offset = active.base_offset + len(active)
+        # Records below _visible are flushed to the OS and may be read;
+        # records below _durable have also been fsynced
+        self._visible = self._next_offset
+        self._durable = self._next_offset
+        self._syncing = False
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="message-log-flusher", daemon=True)
+        self._flusher.start()
+
+    def __len__(self):
+        return self._visible
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _add_segment(self, base):
+        segment = _Segment(self.directory, base)
+        open(segment.path, "ab").close()
+        open(segment.index_path, "ab").close()
+        self._segments.append(segment)
+        self._bases.append(base)
+        return segment
+
+    def refresh(self, count):
+        # Read-only logs: makes the first `count` records readable; the caller
+        # knows from the writer that they have been written. Returns len(self).
+        with self._cond:
+            known = set(self._bases)
+            # The last known segment may have grown; new ones are read whole
+            stale = self._segments[-1:]
+            for base in list_segments(self.directory):
+                if base not in known and base < count:
+                    segment = _Segment(self.directory, base)
+                    # Appended before its base, so _locate() never finds a
+                    # base without a segment
+                    self._segments.append(segment)
+                    self._bases.append(base)
+                    stale.append(segment)
+            for segment in stale:
+                segment.load_index()
+                # Entries past `count` may be only partly written, and a writer
+                # restarted after a crash may rewrite them: read them again
+                # next time
+                del segment.positions[max(count - segment.base_offset, 0):]
+            if self._segments:
+                active = self._segments[-1]
+                self._visible = max(self._visible, min(count, active.base_offset + len(active)))
+            return self._visible
+
+    def append(self, record):
+        return self.append_batch([record])
+
+    def append_batch(self, records):
+        # Returns the offset of the first record once all of them are durable
+        if self.readonly:
+            raise ValueError("message log is read-only")
+        payloads = [json.dumps(record, separators=(",", ":")).encode() for record in records]
+        with self._cond:
+            if self._closed:
+                raise ValueError("message log is closed")
+            first = self._next_offset
+            for payload in payloads:
+                if self._size >= self.segment_bytes:
+                    self._roll()
+                active = self._segments[-1]
+                self._file.write(encode_record(payload))
+                self._index_file.write(INDEX_ENTRY.pack(self._size))
+                active.positions.append(self._size)
+                self._size += RECORD_HEADER.size + len(payload)
+                self._next_offset += 1
+            target = self._next_offset
+            self._cond.notify_all()
+            while self._durable < target and not self._closed:
+                self._cond.wait()
+        return first
+
+    def _roll(self):
+        # Caller holds the lock. Wait for an in-flight fsync of this segment.
+        while self._syncing:
+            self._cond.wait()
+        self._sync_locked()
+        self._file.close()
+        self._index_file.close()
+        active = self._add_segment(self._next_offset)
+        self._file = open(active.path, "ab")
+        self._index_file = open(active.index_path, "ab")
+        self._size = 0
+
+    def _sync_locked(self):
+        self._file.flush()
+        self._index_file.flush()
+        if self.fsync:
+            os.fdatasync(self._file.fileno())
+            os.fdatasync(self._index_file.fileno())
+        self._visible = self._durable = self._next_offset
+        self._cond.notify_all()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while self._durable == self._next_offset and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                target = self._next_offset
+                self._file.flush()
+                self._index_file.flush()
+                self._visible = target
+                if not self.fsync:
+                    self._durable = target
+                    self._cond.notify_all()
+                    continue
+                self._syncing = True
+                data_fd, index_fd = self._file.fileno(), self._index_file.fileno()
+            # Writers keep appending to the buffer while we wait on the disk;
+            # they are committed together by the next round
+            try:
+                os.fdatasync(data_fd)
+                os.fdatasync(index_fd)
+            finally:
+                with self._cond:
+                    self._syncing = False
+                    self._durable = max(self._durable, target)
+                    self._cond.notify_all()
+
+    def _locate(self, offset):
+        position = bisect.bisect_right(self._bases, offset) - 1
+        segment = self._segments[position]
+        return segment, offset - segment.base_offset
+
+    def read(self, offset):
+        if not 0 <= offset < self._visible:
+            raise IndexError(offset)
+        segment, index = self._locate(offset)
+        return json.loads(segment.read(index))
+
+    def scan(self, start=0, end=None):
+        # Yields (offset, record) for start <= offset < end
+        end = self._visible if end is None else min(end, self._visible)
+        offset = max(start, 0)
+        while offset < end:
+            segment, index = self._locate(offset)
+            stop = min(end - segment.base_offset, len(segment))
+            for position in range(index, stop):
+                yield segment.base_offset + position, json.loads(segment.read(position))
+            offset = segment.base_offset + stop
+
+    def tail(self, count):
+        end = self._visible
+        return [record for _, record in self.scan(max(end - count, 0), end)]
+
+    def close(self):
+        if self.readonly:
+            for segment in self._segments:
+                segment.close()
+            return
+        with self._cond:
+            if self._closed:
+                return
+            while self._syncing:
+                self._cond.wait()
+            self._sync_locked()
+            self._closed = True
+            self._file.close()
+            self._index_file.close()
+            self._cond.notify_all()
+        self._flusher.join()
+        for segment in self._segments:
+            segment.close()
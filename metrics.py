@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# Prometheus-style metrics for server.py and user_api.py.
+#
+# Recording never takes a lock: every thread adds to its own shard of each
+# metric (a dict of label values -> cell), and a scrape sums the shards of all
+# threads. Serving threads come from bounded pools, so the number of shards
+# stays small, and a shard outlives its thread so no count is lost. Values
+# that already live elsewhere (subscriber counts, online users) are gauges or
+# counters with a function, read only when scraped.
+#
+# RequestMetricsMixin times every request a handler serves, labelled by
+# route and status code; GET /metrics returns the registry in the Prometheus
+# text format (send()).
+import bisect
+import math
+import threading
+import time
+import weakref
+
+_bisect_left = bisect.bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds, in seconds, of the request latency buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=(), function=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # Reads the value at scrape time instead of it being recorded
+        self._function = function
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.cells
+        except AttributeError:
+            cells = self._local.cells = {}
+            with self._lock:
+                self._shards.append(cells)
+            return cells
+
+    def _collect(self):
+        # {label values: [cells from every thread]}
+        with self._lock:
+            shards = list(self._shards)
+        collected = {}
+        for cells in shards:
+            # list() copies the items without running Python code, so a
+            # thread adding a cell meanwhile cannot break the iteration
+            for labels, cell in list(cells.items()):
+                collected.setdefault(labels, []).append(cell)
+        return collected
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self._function is not None:
+            lines.append(f"{self.name} {_number(self._function())}")
+        else:
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        cells = self._shard()
+        cells[labels] = cells.get(labels, 0) + amount
+
+    def _samples(self):
+        collected = self._collect()
+        if not collected and not self.labels:
+            yield f"{self.name} 0"
+        for labels, values in sorted(collected.items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {_number(sum(values))}"
+
+
+class Gauge(Counter):
+    # Recorded as increments and decrements, summed over the threads
+    kind = "gauge"
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # One count per bucket, the +Inf bucket, then the sum
+        self._size = len(self.buckets) + 2
+
+    def observe(self, value, labels=()):
+        try:
+            cells = self._local.cells
+        except AttributeError:
+            cells = self._shard()
+        cell = cells.get(labels)
+        if cell is None:
+            cell = cells[labels] = [0] * (self._size - 1) + [0.0]
+        cell[_bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def totals(self):
+        # {label values: (count, sum)}
+        totals = {}
+        for labels, cells in self._collect().items():
+            totals[labels] = (sum(sum(cell[:-1]) for cell in cells), sum(cell[-1] for cell in cells))
+        return totals
+
+    def _samples(self):
+        for labels, cells in sorted(self._collect().items()):
+            counts = [sum(column) for column in zip(*(cell[:-1] for cell in cells))]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {_number(sum(cell[-1] for cell in cells))}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+
+class _RequestCount(_Metric):
+    # http_requests_total, read from the latency histogram's counts so that
+    # serving a request records one metric less
+    kind = "counter"
+
+    def __init__(self, name, help, histogram):
+        super().__init__(name, help, histogram.labels)
+        self._histogram = histogram
+
+    def _samples(self):
+        for labels, (count, _) in sorted(self._histogram.totals().items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=(), function=None):
+        return self._add(Counter(name, help, labels, function))
+
+    def gauge(self, name, help, labels=(), function=None):
+        return self._add(Gauge(name, help, labels, function))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def expose(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return ("\n".join(lines) + "\n").encode()
+
+
+REGISTRY = Registry()
+REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time from parsing a request to the end of its handler.",
+    ("route", "status"))
+REGISTRY._add(_RequestCount("http_requests_total", "Requests served.", REQUEST_DURATION))
+# Handlers of open connections, registered once per connection; a request is
+# in flight while its handler has a start time
+_handlers = weakref.WeakSet()
+_handlers_lock = threading.Lock()
+
+
+def _in_flight():
+    with _handlers_lock:
+        handlers = list(_handlers)
+    return sum(1 for handler in handlers if handler._metrics_start is not None)
+
+
+REGISTRY.gauge("http_requests_in_flight", "Requests being handled.", function=_in_flight)
+_PROCESS_START = time.time()
+REGISTRY.gauge("process_start_time_seconds", "Start time of the process since the epoch.",
+               function=lambda: _PROCESS_START)
+
+_clock = time.perf_counter
+_observe = REQUEST_DURATION.observe
+
+
+class RequestMetricsMixin:
+    # Mix in first, before serving.KeepAliveHandlerMixin, which keeps the
+    # response status and length. The handler class provides
+    # metrics_route(path), which must map paths onto a small fixed set of
+    # labels. Each request is also given to `access_log` (an
+    # access_log.AccessLog) when one is set.
+    _metrics_start = None
+    path = ""
+    access_log = None
+
+    def __init__(self, *args, **kwargs):
+        # Before the base class, which serves the whole connection from
+        # __init__ on the socketserver engines
+        with _handlers_lock:
+            _handlers.add(self)
+        super().__init__(*args, **kwargs)
+
+    def metrics_route(self, path):
+        return "other"
+
+    def request_route(self):
+        # The route label of the request being handled
+        return self.metrics_route(self.path)
+
+    def log_request(self, code="-", size="-"):
+        # The access log replaces http.server's line on stderr
+        if self.access_log is None:
+            super().log_request(code, size)
+
+    def handle_one_request(self):
+        # Requests that got no response (the client closed an idle
+        # connection) are not recorded. Idle keep-alive connections are
+        # parked by the serving engines rather than left waiting here, so
+        # the clock starts with the request.
+        self.response_status = 0
+        start = self._metrics_start = _clock()
+        try:
+            super().handle_one_request()
+        finally:
+            self._metrics_start = None
+            status = self.response_status
+            if status:
+                elapsed = _clock() - start
+                path = self.path
+                route = self.metrics_route(path)
+                _observe(elapsed, (route, status))
+                if self.access_log is not None:
+                    self.access_log.log((time.time(), self.client_address[0], self.command, path, route,
+                                         status, self.response_bytes, elapsed))
+
+
+def send(handler, registry=REGISTRY):
+    # Writes the registry as a /metrics response
+    body = registry.expose()
+    handler.send_response(200)
+    handler.send_header("Content-Type", CONTENT_TYPE)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    if handler.command != "HEAD":
+        handler.wfile.write(body)
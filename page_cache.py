@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# Pre-rendered responses for pages whose content is fixed once the server starts.
+#
+# A CachedPage holds the encoded body plus pre-compressed variants, picks one
+# from Accept-Encoding and answers If-None-Match with 304 Not Modified.
+# brotli and zstandard (declared in pyproject.toml) add br and zstd variants;
+# without them only gzip is offered.
+import gzip
+import hashlib
+from http import HTTPStatus
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Server preference when the client accepts several codings equally
+PREFERRED_ENCODINGS = ("zstd", "br", "gzip")
+
+
+def compress_variants(body):
+    variants = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    if zstandard is not None:
+        variants["zstd"] = zstandard.ZstdCompressor(level=19).compress(body)
+    # Only keep variants that actually save bytes
+    return {name: data for name, data in variants.items() if len(data) < len(body)}
+
+
+def parse_accept_encoding(header):
+    # "gzip;q=0.8, br" -> {"gzip": 0.8, "br": 1.0}
+    accepted = {}
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def etag_matches(if_none_match, etag):
+    # Weak comparison, as If-None-Match requires
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class CachedPage:
+    def __init__(self, body, content_type):
+        self.content_type = content_type
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        # Each coding is a different byte sequence, so each gets its own strong ETag
+        self.variants = {"identity": (body, f'"{digest}"')}
+        for encoding, data in compress_variants(body).items():
+            self.variants[encoding] = (data, f'"{digest}-{encoding}"')
+
+    def select(self, accept_encoding):
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get("*", 0.0)
+        best, best_quality = "identity", 0.0
+        for encoding in PREFERRED_ENCODINGS:
+            if encoding not in self.variants:
+                continue
+            quality = accepted.get(encoding, wildcard)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def send(self, handler):
+        encoding = self.select(handler.headers.get("Accept-Encoding"))
+        body, etag = self.variants[encoding]
+        if etag_matches(handler.headers.get("If-None-Match"), etag):
+            handler.send_response(HTTPStatus.NOT_MODIFIED)
+            handler.send_header("ETag", etag)
+            handler.send_header("Vary", "Accept-Encoding")
+            handler.send_header("Cache-Control", "no-cache")
+            handler.end_headers()
+            return
+        handler.send_response(HTTPStatus.OK)
+        handler.send_header("Content-type", self.content_type)
+        if encoding != "identity":
+            handler.send_header("Content-Encoding", encoding)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.send_header("ETag", etag)
+        handler.send_header("Vary", "Accept-Encoding")
+        # Browsers may keep the page but must revalidate, which costs a 304
+        handler.send_header("Cache-Control", "no-cache")
+        handler.end_headers()
+        if handler.command != "HEAD":
+            handler.wfile.write(body)
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# Client for the Supabase REST API (PostgREST) for server.py and user_api.py.
+#
+# SUPABASE_URL and SUPABASE_KEY point it at a project; without an http(s)
+# SUPABASE_URL the servers keep their built-in demo data. Rows are read with
+# select(), one table per call, as PostgREST exposes the tables in create.sql
+# under /rest/v1/<table>; the servers write nothing upstream.
+#
+# Requests go over a pool of at most SUPABASE_POOL_SIZE keep-alive
+# connections, so a burst of requests neither opens a connection (and a TLS
+# handshake) per call nor more connections than Supabase will take from one
+# client; a request waits up to SUPABASE_TIMEOUT for a free one. A GET on a
+# connection that turned out to be closed by the other end while idle is
+# retried once on a fresh one.
+#
+# Identical reads in flight at the same time are coalesced: the first caller
+# makes the request and the others wait for its answer (single flight), so a
+# stampede on a cold page costs one upstream call. Coalesced callers share
+# the rows they get back, which must not be modified.
+#
+# A circuit breaker stops calls to an upstream that keeps failing: after
+# BREAKER_FAILURES failures in a row (connection errors, timeouts, 5xx) calls
+# fail at once with UpstreamUnavailable for BREAKER_RESET_SECONDS, then one
+# trial call is let through, which closes the breaker if it succeeds. The
+# servers answer 503 while it is open instead of tying up a thread per
+# request on timeouts.
+#
+# bench/postgrest_standin.py serves the same API from memory for running
+# and benchmarking offline.
+import http.client
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import quote, urlencode, urlsplit
+
+import metrics
+
+POOL_SIZE = int(os.environ.get("SUPABASE_POOL_SIZE", "8"))
+TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT", "5"))
+# Idle connections older than this are closed rather than reused, as servers
+# close idle keep-alive connections on their side
+IDLE_SECONDS = 30.0
+BREAKER_FAILURES = 5
+BREAKER_RESET_SECONDS = 10.0
+
+_clock = time.perf_counter
+
+REQUEST_DURATION = metrics.REGISTRY.histogram(
+    "upstream_request_duration_seconds", "Supabase REST requests by table and status (error: no response).",
+    ("table", "status"))
+COALESCED = metrics.REGISTRY.counter("upstream_coalesced_total", "Reads answered by an identical read in flight.")
+REJECTED = metrics.REGISTRY.counter("upstream_rejected_total", "Calls failed at once by an open circuit breaker.")
+OPEN_CIRCUITS = metrics.REGISTRY.gauge("upstream_circuit_open", "1 while the circuit breaker is open.")
+CONNECTIONS = metrics.REGISTRY.counter("upstream_connections_opened_total", "Upstream connections opened.")
+
+
+class UpstreamUnavailable(ConnectionError):
+    # No answer: the upstream is down, slow, failing with 5xx, or the
+    # breaker is open
+    pass
+
+
+class UpstreamError(Exception):
+    # The upstream refused the request (4xx)
+    def __init__(self, status, message):
+        super().__init__(f"upstream answered {status}: {message}")
+        self.status = status
+
+
+def eq(value):
+    return f"eq.{value}"
+
+
+def in_list(values):
+    # PostgREST's in.(...) filter; every value is quoted, so commas and
+    # parentheses in ids are safe
+    quoted = ('"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"' for value in values)
+    return "in.(" + ",".join(quoted) + ")"
+
+
+def from_environment():
+    # The client for SUPABASE_URL/SUPABASE_KEY, or None when no project is set
+    url = os.environ.get("SUPABASE_URL", "")
+    if not url.startswith(("http://", "https://")):
+        return None
+    return PostgrestClient(url, os.environ.get("SUPABASE_KEY", ""))
+
+
+class ConnectionPool:
+    def __init__(self, host, port, https=False, size=POOL_SIZE, timeout=TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._connection_class = http.client.HTTPSConnection if https else http.client.HTTPConnection
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        # (connection, idle since), most recently used last
+        self._idle = []
+        self.opened = 0
+
+    def _get(self):
+        # (connection, reused); prefers the most recently used connection,
+        # so a quiet period lets the others age out
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                connection, since = self._idle.pop()
+                if now - since < IDLE_SECONDS:
+                    return connection, True
+                connection.close()
+            self.opened += 1
+        CONNECTIONS.inc()
+        return self._connection_class(self.host, self.port, timeout=self.timeout), False
+
+    def _put(self, connection):
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+
+    def request(self, method, path, body=None, headers={}):
+        # (status, response, data); raises UpstreamUnavailable if there is no
+        # free connection in time or no response
+        if not self._slots.acquire(timeout=self.timeout):
+            raise UpstreamUnavailable(f"no free connection to {self.host} in {self.timeout:g} s")
+        try:
+            while True:
+                connection, reused = self._get()
+                try:
+                    connection.request(method, path, body, headers)
+                    response = connection.getresponse()
+                    data = response.read()
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as error:
+                    connection.close()
+                    # The other end closed the connection while it was idle;
+                    # only reads are safe to send again
+                    if reused and method == "GET":
+                        continue
+                    raise UpstreamUnavailable(f"{self.host}: {error}") from error
+                except (OSError, http.client.HTTPException) as error:
+                    connection.close()
+                    raise UpstreamUnavailable(f"{self.host}: {error or type(error).__name__}") from error
+                if response.will_close:
+                    connection.close()
+                else:
+                    self._put(connection)
+                return response.status, response, data
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            connection.close()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> Future of the call in flight
+        self._calls = {}
+
+    def do(self, key, function):
+        # function()'s result; if a call with the same key is in flight,
+        # waits for that one's result (or exception) instead
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            COALESCED.inc()
+            return future.result()
+        try:
+            result = function()
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failed = 0
+        # monotonic time the breaker opened, or None while closed
+        self._opened = None
+        self._trial = False
+
+    @property
+    def is_open(self):
+        return self._opened is not None
+
+    def before(self):
+        # Raises UpstreamUnavailable if calls are not let through now; past
+        # the reset time, lets one trial call through at a time
+        if self._opened is None:
+            return
+        with self._lock:
+            if self._opened is not None:
+                wait = self._opened + self.reset_seconds - time.monotonic()
+                if wait > 0 or self._trial:
+                    REJECTED.inc()
+                    raise UpstreamUnavailable(f"upstream failing, retrying in {max(wait, 0):.1f} s")
+                self._trial = True
+
+    def success(self):
+        if self._failed or self._opened is not None:
+            with self._lock:
+                self._failed = 0
+                self._trial = False
+                if self._opened is not None:
+                    self._opened = None
+                    OPEN_CIRCUITS.dec()
+
+    def failure(self):
+        with self._lock:
+            self._failed += 1
+            self._trial = False
+            if self._opened is not None:
+                # The trial call failed: open for another period
+                self._opened = time.monotonic()
+            elif self._failed >= self.failures:
+                self._opened = time.monotonic()
+                OPEN_CIRCUITS.inc()
+
+
+class PostgrestClient:
+    def __init__(self, url, key, pool_size=POOL_SIZE, timeout=TIMEOUT):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"{url!r} is not an http(s) URL")
+        https = parts.scheme == "https"
+        self.url = url
+        self._prefix = parts.path.rstrip("/") + "/rest/v1/"
+        self._headers = {"Accept": "application/json"}
+        if key:
+            self._headers.update({"apikey": key, "Authorization": f"Bearer {key}"})
+        self.pool = ConnectionPool(parts.hostname, parts.port or (443 if https else 80), https, pool_size, timeout)
+        self.breaker = CircuitBreaker()
+        self._flights = SingleFlight()
+
+    def _path(self, table, params):
+        # params: dict or (name, value) pairs, e.g. {"select": "id,username",
+        # "id": in_list(ids), "order": "created_at.desc", "limit": 50}
+        path = self._prefix + quote(table)
+        if params:
+            path += "?" + urlencode(params, safe="*,.:()\"")
+        return path
+
+    def select(self, table, params=None):
+        # The rows matching params; shared with coalesced callers
+        path = self._path(table, params)
+        return self._flights.do(path, lambda: self._request("GET", table, path))
+
+    def _request(self, method, table, path):
+        self.breaker.before()
+        start = _clock()
+        try:
+            status, response, data = self.pool.request(method, path, None, self._headers)
+        except UpstreamUnavailable:
+            REQUEST_DURATION.observe(_clock() - start, (table, "error"))
+            self.breaker.failure()
+            raise
+        REQUEST_DURATION.observe(_clock() - start, (table, status))
+        if status >= 500:
+            self.breaker.failure()
+            raise UpstreamUnavailable(f"{table}: upstream answered {status}")
+        self.breaker.success()
+        if status >= 400:
+            try:
+                message = json.loads(data)["message"]
+            except (ValueError, KeyError, TypeError):
+                message = data[:200].decode("utf-8", "replace")
+            raise UpstreamError(status, message)
+        return json.loads(data) if data else None
+
+    # The tables in create.sql the servers read
+
+    def profiles(self, ids=None, columns="id,username,display_name,avatar_url,status,last_seen"):
+        params = {"select": columns, "order": "id"}
+        if ids is not None:
+            params["id"] = in_list(ids)
+        return self.select("profiles", params)
+
+    def recent_messages(self, limit):
+        # The newest `limit` messages, oldest first
+        rows = self.select("messages", {"select": "*", "order": "created_at.desc", "limit": limit})
+        return rows[::-1]
+
+    def user_statuses(self):
+        return self.select("user_status", {"select": "id,is_online,last_status_change"})
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# Presence state for user_api.py.
+#
+# PresenceStore wraps the users (a presence_table.PresenceTable) with a
+# version number that goes up on every change and a bounded log of recent changes, so clients can ask for
+# "everything since version N" instead of downloading every user again, and
+# can block until something changes (long-polling). A batch of updates is
+# applied under one lock and recorded as a single version.
+#
+# Being online is a lease: a user who goes online must send heartbeats, each
+# pushing their deadline TTL seconds out, or a timing wheel turns them
+# offline. Every status change stamps last_seen, like the trigger on
+# public.user_status in create.sql. Users are handled by their table slot
+# inside the store, and the wheel is keyed by slot too.
+#
+# A store can also be a replica of one in another process (user_api.py
+# --workers): load() and apply() take the other store's snapshots and
+# versions as they are, and nothing expires locally.
+import collections
+import os
+import threading
+import time
+
+import presence_table
+import timing_wheel
+
+# Number of user changes kept for delta requests; older cursors get a full
+# snapshot. The newest version is always kept, however large its batch.
+CHANGE_LOG_SIZE = 4096
+# Seconds without a heartbeat before an online user is set offline
+PRESENCE_TTL_SECONDS = float(os.environ.get("PRESENCE_TTL_SECONDS", 60))
+EXPIRY_TICK_SECONDS = 1.0
+# Users set offline per lock hold, so a mass expiry does not stall requests
+MAX_EXPIRED_PER_ROUND = 10000
+
+
+def _timestamp():
+    # last_seen of a change made now, in the table's whole seconds
+    return int(time.time())
+
+
+class PresenceStore:
+    def __init__(self, users, log_size=CHANGE_LOG_SIZE, ttl=PRESENCE_TTL_SECONDS,
+                 tick=EXPIRY_TICK_SECONDS):
+        # users: a PresenceTable, or a dict of user dicts to copy into one
+        if not isinstance(users, presence_table.PresenceTable):
+            users = presence_table.PresenceTable(users.values())
+        self.users = users
+        self.version = 0
+        self.ttl = ttl
+        # (version, [user, ...]) per version, oldest first
+        self._log = collections.deque()
+        self._log_size = log_size
+        self._logged = 0
+        self._changed = threading.Condition()
+        self._listeners = []
+        self._expiry = timing_wheel.TimingWheel(tick)
+        self._expiry_thread = None
+        # Users online now, kept up to date by every change
+        self.online = 0
+        deadline = time.monotonic() + ttl
+        for slot in users.online_slots():
+            self.online += 1
+            self._expiry.schedule(slot, deadline)
+
+    def add_listener(self, listener):
+        # listener(version, changes) is called with the store lock held, in
+        # version order, with the users changed by each version; it must not
+        # block
+        self._listeners.append(listener)
+
+    def locked(self):
+        # Context manager holding the store lock: no change is applied, and
+        # no listener runs, until it exits. The lock is reentrant, so other
+        # methods may be called inside.
+        return self._changed
+
+    def get(self, user_id):
+        with self._changed:
+            slot = self.users.slot(user_id)
+            return self.users.row(slot) if slot is not None else None
+
+    def snapshot(self):
+        with self._changed:
+            return self.version, list(self.users.rows())
+
+    def query(self, online=None, cursor=0, limit=100, count_only=False):
+        # A page of users in the order they were added: every user, or only
+        # online (True) or offline (False) ones, from `cursor` (a slot, see
+        # presence_table.py) on. Returns {"version", "count" of users the
+        # filter matches, "online" count, "users", "next_cursor": where the
+        # next page starts, or None}; with count_only, just the counts.
+        with self._changed:
+            total = len(self.users)
+            count = total if online is None else self.online if online else total - self.online
+            result = {"version": self.version, "count": count, "online": self.online}
+            if count_only:
+                return result
+            slots, next_cursor = self.users.page(online, cursor, limit)
+            result["users"] = [self.users.row(slot) for slot in slots]
+            result["next_cursor"] = next_cursor
+            return result
+
+    def toggle(self, user_id):
+        with self._changed:
+            slot = self.users.slot(user_id)
+            if slot is None:
+                return None
+            self._set_online(slot, not self.users.is_online(slot), _timestamp(), time.monotonic())
+            self._record([slot])
+            return self.users.row(slot)
+
+    def heartbeat(self, user_id):
+        # Renews the user's lease, setting them online if they were not
+        with self._changed:
+            slot = self.users.slot(user_id)
+            if slot is None:
+                return None
+            now = time.monotonic()
+            if self.users.is_online(slot):
+                self._expiry.schedule(slot, now + self.ttl)
+                return self.users.row(slot)
+            self._set_online(slot, True, _timestamp(), now)
+            self._record([slot])
+            return self.users.row(slot)
+
+    def _set_online(self, slot, is_online, timestamp, now):
+        # Caller holds the lock
+        if self.users.is_online(slot) != is_online:
+            self.online += 1 if is_online else -1
+        self.users.set_online(slot, is_online, timestamp)
+        if is_online:
+            self._expiry.schedule(slot, now + self.ttl)
+        else:
+            self._expiry.cancel(slot)
+
+    def expire(self, now=None, limit=MAX_EXPIRED_PER_ROUND):
+        # Sets users whose lease ran out offline, as one version; returns how
+        # many were expired. Call again while it returns `limit`.
+        with self._changed:
+            expired = []
+            timestamp = _timestamp()
+            for slot in self._expiry.advance(now, limit):
+                if self.users.is_online(slot):
+                    self._set_online(slot, False, timestamp, now)
+                    expired.append(slot)
+            if expired:
+                self._record(expired)
+            return len(expired)
+
+    def start_expiry(self):
+        # Background thread that runs expire() every tick
+        with self._changed:
+            if self._expiry_thread is None:
+                self._expiry_thread = threading.Thread(target=self._expiry_loop, name="presence-expiry",
+                                                       daemon=True)
+                self._expiry_thread.start()
+
+    def _expiry_loop(self):
+        while True:
+            time.sleep(self._expiry.tick)
+            while self.expire() >= MAX_EXPIRED_PER_ROUND:
+                pass
+
+    def apply_batch(self, updates):
+        # Sets is_online for each (user_id, is_online) in order, atomically:
+        # readers see either none or all of the batch. Returns (version,
+        # results) with one status per update, in the same order: "updated",
+        # "unchanged" or "not_found". Users whose state ends up
+        # different are recorded as one version; nothing is recorded when no
+        # user changed.
+        results = []
+        before = {}
+        timestamp = _timestamp()
+        now = time.monotonic()
+        with self._changed:
+            users = self.users
+            for user_id, is_online in updates:
+                slot = users.slot(user_id)
+                if slot is None:
+                    status = "not_found"
+                elif users.is_online(slot) == is_online:
+                    if is_online:
+                        # Counts as a heartbeat
+                        self._expiry.schedule(slot, now + self.ttl)
+                    status = "unchanged"
+                else:
+                    before.setdefault(slot, not is_online)
+                    self._set_online(slot, is_online, timestamp, now)
+                    status = "updated"
+                results.append(status)
+            changed = [slot for slot, was_online in before.items() if users.is_online(slot) != was_online]
+            if changed:
+                self._record(changed)
+            return self.version, results
+
+    def load(self, version, users):
+        # Replica: replaces the state with another store's snapshot. Users
+        # that differ are recorded as `version`, which is newer than any
+        # version this replica has seen unless the other store restarted.
+        with self._changed:
+            if version <= self.version:
+                # Versions of another history: the log cannot answer deltas
+                self._log.clear()
+                self._logged = 0
+            changed = []
+            for user in users:
+                slot = self.users.slot(user["id"])
+                if slot is not None and self.users.row(slot) == user:
+                    continue
+                changed.append(self._replace(slot, user))
+            if changed or version != self.version:
+                self._record(changed, version)
+
+    def apply(self, version, changes):
+        # Replica: applies one version recorded by another store
+        with self._changed:
+            self._record([self._replace(self.users.slot(change["id"]), change) for change in changes], version)
+
+    def _replace(self, slot, state):
+        # Stores another store's state of a user, whose slot here is `slot`
+        # (None if new); returns the slot. Caller holds the lock.
+        was_online = slot is not None and self.users.is_online(slot)
+        self.online += state["is_online"] - was_online
+        return self.users.put(state)
+
+    def _record(self, slots, version=None):
+        # Records the users in `slots` as changed. Caller holds the lock.
+        self.version = self.version + 1 if version is None else version
+        changes = [self.users.row(slot) for slot in slots]
+        self._log.append((self.version, changes))
+        self._logged += len(changes)
+        while self._logged > self._log_size and len(self._log) > 1:
+            self._logged -= len(self._log.popleft()[1])
+        self._changed.notify_all()
+        for listener in self._listeners:
+            listener(self.version, changes)
+
+    def changes_since(self, since, timeout=0):
+        # Returns {"version", "changes"} with the latest state of every user
+        # changed after `since`, or {"version", "snapshot": True, "users"} when
+        # `since` is no longer covered by the log. With a timeout, waits for a
+        # change when there is nothing newer than `since` yet.
+        with self._changed:
+            if timeout > 0 and since == self.version:
+                self._changed.wait_for(lambda: self.version != since, timeout)
+            return self._delta(since)
+
+    def _delta(self, since):
+        oldest = self._log[0][0] if self._log else self.version + 1
+        # A cursor from the future (e.g. before a restart) or older than the log
+        if since > self.version or since < oldest - 1:
+            return {"version": self.version, "snapshot": True,
+                    "users": list(self.users.rows())}
+        # Walk back from the newest entry; only the latest state per user is sent
+        latest = {}
+        for version, changes in reversed(self._log):
+            if version <= since:
+                break
+            for user in reversed(changes):
+                latest.setdefault(user["id"], user)
+        return {"version": self.version, "changes": list(reversed(latest.values()))}
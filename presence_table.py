@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# Compact user table behind presence.PresenceStore.
+#
+# A dict of user dicts costs several hundred bytes a user: the dict, the id,
+# username and last_seen strings, and the outer dict's entry. Here each user
+# is a slot, numbered from 0 in the order users were added, and every column
+# is packed:
+#
+#   ids        utf-8 bytes of every id, back to back, with each slot's end
+#              offset in an array
+#   usernames  the same, with a start offset and length per slot (a changed
+#              username is appended; the old bytes are not reclaimed)
+#   is_online  one bit per slot in a bytearray
+#   last_seen  whole seconds since the epoch per slot in an array, 0 for
+#              never, given back as "%Y-%m-%dT%H:%M:%SZ" like _timestamp()
+#
+# and ids find their slot through an open-addressing hash table of slot
+# numbers, so a user takes a few dozen bytes.
+#
+# The slots of online users, and those of offline users, are also kept
+# sorted, in blocks of up to 2 * ONLINE_BLOCK found by bisecting on each
+# block's last slot, and moved from one to the other whenever a bit flips
+# (four bytes per user). Counting online users is a length, and listing
+# them, or a page of online or offline users after a cursor, costs the size
+# of the result however many users there are.
+#
+# The table is also a MutableMapping of id -> user dict, so code written for
+# the dict of dicts keeps working: reads get a new dict for the row and
+# assigning a dict stores it. Users cannot be removed. Nothing here locks;
+# PresenceStore makes its changes under its own lock.
+import bisect
+import collections.abc
+import functools
+import time
+from array import array
+from datetime import datetime, timezone
+
+_INITIAL_BUCKETS = 8
+ONLINE_BLOCK = 1024
+
+
+@functools.lru_cache(maxsize=4096)
+def _format(seconds):
+    # Rows changed in the same second share one string
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds)) if seconds else None
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse(last_seen):
+    moment = datetime.fromisoformat(last_seen)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+def _seconds(last_seen):
+    if last_seen is None:
+        return 0
+    if isinstance(last_seen, (int, float)):
+        return int(last_seen)
+    return _parse(last_seen)
+
+
+class _SortedSlots:
+    def __init__(self):
+        self._blocks = []
+        # Last slot of each block
+        self._lasts = []
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block
+
+    def add(self, slot):
+        # The slot must not be in the set
+        blocks, lasts = self._blocks, self._lasts
+        self._length += 1
+        if not blocks:
+            blocks.append(array("I", (slot,)))
+            lasts.append(slot)
+            return
+        if slot > lasts[-1] and len(blocks[-1]) < 2 * ONLINE_BLOCK:
+            # A new user's slot is the highest yet
+            blocks[-1].append(slot)
+            lasts[-1] = slot
+            return
+        index = min(bisect.bisect_left(lasts, slot), len(blocks) - 1)
+        block = blocks[index]
+        bisect.insort(block, slot)
+        lasts[index] = block[-1]
+        if len(block) > 2 * ONLINE_BLOCK:
+            blocks[index:index + 1] = block[:ONLINE_BLOCK], block[ONLINE_BLOCK:]
+            lasts[index:index + 1] = block[ONLINE_BLOCK - 1], block[-1]
+
+    def remove(self, slot):
+        # The slot must be in the set
+        blocks, lasts = self._blocks, self._lasts
+        self._length -= 1
+        index = bisect.bisect_left(lasts, slot)
+        block = blocks[index]
+        del block[bisect.bisect_left(block, slot)]
+        if block:
+            lasts[index] = block[-1]
+        else:
+            del blocks[index], lasts[index]
+
+    def after(self, start, limit):
+        # Up to `limit` slots from `start` on, in order
+        blocks = self._blocks
+        index = bisect.bisect_left(self._lasts, start)
+        slots = []
+        if index < len(blocks):
+            position = bisect.bisect_left(blocks[index], start)
+            while index < len(blocks) and len(slots) < limit:
+                slots.extend(blocks[index][position:position + limit - len(slots)])
+                index += 1
+                position = 0
+        return slots
+
+
+class PresenceTable(collections.abc.MutableMapping):
+    def __init__(self, users=()):
+        self._ids = bytearray()
+        # Offsets are 32-bit: up to 4 GiB each of ids and usernames
+        self._id_ends = array("I")
+        self._names = bytearray()
+        self._name_starts = array("I")
+        self._name_lengths = array("I")
+        self._online = bytearray()
+        self._online_slots = _SortedSlots()
+        self._offline_slots = _SortedSlots()
+        self._last_seen = array("I")
+        # slot + 1 per bucket, 0 for an empty one; at most 2/3 full
+        self._buckets = array("i", bytes(4 * _INITIAL_BUCKETS))
+        self._mask = _INITIAL_BUCKETS - 1
+        for user in users:
+            self.put(user)
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    @property
+    def nbytes(self):
+        # Bytes held by the columns and the hash table
+        return (len(self._ids) + len(self._names) + len(self._online) + 4 * len(self) +
+                sum(len(column) * column.itemsize for column in (
+                    self._id_ends, self._name_starts, self._name_lengths, self._last_seen, self._buckets)))
+
+    # Slots
+
+    def _id(self, slot):
+        return self._ids[self._id_ends[slot - 1] if slot else 0:self._id_ends[slot]]
+
+    def _find(self, key):
+        # (bucket, slot) for the utf-8 id; the slot is None, and the bucket the
+        # empty one to put it in, if the id is not in the table
+        buckets, mask = self._buckets, self._mask
+        bucket = hash(key) & mask
+        while True:
+            entry = buckets[bucket]
+            if not entry:
+                return bucket, None
+            if self._id(entry - 1) == key:
+                return bucket, entry - 1
+            bucket = (bucket + 1) & mask
+
+    def _grow(self):
+        size = len(self._buckets) * 2
+        buckets = array("i", bytes(4 * size))
+        mask = size - 1
+        ids = bytes(self._ids)
+        start = 0
+        for slot, end in enumerate(self._id_ends, 1):
+            bucket = hash(ids[start:end]) & mask
+            while buckets[bucket]:
+                bucket = (bucket + 1) & mask
+            buckets[bucket] = slot
+            start = end
+        self._buckets, self._mask = buckets, mask
+
+    def slot(self, user_id):
+        # The user's slot, or None
+        return self._find(user_id.encode())[1]
+
+    def put(self, user):
+        # Stores a user dict ({"id", "username", "is_online", "last_seen"},
+        # last_seen optional), adding a slot for a new id; returns the slot
+        key = user["id"].encode()
+        name = user["username"].encode()
+        bucket, slot = self._find(key)
+        if slot is None:
+            slot = len(self._last_seen)
+            self._ids += key
+            self._id_ends.append(len(self._ids))
+            self._name_starts.append(len(self._names))
+            self._name_lengths.append(len(name))
+            self._names += name
+            self._last_seen.append(_seconds(user.get("last_seen")))
+            if slot & 7 == 0:
+                self._online.append(0)
+            self._buckets[bucket] = slot + 1
+            if (slot + 1) * 3 > len(self._buckets) * 2:
+                self._grow()
+            if user["is_online"]:
+                self._online[slot >> 3] |= 1 << (slot & 7)
+                self._online_slots.add(slot)
+            else:
+                self._offline_slots.add(slot)
+        else:
+            start = self._name_starts[slot]
+            if self._names[start:start + self._name_lengths[slot]] != name:
+                self._name_starts[slot] = len(self._names)
+                self._name_lengths[slot] = len(name)
+                self._names += name
+            self._last_seen[slot] = _seconds(user.get("last_seen"))
+            self._set_bit(slot, user["is_online"])
+        return slot
+
+    def is_online(self, slot):
+        return bool(self._online[slot >> 3] >> (slot & 7) & 1)
+
+    def _set_bit(self, slot, is_online):
+        byte, bit = slot >> 3, 1 << (slot & 7)
+        if bool(self._online[byte] & bit) == is_online:
+            return
+        self._online[byte] ^= bit
+        if is_online:
+            self._offline_slots.remove(slot)
+            self._online_slots.add(slot)
+        else:
+            self._online_slots.remove(slot)
+            self._offline_slots.add(slot)
+
+    def set_online(self, slot, is_online, seen):
+        # A status change at `seen` (epoch seconds)
+        self._set_bit(slot, is_online)
+        self._last_seen[slot] = int(seen)
+
+    def row(self, slot):
+        ends = self._id_ends
+        start = self._name_starts[slot]
+        return {"id": self._ids[ends[slot - 1] if slot else 0:ends[slot]].decode(),
+                "username": self._names[start:start + self._name_lengths[slot]].decode(),
+                "is_online": self._online[slot >> 3] >> (slot & 7) & 1 == 1,
+                "last_seen": _format(self._last_seen[slot])}
+
+    def rows(self):
+        # Every user's dict, in slot order
+        for slot in range(len(self)):
+            yield self.row(slot)
+
+    # Online users
+
+    def count_online(self):
+        return len(self._online_slots)
+
+    def online_slots(self):
+        # Slots of online users, in order; the table must not change while
+        # this is iterated
+        return iter(self._online_slots)
+
+    def online_ids(self):
+        return [self._id(slot).decode() for slot in self._online_slots]
+
+    def page(self, online, start, limit):
+        # Up to `limit` slots from `start` on, of every user (online None) or
+        # only online (True) or offline (False) ones; returns (slots, the
+        # slot the next page starts at, or None if there are no more)
+        if online is None:
+            slots = list(range(start, min(start + limit + 1, len(self))))
+        else:
+            slots = (self._online_slots if online else self._offline_slots).after(start, limit + 1)
+        if len(slots) > limit:
+            return slots[:limit], slots[limit]
+        return slots, None
+
+    # Mapping view
+
+    def __getitem__(self, user_id):
+        slot = self.slot(user_id)
+        if slot is None:
+            raise KeyError(user_id)
+        return self.row(slot)
+
+    def __contains__(self, user_id):
+        return isinstance(user_id, str) and self.slot(user_id) is not None
+
+    def __iter__(self):
+        for slot in range(len(self)):
+            yield self._id(slot).decode()
+
+    def __setitem__(self, user_id, user):
+        self.put(dict(user, id=user_id))
+
+    def __delitem__(self, user_id):
+        raise TypeError("users cannot be removed from a PresenceTable")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# Read-through cache of profiles rows for server.py.
+#
+# Messages carry only their author's user_id, so responses that list
+# messages also list their authors' profiles. get_many() looks a whole page
+# of authors up at once: one pass over the ids under the lock, then one call
+# to the loader for every id not in the cache, so a page of messages costs
+# at most one upstream request however many authors it has.
+#
+# At most PROFILE_CACHE_SIZE profiles are kept, in least recently used
+# order. An entry is fresh for PROFILE_TTL_SECONDS after it was loaded;
+# for PROFILE_STALE_SECONDS after that it is still served while a background
+# thread reloads it (stale-while-revalidate), so requests only wait for
+# profiles they have not seen recently. If the loader fails, expired entries
+# are served rather than none and unknown ids come back as None. Ids with no
+# profile are cached as None too, so an unknown author does not cost a
+# lookup on every request.
+#
+# Changes made elsewhere (a profile edited in the app) reach the cache
+# through apply(); a load that was in flight across a change does not
+# overwrite it.
+import collections
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", "100000"))
+PROFILE_TTL_SECONDS = float(os.environ.get("PROFILE_TTL_SECONDS", "60"))
+PROFILE_STALE_SECONDS = float(os.environ.get("PROFILE_STALE_SECONDS", "600"))
+# Rough bytes of an entry besides its id and profile: the OrderedDict's
+# hash table slot and link, and the entry tuple
+_ENTRY_OVERHEAD = 160
+
+
+def _size(user_id, profile):
+    # Approximate bytes an entry holds
+    size = _ENTRY_OVERHEAD + sys.getsizeof(user_id)
+    if profile is not None:
+        size += sys.getsizeof(profile) + sum(sys.getsizeof(value) for value in profile.values())
+    return size
+
+
+class ProfileCache:
+    def __init__(self, load, capacity=PROFILE_CACHE_SIZE, ttl=PROFILE_TTL_SECONDS, stale=PROFILE_STALE_SECONDS):
+        # load(ids) returns {id: profile} for the ids that have a profile
+        self._load = load
+        self.capacity = capacity
+        self.ttl = ttl
+        self.stale = stale
+        # id -> (fresh until, profile or None, size), least recently used first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Ids being reloaded in the background
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile-refresh")
+        self.bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_errors = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self):
+        requests = self.hits + self.stale_hits + self.misses
+        return (self.hits + self.stale_hits) / requests if requests else 0.0
+
+    def get(self, user_id):
+        return self.get_many((user_id,))[user_id]
+
+    def get_many(self, ids):
+        # {id: profile or None} for each distinct id, in the order given
+        now = time.monotonic()
+        found = {}
+        # id -> entry when the load started (None if there was none)
+        missing = {}
+        stale = {}
+        with self._lock:
+            entries = self._entries
+            for user_id in dict.fromkeys(ids):
+                entry = entries.get(user_id)
+                if entry is None or now >= entry[0] + self.stale:
+                    missing[user_id] = entry
+                    found[user_id] = None
+                    continue
+                found[user_id] = entry[1]
+                entries.move_to_end(user_id)
+                if now < entry[0]:
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+                    if user_id not in self._refreshing:
+                        self._refreshing.add(user_id)
+                        stale[user_id] = entry
+            self.misses += len(missing)
+        if stale:
+            self._refresher.submit(self._refresh, stale)
+        if missing:
+            try:
+                loaded = self._load(list(missing))
+            except Exception:
+                # Serve what there is, however old
+                with self._lock:
+                    self.load_errors += 1
+                for user_id, entry in missing.items():
+                    if entry is not None:
+                        found[user_id] = entry[1]
+                return found
+            self._store(missing, loaded, now)
+            for user_id in missing:
+                found[user_id] = loaded.get(user_id)
+        return found
+
+    def _refresh(self, before):
+        try:
+            loaded = self._load(list(before))
+        except Exception:
+            loaded = None
+        with self._lock:
+            self._refreshing.difference_update(before)
+            if loaded is None:
+                self.load_errors += 1
+                return
+        self._store(before, loaded, time.monotonic())
+
+    def _store(self, before, loaded, now):
+        # Caches what was loaded for each id in `before`, unless its entry
+        # changed while it was loading
+        with self._lock:
+            for user_id, entry in before.items():
+                if self._entries.get(user_id) is entry:
+                    self._put(user_id, loaded.get(user_id), now)
+
+    def _put(self, user_id, profile, now):
+        # Caller holds the lock
+        entries = self._entries
+        old = entries.pop(user_id, None)
+        if old is not None:
+            self.bytes -= old[2]
+        size = _size(user_id, profile)
+        entries[user_id] = (now + self.ttl, profile, size)
+        self.bytes += size
+        while len(entries) > self.capacity:
+            _, (_, _, evicted_size) = entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def apply(self, change):
+        # ["put", profile] caches a new or changed profile, ["delete", id]
+        # forgets one
+        with self._lock:
+            if change[0] == "put":
+                self._put(change[1]["id"], change[1], time.monotonic())
+            else:
+                self._invalidate(change[1])
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._invalidate(user_id)
+
+    def _invalidate(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# Per-client, per-route rate limiting for server.py and user_api.py.
+#
+# Each limited route allows `rate` requests per second per client, with
+# bursts of up to `burst`, using GCRA (the generic cell rate algorithm, a
+# token bucket kept as one number): a client's state is its theoretical
+# arrival time (TAT), when its bucket would be full again. A request at
+# `now` is let through if TAT - now, after adding this request, stays within
+# burst requests' worth of time; otherwise it gets 429 with the wait in
+# Retry-After.
+#
+# Clients are keyed by IP address or, for routes keyed by "session", by
+# session cookie (falling back to the IP). State lives in one table of
+# TABLE_SLOTS entries, fixed when the limiter is made, so a flood of new
+# keys cannot grow memory: a key hashes to a set of WAYS slots and takes
+# its own slot, a free one, or else the one whose bucket is fullest (the
+# least recently limited). Evicting a key only ever forgets how much of its
+# burst it had used. Hashes are Python's, salted per process, so clients
+# cannot pick keys that collide. Sets are guarded by striped locks.
+#
+# RATE_LIMITS overrides the limits, as "route=rate:burst[:key],...";
+# "off" turns limiting off (the benchmarks run that way).
+import math
+import os
+import threading
+import time
+from array import array
+from http import HTTPStatus
+
+import metrics
+
+TABLE_SLOTS = int(os.environ.get("RATE_LIMIT_SLOTS", str(1 << 16)))
+WAYS = 4
+LOCKS = 64
+KEYS = ("ip", "session")
+# Slack for float rounding, so a burst of N is N whatever the rate
+_EPSILON = 1e-9
+
+LIMITED = metrics.REGISTRY.counter("rate_limited_total", "Requests refused with 429.", ("route",))
+
+
+def parse_limits(spec):
+    # "route=rate:burst[:key],..." -> {route: (rate, burst, key)}
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, values = item.partition("=")
+        values = values.split(":")
+        if not route or len(values) not in (2, 3):
+            raise ValueError(f"rate limit {item!r} is not route=rate:burst[:key]")
+        rate, burst = float(values[0]), int(values[1])
+        key = values[2] if len(values) == 3 else "ip"
+        if rate <= 0 or burst < 1 or key not in KEYS:
+            raise ValueError(f"rate limit {item!r} needs rate > 0, burst >= 1 and a key of {', '.join(KEYS)}")
+        limits[route] = (rate, burst, key)
+    return limits
+
+
+def from_environment(defaults, session_of=None):
+    # The limiter for a server with these default limits, or None when
+    # RATE_LIMITS is "off"
+    spec = os.environ.get("RATE_LIMITS")
+    if spec == "off":
+        return None
+    limits = dict(defaults)
+    if spec:
+        limits.update(parse_limits(spec))
+    return RateLimiter(limits, session_of)
+
+
+class RateLimiter:
+    def __init__(self, limits, session_of=None, slots=TABLE_SLOTS):
+        # limits: {route: (requests per second, burst, "ip" or "session")};
+        # session_of(handler) gives the request's session id or None
+        # route -> (seconds per request, burst in seconds, key, salt mixed
+        # into client hashes so routes do not share slots)
+        self.limits = {route: (1 / rate, burst / rate, key, hash(route))
+                       for route, (rate, burst, key) in limits.items()}
+        self._sets = max(slots // WAYS, 1)
+        # Per slot: hash of (route, client) (0 for free) and TAT
+        self._keys = array("q", bytes(8 * self._sets * WAYS))
+        self._tats = array("d", bytes(8 * self._sets * WAYS))
+        self._locks = [threading.Lock() for _ in range(LOCKS)]
+        self._session_of = session_of
+
+    def check(self, route, client, now=None):
+        # Seconds to wait before `client` may call `route`; 0 lets the
+        # request through and counts it
+        limit = self.limits.get(route)
+        if limit is None:
+            return 0
+        interval, tolerance, _, salt = limit
+        key = (hash(client) ^ salt) or 1
+        bucket = key % self._sets
+        index = bucket * WAYS
+        if now is None:
+            now = time.monotonic()
+        keys, tats = self._keys, self._tats
+        with self._locks[bucket % LOCKS]:
+            slot = victim = -1
+            for position in range(index, index + WAYS):
+                found = keys[position]
+                if found == key:
+                    slot = position
+                    break
+                if found == 0 or tats[position] <= now:
+                    # Free, or a bucket that has refilled: nothing to forget
+                    victim = position
+                elif victim < 0 or (keys[victim] and tats[position] < tats[victim]):
+                    victim = position
+            if slot < 0:
+                slot = victim
+                keys[slot] = key
+                tats[slot] = now
+            tat = tats[slot]
+            tat = (tat if tat > now else now) + interval
+            wait = tat - now - tolerance
+            if wait > _EPSILON:
+                return wait
+            tats[slot] = tat
+        return 0
+
+    def allow(self, handler, route):
+        # Checks a request for `route`; answers 429 and returns False if
+        # the client is over its limit
+        limit = self.limits.get(route)
+        if limit is None:
+            return True
+        client = None
+        if limit[2] == "session" and self._session_of is not None:
+            client = self._session_of(handler)
+        if client is None:
+            client = handler.client_address[0]
+        wait = self.check(route, client)
+        if not wait:
+            return True
+        LIMITED.inc((route,))
+        headers = handler.headers
+        if headers.get("Content-Length", "0").strip() not in ("", "0") or headers.get("Transfer-Encoding"):
+            # The request body is left unread, so it must not be taken for
+            # the next request on the connection
+            handler.close_connection = True
+        body = b'{"error": "Too many requests"}'
+        handler.send_response(HTTPStatus.TOO_MANY_REQUESTS)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.send_header("Retry-After", str(math.ceil(wait)))
+        handler.end_headers()
+        if handler.command != "HEAD":
+            handler.wfile.write(body)
+        return False
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# Message reaction aggregates for server.py.
+#
+# Holds the rows of message_reactions in create.sql (one per message, user
+# and reaction) grouped by message: each message with reactions keeps its
+# users per reaction and its total, so adding or removing a reaction is a
+# few dict and set operations, and a message's summary ("👍 12, ❤️ 3") is
+# read off without counting anything. Adding a row that exists, or removing
+# one that does not, changes nothing, like the UNIQUE constraint.
+#
+# Each channel also keeps its messages ranked by total, for the hottest
+# messages in a channel: a list of buckets, one per total that some message
+# has, linked from lowest to highest, each holding the messages with that
+# total. A reaction moves its message to the neighbouring bucket, as totals
+# only ever change by one, so keeping the ranking costs O(1) per change, and
+# the top K are read from the highest bucket down with nothing rescanned.
+# (A heap would need a rescan whenever a top message loses a reaction; this
+# stays exact.) Messages with no reactions are not held at all.
+import threading
+
+
+class _Bucket:
+    __slots__ = ("total", "messages", "lower", "higher")
+
+    def __init__(self, total):
+        self.total = total
+        # Message ids, in the order they reached this total
+        self.messages = {}
+        self.lower = self.higher = None
+
+
+class _Message:
+    __slots__ = ("channel_id", "users", "total", "bucket")
+
+    def __init__(self, channel_id):
+        self.channel_id = channel_id
+        # reaction -> set of user ids
+        self.users = {}
+        self.total = 0
+        self.bucket = None
+
+
+class _Channel:
+    __slots__ = ("lowest", "highest")
+
+    def __init__(self):
+        self.lowest = self.highest = None
+
+
+class ReactionIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._messages = {}
+        self._channels = {}
+        self.rows = 0
+
+    def __len__(self):
+        # Messages with at least one reaction
+        return len(self._messages)
+
+    def add(self, message_id, channel_id, user_id, reaction):
+        # Returns False if the user had already reacted so
+        with self._lock:
+            message = self._messages.get(message_id)
+            if message is None:
+                message = self._messages[message_id] = _Message(channel_id)
+            users = message.users.get(reaction)
+            if users is None:
+                users = message.users[reaction] = set()
+            elif user_id in users:
+                return False
+            users.add(user_id)
+            self.rows += 1
+            self._rank(message_id, message, 1)
+            return True
+
+    def remove(self, message_id, user_id, reaction):
+        # Returns False if there was no such reaction
+        with self._lock:
+            message = self._messages.get(message_id)
+            users = message.users.get(reaction) if message is not None else None
+            if users is None or user_id not in users:
+                return False
+            users.discard(user_id)
+            if not users:
+                del message.users[reaction]
+            self.rows -= 1
+            self._rank(message_id, message, -1)
+            if not message.total:
+                del self._messages[message_id]
+            return True
+
+    def apply(self, change):
+        # ["add", message id, channel id, user id, reaction] or
+        # ["remove", message id, user id, reaction]; returns whether it
+        # changed anything
+        if change[0] == "add":
+            return self.add(*change[1:])
+        return self.remove(*change[1:])
+
+    def _rank(self, message_id, message, step):
+        # Moves the message to the bucket for its total + step. Caller holds
+        # the lock.
+        channel = self._channels.get(message.channel_id)
+        if channel is None:
+            channel = self._channels[message.channel_id] = _Channel()
+        old = message.bucket
+        total = message.total + step
+        message.total = total
+        target = None
+        if total:
+            # The neighbour on the side it moves to, if it has that total
+            neighbour = (old.higher if step > 0 else old.lower) if old is not None else channel.lowest
+            if neighbour is not None and neighbour.total == total:
+                target = neighbour
+            else:
+                target = _Bucket(total)
+                if old is None:
+                    # A first reaction: below every other bucket
+                    self._link(channel, target, None, channel.lowest)
+                elif step > 0:
+                    self._link(channel, target, old, old.higher)
+                else:
+                    self._link(channel, target, old.lower, old)
+            target.messages[message_id] = None
+        message.bucket = target
+        if old is not None:
+            del old.messages[message_id]
+            if not old.messages:
+                self._unlink(channel, old)
+        if channel.lowest is None:
+            del self._channels[message.channel_id]
+
+    @staticmethod
+    def _link(channel, bucket, lower, higher):
+        bucket.lower, bucket.higher = lower, higher
+        if lower is None:
+            channel.lowest = bucket
+        else:
+            lower.higher = bucket
+        if higher is None:
+            channel.highest = bucket
+        else:
+            higher.lower = bucket
+
+    @staticmethod
+    def _unlink(channel, bucket):
+        if bucket.lower is None:
+            channel.lowest = bucket.higher
+        else:
+            bucket.lower.higher = bucket.higher
+        if bucket.higher is None:
+            channel.highest = bucket.lower
+        else:
+            bucket.higher.lower = bucket.lower
+
+    def summary(self, message_id, user_id=None):
+        # {"counts": {reaction: users}, most used first, "total": n}, with
+        # "mine": the reactions of user_id if one is given
+        with self._lock:
+            return self._summary(self._messages.get(message_id), user_id)
+
+    def summaries(self, message_ids, user_id=None):
+        # {message id: summary} for a page of messages, under one lock hold
+        with self._lock:
+            messages = self._messages
+            return {message_id: self._summary(messages.get(message_id), user_id) for message_id in message_ids}
+
+    @staticmethod
+    def _summary(message, user_id):
+        if message is None:
+            summary = {"counts": {}, "total": 0}
+            if user_id is not None:
+                summary["mine"] = []
+            return summary
+        counts = sorted(((reaction, len(users)) for reaction, users in message.users.items()),
+                        key=lambda item: -item[1])
+        summary = {"counts": dict(counts), "total": message.total}
+        if user_id is not None:
+            summary["mine"] = [reaction for reaction, users in message.users.items() if user_id in users]
+        return summary
+
+    def hottest(self, channel_id, limit):
+        # [(message id, total)] of the `limit` messages with the most
+        # reactions in the channel, most first
+        hottest = []
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            bucket = channel.highest if channel is not None else None
+            while bucket is not None and len(hottest) < limit:
+                for message_id in bucket.messages:
+                    hottest.append((message_id, bucket.total))
+                    if len(hottest) == limit:
+                        break
+                bucket = bucket.lower
+        return hottest
+
+    # Replicas
+
+    def entries(self):
+        # [[message id, channel id, user id, reaction], ...] for every row
+        with self._lock:
+            return [[message_id, message.channel_id, user_id, reaction]
+                    for message_id, message in self._messages.items()
+                    for reaction, users in message.users.items() for user_id in users]
+
+    def load(self, entries):
+        # Replaces every row with those from another index's entries()
+        with self._lock:
+            self._messages.clear()
+            self._channels.clear()
+            self.rows = 0
+        for entry in entries:
+            self.add(*entry)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# Incremental inverted index over message content.
+#
+# Documents are message log offsets. Each term has a posting list of
+# varint-encoded gaps between offsets, with the term frequency folded into
+# the low bit (and written separately only when it is above one), split into
+# blocks of BLOCK_SIZE postings whose first offset is kept in a side array.
+# The block table lets a query jump straight to the postings it needs, both to
+# test candidates against other terms and to walk a list from its newest end.
+#
+# Documents must be added in offset order, so every posting list is appended
+# to at its end; add() raises ValueError for one that is not.
+#
+# Queries AND their terms; the last one also matches as a prefix for
+# type-ahead. Candidates come from the rarest term, newest first, up to
+# MAX_CANDIDATES (so very common terms stay cheap and favour recent
+# messages), and are ranked with BM25.
+import bisect
+import heapq
+import math
+import re
+import threading
+from array import array
+
+BLOCK_SIZE = 128
+MAX_CANDIDATES = 2000
+# Postings walked looking for candidates in one channel before giving up
+MAX_SCANNED = 200000
+MAX_PREFIX_TERMS = 64
+# Vocabulary entries examined when expanding a prefix
+MAX_PREFIX_SCAN = 4096
+MIN_PREFIX_LENGTH = 2
+MAX_QUERY_TERMS = 8
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, position):
+    result = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+class _Postings:
+    __slots__ = ("data", "count", "last", "block_docs", "block_positions")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.count = 0
+        self.last = -1
+        self.block_docs = array("q")
+        self.block_positions = array("q")
+
+    def append(self, doc, tf):
+        if self.count % BLOCK_SIZE == 0:
+            self.block_docs.append(doc)
+            self.block_positions.append(len(self.data))
+            gap = 0
+        else:
+            gap = doc - self.last
+        _write_varint(self.data, (gap << 1) | (tf > 1))
+        if tf > 1:
+            _write_varint(self.data, tf)
+        self.count += 1
+        self.last = doc
+
+    def decode_block(self, block):
+        # Returns [(doc, tf), ...] for one block
+        data = self.data
+        position = self.block_positions[block]
+        end = self.block_positions[block + 1] if block + 1 < len(self.block_positions) else len(data)
+        doc = self.block_docs[block]
+        entries = []
+        append = entries.append
+        while position < end:
+            value = data[position]
+            position += 1
+            if value >= 0x80:
+                value &= 0x7F
+                shift = 7
+                while True:
+                    byte = data[position]
+                    position += 1
+                    value |= (byte & 0x7F) << shift
+                    if byte < 0x80:
+                        break
+                    shift += 7
+            doc += value >> 1
+            if value & 1:
+                tf, position = _read_varint(data, position)
+                append((doc, tf))
+            else:
+                append((doc, 1))
+        return entries
+
+    def block_end(self, block):
+        # Upper bound (inclusive) for the documents in a block
+        if block + 1 < len(self.block_docs):
+            return self.block_docs[block + 1] - 1
+        return self.last
+
+
+class _TermCursor:
+    # Per-query view of one posting list with decoded blocks cached
+    __slots__ = ("postings", "_blocks")
+
+    def __init__(self, postings):
+        self.postings = postings
+        self._blocks = {}
+
+    def tf(self, doc):
+        postings = self.postings
+        block = bisect.bisect_right(postings.block_docs, doc) - 1
+        if block < 0:
+            return 0
+        entries = self._blocks.get(block)
+        if entries is None:
+            entries = self._blocks[block] = dict(postings.decode_block(block))
+        return entries.get(doc, 0)
+
+
+class SearchIndex:
+    def __init__(self):
+        self._postings = {}
+        # Every term, sorted when a prefix query needs it
+        self._terms = []
+        self._terms_sorted = True
+        self._lengths = array("I")
+        self._channels = array("I")
+        self._channel_ids = {}
+        self._total_length = 0
+        self._documents = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._documents
+
+    def add(self, doc, text, channel_id):
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        length = sum(counts.values())
+        with self._lock:
+            if doc < len(self._lengths):
+                raise ValueError(f"document {doc} added after {len(self._lengths) - 1}")
+            channel = self._channel_ids.setdefault(channel_id, len(self._channel_ids))
+            missing = doc - len(self._lengths)
+            self._lengths.extend([0] * missing)
+            self._channels.extend([0] * missing)
+            self._lengths.append(min(length, 0xFFFFFFFF))
+            self._channels.append(channel)
+            self._total_length += length
+            self._documents += 1
+            for term, tf in counts.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = _Postings()
+                    self._terms.append(term)
+                    self._terms_sorted = False
+                postings.append(doc, tf)
+
+    def _expand(self, prefix):
+        # Terms starting with prefix, most frequent first. Caller holds the
+        # lock.
+        if not self._terms_sorted:
+            # New terms are appended after a sorted run, which sort() merges
+            self._terms.sort()
+            self._terms_sorted = True
+        start = bisect.bisect_left(self._terms, prefix)
+        matches = []
+        for term in self._terms[start:start + MAX_PREFIX_SCAN]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        matches.sort(key=lambda term: self._postings[term].count, reverse=True)
+        return matches[:MAX_PREFIX_TERMS]
+
+    def search(self, query, channel_id=None, limit=20, offset=0, prefix=True):
+        # Returns (total candidates ranked, [(doc, score), ...] for the page)
+        tokens = tokenize(query)[:MAX_QUERY_TERMS]
+        if not tokens:
+            return 0, []
+        with self._lock:
+            channel = None
+            if channel_id is not None:
+                channel = self._channel_ids.get(channel_id)
+                if channel is None:
+                    return 0, []
+            # Each clause is a list of alternative terms; a document must match
+            # one term of every clause
+            clauses = [[token] for token in tokens]
+            if prefix and len(tokens[-1]) >= MIN_PREFIX_LENGTH:
+                clauses[-1] = self._expand(tokens[-1])
+            cursors = []
+            for clause in clauses:
+                alternatives = [_TermCursor(self._postings[term]) for term in clause if term in self._postings]
+                if not alternatives:
+                    return 0, []
+                cursors.append(alternatives)
+            documents = self._documents
+            average_length = self._total_length / documents if documents else 1.0
+            idf = [[math.log(1 + (documents - c.postings.count + 0.5) / (c.postings.count + 0.5))
+                    for c in alternatives] for alternatives in cursors]
+            driver = min(range(len(cursors)), key=lambda i: sum(c.postings.count for c in cursors[i]))
+            scored = []
+            for doc, driver_tf, driver_term in self._candidates(cursors[driver], channel):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc] / average_length)
+                score = idf[driver][driver_term] * driver_tf * (BM25_K1 + 1) / (driver_tf + norm)
+                for clause, (alternatives, weights) in enumerate(zip(cursors, idf)):
+                    if clause == driver:
+                        continue
+                    best = 0.0
+                    for cursor, weight in zip(alternatives, weights):
+                        tf = cursor.tf(doc)
+                        if tf:
+                            best = max(best, weight * tf * (BM25_K1 + 1) / (tf + norm))
+                    if not best:
+                        break
+                    score += best
+                else:
+                    scored.append((score, doc))
+        scored.sort(reverse=True)
+        page = scored[offset:offset + limit]
+        return len(scored), [(doc, round(score, 4)) for score, doc in page]
+
+    def _candidates(self, driver, channel):
+        # The newest (doc, tf, term) of the cheapest clause, optionally in one
+        # channel. Blocks of all alternatives are decoded newest first and
+        # decoding stops once no remaining block can hold a newer document
+        # than the ones collected.
+        channels = self._channels
+        blocks = []
+        for term, cursor in enumerate(driver):
+            last = len(cursor.postings.block_docs) - 1
+            if last >= 0:
+                blocks.append((-cursor.postings.block_end(last), term, last))
+        heapq.heapify(blocks)
+        found = {}
+        # Min-heap of the MAX_CANDIDATES newest documents found so far
+        newest = []
+        scanned = 0
+        while blocks and scanned < MAX_SCANNED:
+            if len(newest) == MAX_CANDIDATES and -blocks[0][0] < newest[0]:
+                break
+            _, term, block = heapq.heappop(blocks)
+            postings = driver[term].postings
+            entries = postings.decode_block(block)
+            scanned += len(entries)
+            for doc, tf in entries:
+                if (channel is None or channels[doc] == channel) and doc not in found:
+                    found[doc] = (doc, tf, term)
+                    if len(newest) < MAX_CANDIDATES:
+                        heapq.heappush(newest, doc)
+                    elif doc > newest[0]:
+                        heapq.heapreplace(newest, doc)
+            if block > 0:
+                heapq.heappush(blocks, (-postings.block_end(block - 1), term, block - 1))
+        return sorted(found.values(), reverse=True)[:MAX_CANDIDATES]
@@ -1,28 +1,49 @@
 #!/usr/bin/env python3
 import os
+import hmac
 import http.server
-import socketserver
 from http import HTTPStatus
 import json
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+
+import channel_index
+import access_log
+import cluster
+import debug
+import message_log
+import metrics
+import page_cache
+import postgrest
+import profile_cache
+import ratelimit
+import reactions
+import search_index
+import serving
+import sessions
+import unread_counts
+import websocket_hub
 
 # Get Supabase environment variables
 supabase_url = os.environ.get('SUPABASE_URL', 'Not set')
 supabase_key_status = 'Set' if os.environ.get('SUPABASE_KEY') else 'Not set'
 
-# Session status variable (would be managed by cookies in a real app)
-session_active = False
+# Supabase REST client (see postgrest.py), or None to serve the demo data
+upstream = postgrest.from_environment()
 
-# Print environment variables for debugging
-print("Environment variables:")
-print(f"SUPABASE_URL: {supabase_url}")
-if os.environ.get('SUPABASE_KEY'):
-    print("SUPABASE_KEY: [Set but not displayed for security]")
-else:
-    print("SUPABASE_KEY: Not set")
+# Columns of a profile listed with messages
+PROFILE_COLUMNS = ("id", "username", "avatar_url")
+# Ids per upstream request for profiles, keeping URLs short
+PROFILE_BATCH = 100
+# Shared secret for POST /api/hooks/profiles; the hook is off without it
+PROFILE_WEBHOOK_SECRET = os.environ.get("PROFILE_WEBHOOK_SECRET")
 
-print("\nSupabaseChat app information:")
-print("This is a server displaying information about the Swift Supabase chat project")
-print("See README.md for more information about this project")
+# Login sessions, one per browser (see sessions.py); a session's data is
+# the time it logged in
+session_store = sessions.SessionStore()
 
 # Mock data to simulate the app functionality
 def get_mock_data():
@@ -42,797 +63,1333 @@ def get_mock_data():
         ]
     }
 
-class SupabaseChatHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def do_GET(self):
-        global session_active
-        
-        if self.path == "/api/data":
-            self.send_response(HTTPStatus.OK)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-            data = get_mock_data()
-            self.wfile.write(json.dumps(data).encode())
-            return
-        
-        elif self.path == "/api/login":
-            # Toggle login status
-            session_active = True
-            self.send_response(HTTPStatus.OK)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"status": "success", "logged_in": True}).encode())
-            return
+# On-disk message store (see message_log.py), opened on first use
+MESSAGE_LOG_DIR = os.environ.get(
+    'MESSAGE_LOG_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "messages"))
+# Most recent messages returned by /api/data
+DATA_MESSAGE_LIMIT = 500
+MAX_MESSAGE_LENGTH = 2000
+MAX_BODY_BYTES = 64 * 1024
+
+# The demo has no credentials: /api/login signs a browser in as this user,
+# and writes are made as the session's user
+DEMO_USER_ID = "user1"
+
+# Page size limits for /api/channels/{id}/messages
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Page size limits for /api/search
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Read receipts (user_id, channel_id, message_id, number), kept in a log of
+# their own next to the messages and replayed on startup
+RECEIPTS_DIR = os.path.join(MESSAGE_LOG_DIR, "receipts")
+
+# Reaction changes (["add", message id, channel id, user id, reaction] or
+# ["remove", message id, user id, reaction], see reactions.py), kept in a
+# log of their own and replayed on startup
+REACTIONS_DIR = os.path.join(MESSAGE_LOG_DIR, "reactions")
+MAX_REACTION_LENGTH = 32
+
+# Limits for /api/reactions/hottest
+DEFAULT_HOTTEST_LIMIT = 10
+MAX_HOTTEST_LIMIT = 100
+
+_message_log = None
+_channel_index = None
+_search_index = None
+_unread_counts = None
+_receipt_log = None
+_reactions = None
+_reaction_log = None
+# Reaction changes are applied and logged one at a time, so the log replays
+# them in order
+_reactions_lock = threading.Lock()
+# Offsets below this one are in the indexes
+_indexed = 0
+_message_log_lock = threading.Lock()
+# Messages this process appended that are not indexed yet, by offset:
+# concurrent appends finish (group commit) in any order, so each is indexed
+# once every earlier one has been
+_unindexed = {}
+
+# --workers mode (see cluster.py): the owner process is the only writer of the
+# message log and holds the sessions; workers open the log read-only, send
+# new messages and session changes to the owner, index (and broadcast over
+# /ws) the messages it reports and keep session_store a replica of its
+# sessions. Profile changes from the webhook, read receipts and reactions go
+# through the owner too, so they reach every worker.
+_cluster = None
+
+class _OwnerSessions:
+    # Stands in for session_store in a worker: changes are made by the owner,
+    # and are in this worker's replica by the time a call returns
+    def get(self, session_id):
+        data, due = session_store.lookup(session_id)
+        if due:
+            try:
+                _cluster.call("sessions.touch", session_id)
+            except cluster.OwnerUnavailable:
+                # Renewed on a later request
+                pass
+        return data
+
+    def create(self, data):
+        return _cluster.call("sessions.create", data)
+
+    def delete(self, session_id):
+        return _cluster.call("sessions.delete", session_id)
+
+session_updates = session_store
+
+def open_message_log():
+    log = message_log.MessageLog(MESSAGE_LOG_DIR)
+    if len(log) == 0:
+        # Start a fresh store with the project's latest messages, or the
+        # demo conversation
+        log.append_batch(initial_messages())
+    return log
+
+def initial_messages():
+    if upstream is not None:
+        try:
+            return [{"id": str(row["id"]), "user_id": str(row["user_id"]), "content": row["content"],
+                     "created_at": row["created_at"]} for row in upstream.recent_messages(DATA_MESSAGE_LIMIT)]
+        except (postgrest.UpstreamUnavailable, postgrest.UpstreamError) as error:
+            print(f"Could not load messages from Supabase ({error}); starting with the demo conversation")
+    return get_mock_data()["messages"]
+
+def get_message_log():
+    global _message_log, _channel_index, _search_index, _unread_counts, _receipt_log, _reactions, _reaction_log
+    global _indexed
+    with _message_log_lock:
+        if _message_log is None:
+            if _cluster is not None:
+                # Records appear as the owner reports them (_apply_messages)
+                log = message_log.MessageLog(MESSAGE_LOG_DIR, readonly=True)
+            else:
+                log = open_message_log()
+            # History and search indexes and unread counts, rebuilt from the
+            # log on startup
+            history = channel_index.ChannelIndex()
+            search = search_index.SearchIndex()
+            unread = unread_counts.UnreadCounts()
+            _reactions = reactions.ReactionIndex()
+            _indexed = len(log)
+            index_messages(log, history, search, unread, 0, _indexed)
+            if _cluster is None:
+                # Receipts and reactions come from the owner in --workers mode
+                receipts = message_log.MessageLog(RECEIPTS_DIR, fsync=False)
+                for _, receipt in receipts.scan():
+                    apply_receipt(unread, receipt)
+                _receipt_log = receipts
+                _reaction_log = message_log.MessageLog(REACTIONS_DIR, fsync=False)
+                for _, change in _reaction_log.scan():
+                    _reactions.apply(change)
+            _message_log, _channel_index, _search_index, _unread_counts = log, history, search, unread
+        return _message_log
+
+def index_message(history, search, offset, message):
+    history.add_message(offset, message)
+    search.add(offset, message["content"], message.get("channel_id", channel_index.DEFAULT_CHANNEL))
+
+# Indexes the log's records [start, end); the unread counts of a large range
+# are counted by other processes meanwhile (see unread_counts.py)
+def index_messages(log, history, search, unread, start, end):
+    counted = unread.count_log(log, start, end)
+    for offset, message in log.scan(start, end):
+        index_message(history, search, offset, message)
+        if counted is None:
+            unread.add_message(message)
+    if counted is not None:
+        counted()
+
+def apply_receipt(unread, receipt):
+    try:
+        unread.mark_read(receipt["user_id"], receipt["channel_id"], receipt["message_id"])
+    except ValueError:
+        # Its message is not in this log
+        pass
+
+def get_channel_index():
+    get_message_log()
+    return _channel_index
+
+def get_search_index():
+    get_message_log()
+    return _search_index
+
+def get_unread_counts():
+    get_message_log()
+    return _unread_counts
+
+def get_reactions():
+    get_message_log()
+    return _reactions
+
+# Moves the user's read receipt for the channel up to the message; returns
+# the channel's unread count. Raises ValueError if the message is not in the
+# channel.
+def mark_read(user_id, channel_id, message_id):
+    unread = get_unread_counts()
+    receipt = {"user_id": user_id, "channel_id": channel_id, "message_id": message_id,
+               "number": unread.position(channel_id, message_id)}
+    if _cluster is not None:
+        # In this worker's counts by the time the call returns
+        _cluster.call("receipts.mark", receipt)
+    else:
+        _receipt_log.append(receipt)
+        unread.advance(user_id, channel_id, receipt["number"])
+    return unread.unread(user_id)[channel_id]
+
+# Adds or removes a reaction (a change as in reactions.py); returns the
+# message's summary with the user's own reactions. Adding raises ValueError
+# if the message is not in the channel.
+def change_reaction(change):
+    index = get_reactions()
+    if change[0] == "add":
+        get_unread_counts().position(change[2], change[1])
+    if _cluster is not None:
+        # In this worker's index by the time the call returns
+        _cluster.call("reactions.change", change)
+    else:
+        with _reactions_lock:
+            changed = index.apply(change)
+            if changed:
+                _reaction_log.append(change)
+        if changed:
+            publish_reactions(index, change[1])
+    return index.summary(change[1], change[-2])  # the user's
+
+# Sends a message's new reaction counts to the /ws clients
+def publish_reactions(index, message_id):
+    chat_hub.publish(dict(index.summary(message_id), type="reactions", message_id=message_id))
+
+def search_messages(query, channel_id=None, limit=DEFAULT_SEARCH_LIMIT, offset=0):
+    total, hits = get_search_index().search(query, channel_id, limit, offset)
+    log = get_message_log()
+    next_offset = offset + len(hits)
+    results = [{"message": log.read(doc), "score": score} for doc, score in hits]
+    return {
+        "query": query,
+        "total": total,
+        "results": results,
+        "users": get_authors(result["message"] for result in results),
+        "next_offset": next_offset if next_offset < total else None,
+    }
+
+def get_channel_page(channel_id, before=None, limit=DEFAULT_PAGE_SIZE):
+    offsets, next_cursor = get_channel_index().page(channel_id, before, limit)
+    log = get_message_log()
+    messages = [log.read(offset) for offset in offsets]
+    return {
+        "channel_id": channel_id,
+        "messages": messages,
+        "users": get_authors(messages),
+        "next_cursor": next_cursor,
+    }
+
+# Loads profiles for the cache: the project's, or the demo users
+def load_profiles(ids):
+    if upstream is None:
+        demo = {user["id"]: user for user in get_mock_data()["users"]}
+        return {user_id: demo[user_id] for user_id in ids if user_id in demo}
+    found = {}
+    for start in range(0, len(ids), PROFILE_BATCH):
+        for row in upstream.profiles(ids[start:start + PROFILE_BATCH], columns=",".join(PROFILE_COLUMNS)):
+            found[row["id"]] = row
+    return found
+
+# Authors' profiles, for every response that lists messages (see
+# profile_cache.py)
+profiles = profile_cache.ProfileCache(load_profiles)
+
+# The profiles of the messages' authors, each listed once
+def get_authors(messages):
+    found = profiles.get_many(message["user_id"] for message in messages)
+    return [profile for profile in found.values() if profile is not None]
+
+# ["put", profile] or ["delete", id] for a Supabase database webhook payload
+# on the profiles table; raises ValueError/KeyError/TypeError on bad input
+def profile_change(payload):
+    if payload.get("table") != "profiles":
+        raise ValueError("not a change to profiles")
+    if payload["type"] == "DELETE":
+        return ["delete", str(payload["old_record"]["id"])]
+    if payload["type"] not in ("INSERT", "UPDATE"):
+        raise ValueError(f"unknown change type {payload['type']!r}")
+    record = payload["record"]
+    return ["put", dict({column: record.get(column) for column in PROFILE_COLUMNS}, id=str(record["id"]))]
+
+def get_chat_data():
+    messages = get_message_log().tail(DATA_MESSAGE_LIMIT)
+    return {
+        "users": get_authors(messages),
+        "messages": messages,
+    }
+
+# Validates, stores and returns a new message from `user_id` (the sender's
+# session user); raises ValueError/KeyError/TypeError on bad input
+def create_message(data, user_id):
+    content = str(data["content"]).strip()
+    if not content:
+        raise ValueError("content must not be empty")
+    message = {
+        "id": f"msg-{uuid.uuid4().hex}",
+        "user_id": user_id,
+        "channel_id": str(data.get("channel_id", channel_index.DEFAULT_CHANNEL)),
+        "content": content[:MAX_MESSAGE_LENGTH],
+        "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+    if _cluster is not None:
+        _cluster.call("messages.append", message)
+        return message
+    offset = get_message_log().append(message)
+    indexed = index_appended(offset, message)
+    for ready in indexed:
+        chat_hub.publish({"type": "message", "message": ready})
+    return message
+
+# Indexes and counts as unread a message appended at `offset`, and any
+# appended after it that were waiting for it, in log order (which unread
+# numbering depends on too); returns the messages indexed
+def index_appended(offset, message):
+    global _indexed
+    indexed = []
+    with _message_log_lock:
+        _unindexed[offset] = message
+        while _indexed in _unindexed:
+            message = _unindexed.pop(_indexed)
+            index_message(_channel_index, _search_index, _indexed, message)
+            _unread_counts.add_message(message)
+            indexed.append(message)
+            _indexed += 1
+    return indexed
+
+# Stores a chat message received over /ws from the connection whose cookie
+# carried `session_id`; create_message() broadcasts it to every client. The
+# session is looked up per message, so logging out stops the socket writing.
+def build_chat_event(text, session_id):
+    data = json.loads(text)
+    if not str(data["content"]).strip():
+        return None
+    session = session_updates.get(session_id) if session_id is not None else None
+    if session is None:
+        raise PermissionError("log in first")
+    if "user_id" in data and str(data["user_id"]) != session["user_id"]:
+        raise PermissionError("user_id is not the logged-in user")
+    create_message(data, session["user_id"])
+    return None
+
+# Realtime hub behind /ws
+chat_hub = websocket_hub.BroadcastHub(on_message=build_chat_event)
+
+# Served on /metrics with the request metrics (see metrics.py); read when scraped
+metrics.REGISTRY.gauge("websocket_clients", "Open /ws connections.", function=chat_hub.client_count)
+metrics.REGISTRY.counter("websocket_broadcasts_total", "Messages fanned out to /ws clients.",
+                         function=lambda: chat_hub.broadcasts)
+metrics.REGISTRY.counter("websocket_slow_consumers_total", "/ws clients that fell too far behind.",
+                         function=lambda: chat_hub.slow_consumers)
+metrics.REGISTRY.gauge("sessions_active", "Login sessions held, expired ones included until dropped.",
+                       function=lambda: len(session_store))
+metrics.REGISTRY.counter("sessions_evicted_total", "Sessions evicted to make room for new ones.",
+                         function=lambda: session_store.evicted)
+metrics.REGISTRY.gauge("chat_log_messages", "Messages in the message log.",
+                       function=lambda: len(_message_log) if _message_log is not None else 0)
+metrics.REGISTRY.gauge("reactions", "Reactions held, one per message, user and reaction.",
+                       function=lambda: _reactions.rows if _reactions is not None else 0)
+metrics.REGISTRY.gauge("reacted_messages", "Messages with at least one reaction.",
+                       function=lambda: len(_reactions) if _reactions is not None else 0)
+metrics.REGISTRY.gauge("profile_cache_entries", "Profiles cached, unknown ids included.", function=lambda: len(profiles))
+metrics.REGISTRY.gauge("profile_cache_bytes", "Approximate memory held by cached profiles.",
+                       function=lambda: profiles.bytes)
+metrics.REGISTRY.gauge("profile_cache_hit_ratio", "Profile lookups answered from the cache, fresh or stale.",
+                       function=lambda: profiles.hit_ratio)
+metrics.REGISTRY.counter("profile_cache_hits_total", "Profile lookups answered fresh from the cache.",
+                         function=lambda: profiles.hits)
+metrics.REGISTRY.counter("profile_cache_stale_hits_total", "Profile lookups answered stale while reloading.",
+                         function=lambda: profiles.stale_hits)
+metrics.REGISTRY.counter("profile_cache_misses_total", "Profile lookups that waited for a load.",
+                         function=lambda: profiles.misses)
+metrics.REGISTRY.counter("profile_cache_evictions_total", "Profiles evicted to make room for new ones.",
+                         function=lambda: profiles.evictions)
+metrics.REGISTRY.counter("profile_cache_load_errors_total", "Profile loads that failed.",
+                         function=lambda: profiles.load_errors)
+
+# Requests per second, burst and client key of rate-limited routes (see
+# ratelimit.py; RATE_LIMITS overrides them)
+RATE_LIMITS = {
+    "/api/login": (1, 10, "ip"),
+    "/api/logout": (1, 10, "ip"),
+    "/api/messages": (5, 30, "session"),
+}
+rate_limiter = ratelimit.from_environment(RATE_LIMITS, lambda handler: sessions.session_id_from(handler.headers))
+
+# Route labels for metrics; any other path gets the landing page
+METRICS_ROUTES = frozenset(("/", "/api/data", "/api/login", "/api/logout", "/api/status", "/api/search",
+                            "/api/messages", "/api/unread", "/api/read", "/api/reactions", "/api/reactions/hottest",
+                            "/api/hooks/profiles", "/ws", "/metrics", "/debug/profile", "/debug/heap"))
+
+def render_landing_page():
+    # Create status classes for the HTML
+    supabase_url_status_class = "status-success" if supabase_url != "Not set" else "status-warning"
+    supabase_key_status_class = "status-success" if supabase_key_status == "Set" else "status-warning"
+    
+    # Create HTML content
+    html = f"""
+    <!DOCTYPE html>
+    <html lang="en">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>SupabaseChat - SwiftUI App</title>
+        <style>
+            :root {{
+                --primary-color: #007AFF;
+                --secondary-color: #5AC8FA;
+                --success-color: #34C759;
+                --warning-color: #FF9500;
+                --error-color: #FF3B30;
+                --background-color: #F2F2F7;
+                --card-background: #FFFFFF;
+                --text-primary: #1C1C1E;
+                --text-secondary: #8E8E93;
+                --border-radius: 10px;
+                --spacing: 20px;
+                --header-height: 60px;
+            }}
             
-        elif self.path == "/api/logout":
-            # Toggle login status
-            session_active = False
-            self.send_response(HTTPStatus.OK)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"status": "success", "logged_in": False}).encode())
-            return
+            * {{
+                box-sizing: border-box;
+                margin: 0;
+                padding: 0;
+            }}
             
-        elif self.path == "/api/status":
-            # Return current login status
-            self.send_response(HTTPStatus.OK)
-            self.send_header("Content-type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"logged_in": session_active}).encode())
-            return
-        
-        self.send_response(HTTPStatus.OK)
-        self.send_header("Content-type", "text/html")
-        self.end_headers()
-        
-        # Create status classes for the HTML
-        supabase_url_status_class = "status-success" if supabase_url != "Not set" else "status-warning"
-        supabase_key_status_class = "status-success" if supabase_key_status == "Set" else "status-warning"
-        
-        # Create HTML content
-        html = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>SupabaseChat - SwiftUI App</title>
-            <style>
-                :root {{
-                    --primary-color: #007AFF;
-                    --secondary-color: #5AC8FA;
-                    --success-color: #34C759;
-                    --warning-color: #FF9500;
-                    --error-color: #FF3B30;
-                    --background-color: #F2F2F7;
-                    --card-background: #FFFFFF;
-                    --text-primary: #1C1C1E;
-                    --text-secondary: #8E8E93;
-                    --border-radius: 10px;
-                    --spacing: 20px;
-                    --header-height: 60px;
-                }}
-                
-                * {{
-                    box-sizing: border-box;
-                    margin: 0;
-                    padding: 0;
-                }}
-                
-                body {{
-                    font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif;
-                    line-height: 1.6;
-                    color: var(--text-primary);
-                    background-color: var(--background-color);
-                    padding: 0;
-                    margin: 0;
-                    overflow-x: hidden;
-                }}
-                
-                .container {{
-                    max-width: 1200px;
-                    margin: 0 auto;
-                    padding: 0 var(--spacing);
-                    width: 100%;
-                    box-sizing: border-box;
-                }}
-                
-                header {{
-                    background-color: var(--primary-color);
-                    color: white;
-                    padding: var(--spacing);
-                    position: sticky;
-                    top: 0;
-                    z-index: 100;
-                    box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-                }}
-                
-                header h1 {{
-                    margin: 0;
-                    font-size: 1.8rem;
-                }}
-                
-                .header-content {{
-                    display: flex;
-                    justify-content: space-between;
-                    align-items: center;
-                }}
-                
-                .user-status {{
-                    display: flex;
-                    align-items: center;
-                    font-size: 0.9rem;
-                }}
-                
-                #logged-out-state, #logged-in-state {{
-                    display: flex;
-                    align-items: center;
-                    gap: 8px;
-                }}
-                
-                .status-indicator {{
-                    width: 10px;
-                    height: 10px;
-                    border-radius: 50%;
-                    display: inline-block;
-                }}
-                
-                .status-indicator.online {{
-                    background-color: #4CAF50;
-                    box-shadow: 0 0 5px #4CAF50;
-                }}
-                
-                .status-indicator.offline {{
-                    background-color: #f44336;
-                }}
-                
-                .username {{
-                    font-weight: bold;
-                    color: #fff;
-                }}
-                
-                .avatar-small {{
-                    width: 24px;
-                    height: 24px;
-                    border-radius: 50%;
-                    overflow: hidden;
-                    margin-left: 5px;
-                }}
-                
-                .avatar-small img {{
-                    width: 100%;
-                    height: 100%;
-                    object-fit: cover;
-                }}
-                
-                .login-button, .logout-button {{
-                    background-color: rgba(255, 255, 255, 0.2);
-                    color: white;
-                    border: none;
-                    padding: 5px 10px;
-                    border-radius: 4px;
-                    cursor: pointer;
-                    font-size: 0.8rem;
-                    transition: background-color 0.2s;
-                    margin-left: 8px;
-                }}
-                
-                .login-button:hover, .logout-button:hover {{
-                    background-color: rgba(255, 255, 255, 0.3);
-                }}
-                
+            body {{
+                font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif;
+                line-height: 1.6;
+                color: var(--text-primary);
+                background-color: var(--background-color);
+                padding: 0;
+                margin: 0;
+                overflow-x: hidden;
+            }}
+            
+            .container {{
+                max-width: 1200px;
+                margin: 0 auto;
+                padding: 0 var(--spacing);
+                width: 100%;
+                box-sizing: border-box;
+            }}
+            
+            header {{
+                background-color: var(--primary-color);
+                color: white;
+                padding: var(--spacing);
+                position: sticky;
+                top: 0;
+                z-index: 100;
+                box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+            }}
+            
+            header h1 {{
+                margin: 0;
+                font-size: 1.8rem;
+            }}
+            
+            .header-content {{
+                display: flex;
+                justify-content: space-between;
+                align-items: center;
+            }}
+            
+            .user-status {{
+                display: flex;
+                align-items: center;
+                font-size: 0.9rem;
+            }}
+            
+            #logged-out-state, #logged-in-state {{
+                display: flex;
+                align-items: center;
+                gap: 8px;
+            }}
+            
+            .status-indicator {{
+                width: 10px;
+                height: 10px;
+                border-radius: 50%;
+                display: inline-block;
+            }}
+            
+            .status-indicator.online {{
+                background-color: #4CAF50;
+                box-shadow: 0 0 5px #4CAF50;
+            }}
+            
+            .status-indicator.offline {{
+                background-color: #f44336;
+            }}
+            
+            .username {{
+                font-weight: bold;
+                color: #fff;
+            }}
+            
+            .avatar-small {{
+                width: 24px;
+                height: 24px;
+                border-radius: 50%;
+                overflow: hidden;
+                margin-left: 5px;
+            }}
+            
+            .avatar-small img {{
+                width: 100%;
+                height: 100%;
+                object-fit: cover;
+            }}
+            
+            .login-button, .logout-button {{
+                background-color: rgba(255, 255, 255, 0.2);
+                color: white;
+                border: none;
+                padding: 5px 10px;
+                border-radius: 4px;
+                cursor: pointer;
+                font-size: 0.8rem;
+                transition: background-color 0.2s;
+                margin-left: 8px;
+            }}
+            
+            .login-button:hover, .logout-button:hover {{
+                background-color: rgba(255, 255, 255, 0.3);
+            }}
+            
+            .main-content {{
+                display: grid;
+                grid-template-columns: 1fr 2fr;
+                gap: var(--spacing);
+                padding: var(--spacing) 0;
+                width: 100%;
+                box-sizing: border-box;
+                overflow: hidden;
+            }}
+            
+            @media (max-width: 768px) {{
                 .main-content {{
-                    display: grid;
-                    grid-template-columns: 1fr 2fr;
-                    gap: var(--spacing);
-                    padding: var(--spacing) 0;
-                    width: 100%;
-                    box-sizing: border-box;
-                    overflow: hidden;
-                }}
-                
-                @media (max-width: 768px) {{
-                    .main-content {{
-                        grid-template-columns: 1fr;
-                    }}
-                }}
-                
-                .sidebar {{
-                    position: sticky;
-                    top: calc(var(--header-height) + var(--spacing));
-                    height: min-content;
-                    max-width: 100%;
-                    box-sizing: border-box;
-                }}
-                
-                .content {{
-                    width: 100%;
-                    box-sizing: border-box;
-                    overflow: hidden;
-                }}
-                
-                .card {{
-                    background-color: var(--card-background);
-                    border-radius: var(--border-radius);
-                    padding: var(--spacing);
-                    margin-bottom: var(--spacing);
-                    box-shadow: 0 2px 10px rgba(0,0,0,0.05);
-                }}
-                
-                .card h2 {{
-                    color: var(--primary-color);
-                    margin-bottom: 15px;
-                    font-size: 1.3rem;
-                    display: flex;
-                    align-items: center;
-                }}
-                
-                .card h2 i {{
-                    margin-right: 10px;
-                }}
-                
-                ul, ol {{
-                    padding-left: 25px;
-                    margin: 10px 0;
-                }}
-                
-                li {{
-                    margin-bottom: 8px;
-                }}
-                
-                a {{
-                    color: var(--primary-color);
-                    text-decoration: none;
-                }}
-                
-                a:hover {{
-                    text-decoration: underline;
-                }}
-                
-                code {{
-                    background-color: #eaeaea;
-                    padding: 2px 4px;
-                    border-radius: 4px;
-                    font-family: Menlo, Monaco, "Courier New", monospace;
-                }}
-                
-                .button {{
-                    background-color: var(--primary-color);
-                    color: white;
-                    border: none;
-                    padding: 10px 20px;
-                    border-radius: 6px;
-                    font-weight: bold;
-                    text-decoration: none;
-                    display: inline-block;
-                    margin-top: 10px;
-                    cursor: pointer;
-                    transition: background-color 0.2s;
-                }}
-                
-                .button:hover {{
-                    background-color: #005ecb;
-                }}
-                
-                .status {{
-                    display: inline-block;
-                    padding: 5px 10px;
-                    border-radius: 4px;
-                    font-weight: bold;
-                }}
-                
-                .status-success {{
-                    background-color: var(--success-color);
-                    color: white;
-                }}
-                
-                .status-warning {{
-                    background-color: var(--warning-color);
-                    color: white;
-                }}
-                
-                /* Chat Demo UI */
-                .chat-demo {{
-                    display: flex;
-                    flex-direction: column;
-                    height: 550px;
-                    border-radius: var(--border-radius);
-                    overflow: hidden;
-                    border: 1px solid #E5E5EA;
-                }}
-                
-                .chat-header {{
-                    background-color: var(--primary-color);
-                    color: white;
-                    padding: 15px;
-                    display: flex;
-                    align-items: center;
-                }}
-                
-                .chat-header h3 {{
-                    margin: 0;
-                }}
-                
-                .chat-messages {{
-                    flex: 1;
-                    padding: 15px;
-                    overflow-y: auto;
-                    background-color: #F7F7FC;
-                    display: flex;
-                    flex-direction: column;
-                }}
-                
-                .message {{
-                    max-width: 80%;
-                    margin-bottom: 15px;
-                    position: relative;
-                    animation: fadeIn 0.3s ease-out, scaleIn 0.2s ease-out;
-                    display: flex;
-                    flex-direction: row;
-                    align-items: flex-start;
-                }}
-                
-                .message-avatar {{
-                    width: 36px;
-                    height: 36px;
-                    border-radius: 50%;
-                    margin-right: 8px;
-                    background-color: #E5E5EA;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                    font-weight: bold;
-                    color: white;
-                    font-size: 14px;
-                    flex-shrink: 0;
-                    overflow: hidden;
-                }}
-                
-                .message-avatar img {{
-                    width: 100%;
-                    height: 100%;
-                    object-fit: cover;
-                }}
-                
-                .message-content-wrapper {{
-                    display: flex;
-                    flex-direction: column;
-                }}
-                
-                .message-bubble {{
-                    padding: 10px 15px;
-                    border-radius: 18px;
-                    word-break: break-word;
-                    max-width: 100%;
-                }}
-                
-                @keyframes fadeIn {{
-                    from {{ opacity: 0; }}
-                    to {{ opacity: 1; }}
-                }}
-                
-                @keyframes scaleIn {{
-                    from {{ transform: scale(0.9); }}
-                    to {{ transform: scale(1); }}
-                }}
-                
-                @keyframes bounce {{
-                    0%, 100% {{ transform: translateY(0); }}
-                    50% {{ transform: translateY(-10px); }}
-                }}
-                
-                .message.sent {{
-                    align-self: flex-end;
-                    flex-direction: row-reverse;
+                    grid-template-columns: 1fr;
                 }}
+            }}
+            
+            .sidebar {{
+                position: sticky;
+                top: calc(var(--header-height) + var(--spacing));
+                height: min-content;
+                max-width: 100%;
+                box-sizing: border-box;
+            }}
+            
+            .content {{
+                width: 100%;
+                box-sizing: border-box;
+                overflow: hidden;
+            }}
+            
+            .card {{
+                background-color: var(--card-background);
+                border-radius: var(--border-radius);
+                padding: var(--spacing);
+                margin-bottom: var(--spacing);
+                box-shadow: 0 2px 10px rgba(0,0,0,0.05);
+            }}
+            
+            .card h2 {{
+                color: var(--primary-color);
+                margin-bottom: 15px;
+                font-size: 1.3rem;
+                display: flex;
+                align-items: center;
+            }}
+            
+            .card h2 i {{
+                margin-right: 10px;
+            }}
+            
+            ul, ol {{
+                padding-left: 25px;
+                margin: 10px 0;
+            }}
+            
+            li {{
+                margin-bottom: 8px;
+            }}
+            
+            a {{
+                color: var(--primary-color);
+                text-decoration: none;
+            }}
+            
+            a:hover {{
+                text-decoration: underline;
+            }}
+            
+            code {{
+                background-color: #eaeaea;
+                padding: 2px 4px;
+                border-radius: 4px;
+                font-family: Menlo, Monaco, "Courier New", monospace;
+            }}
+            
+            .button {{
+                background-color: var(--primary-color);
+                color: white;
+                border: none;
+                padding: 10px 20px;
+                border-radius: 6px;
+                font-weight: bold;
+                text-decoration: none;
+                display: inline-block;
+                margin-top: 10px;
+                cursor: pointer;
+                transition: background-color 0.2s;
+            }}
+            
+            .button:hover {{
+                background-color: #005ecb;
+            }}
+            
+            .status {{
+                display: inline-block;
+                padding: 5px 10px;
+                border-radius: 4px;
+                font-weight: bold;
+            }}
+            
+            .status-success {{
+                background-color: var(--success-color);
+                color: white;
+            }}
+            
+            .status-warning {{
+                background-color: var(--warning-color);
+                color: white;
+            }}
+            
+            /* Chat Demo UI */
+            .chat-demo {{
+                display: flex;
+                flex-direction: column;
+                height: 550px;
+                border-radius: var(--border-radius);
+                overflow: hidden;
+                border: 1px solid #E5E5EA;
+            }}
+            
+            .chat-header {{
+                background-color: var(--primary-color);
+                color: white;
+                padding: 15px;
+                display: flex;
+                align-items: center;
+            }}
+            
+            .chat-header h3 {{
+                margin: 0;
+            }}
+            
+            .chat-messages {{
+                flex: 1;
+                padding: 15px;
+                overflow-y: auto;
+                background-color: #F7F7FC;
+                display: flex;
+                flex-direction: column;
+            }}
+            
+            .message {{
+                max-width: 80%;
+                margin-bottom: 15px;
+                position: relative;
+                animation: fadeIn 0.3s ease-out, scaleIn 0.2s ease-out;
+                display: flex;
+                flex-direction: row;
+                align-items: flex-start;
+            }}
+            
+            .message-avatar {{
+                width: 36px;
+                height: 36px;
+                border-radius: 50%;
+                margin-right: 8px;
+                background-color: #E5E5EA;
+                display: flex;
+                align-items: center;
+                justify-content: center;
+                font-weight: bold;
+                color: white;
+                font-size: 14px;
+                flex-shrink: 0;
+                overflow: hidden;
+            }}
+            
+            .message-avatar img {{
+                width: 100%;
+                height: 100%;
+                object-fit: cover;
+            }}
+            
+            .message-content-wrapper {{
+                display: flex;
+                flex-direction: column;
+            }}
+            
+            .message-bubble {{
+                padding: 10px 15px;
+                border-radius: 18px;
+                word-break: break-word;
+                max-width: 100%;
+            }}
+            
+            @keyframes fadeIn {{
+                from {{ opacity: 0; }}
+                to {{ opacity: 1; }}
+            }}
+            
+            @keyframes scaleIn {{
+                from {{ transform: scale(0.9); }}
+                to {{ transform: scale(1); }}
+            }}
+            
+            @keyframes bounce {{
+                0%, 100% {{ transform: translateY(0); }}
+                50% {{ transform: translateY(-10px); }}
+            }}
+            
+            .message.sent {{
+                align-self: flex-end;
+                flex-direction: row-reverse;
+            }}
 
-                .message.sent .message-avatar {{
-                    margin-right: 0;
-                    margin-left: 8px;
-                }}
-                
-                .message.sent .message-bubble {{
-                    background-color: var(--primary-color);
-                    color: white;
-                    border-bottom-right-radius: 5px;
-                }}
-                
-                .message.received .message-bubble {{
-                    background-color: #E5E5EA;
-                    color: black;
-                    border-bottom-left-radius: 5px;
-                }}
-                
-                .message-info {{
-                    font-size: 0.75rem;
-                    margin-bottom: 5px;
-                    display: flex;
-                    align-items: center;
-                }}
-                
-                .message-info img {{
-                    width: 24px;
-                    height: 24px;
-                    border-radius: 50%;
-                    margin-right: 5px;
-                }}
-                
-                .message-time {{
-                    font-size: 0.7rem;
-                    color: rgba(0,0,0,0.5);
-                    margin-top: 5px;
-                    text-align: right;
-                }}
-                
-                .sent .message-time {{
-                    color: rgba(255,255,255,0.7);
-                }}
-                
-                .chat-input {{
-                    display: flex;
-                    padding: 10px;
-                    background-color: white;
-                    border-top: 1px solid #E5E5EA;
-                }}
-                
-                .chat-input input {{
-                    flex: 1;
-                    border: 1px solid #E5E5EA;
-                    border-radius: 20px;
-                    padding: 8px 15px;
-                    margin-right: 10px;
-                    outline: none;
-                }}
-                
-                .chat-input button {{
-                    background-color: var(--primary-color);
-                    color: white;
-                    border: none;
-                    border-radius: 50%;
-                    width: 40px;
-                    height: 40px;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                    cursor: pointer;
-                    transition: transform 0.2s;
-                }}
-                
-                .chat-input button:hover {{
-                    transform: scale(1.1);
-                }}
-                
-                .chat-input button i {{
-                    font-size: 1.2rem;
-                }}
-                
-                /* Auth Form Demo */
+            .message.sent .message-avatar {{
+                margin-right: 0;
+                margin-left: 8px;
+            }}
+            
+            .message.sent .message-bubble {{
+                background-color: var(--primary-color);
+                color: white;
+                border-bottom-right-radius: 5px;
+            }}
+            
+            .message.received .message-bubble {{
+                background-color: #E5E5EA;
+                color: black;
+                border-bottom-left-radius: 5px;
+            }}
+            
+            .message-info {{
+                font-size: 0.75rem;
+                margin-bottom: 5px;
+                display: flex;
+                align-items: center;
+            }}
+            
+            .message-info img {{
+                width: 24px;
+                height: 24px;
+                border-radius: 50%;
+                margin-right: 5px;
+            }}
+            
+            .message-time {{
+                font-size: 0.7rem;
+                color: rgba(0,0,0,0.5);
+                margin-top: 5px;
+                text-align: right;
+            }}
+            
+            .sent .message-time {{
+                color: rgba(255,255,255,0.7);
+            }}
+            
+            .chat-input {{
+                display: flex;
+                padding: 10px;
+                background-color: white;
+                border-top: 1px solid #E5E5EA;
+            }}
+            
+            .chat-input input {{
+                flex: 1;
+                border: 1px solid #E5E5EA;
+                border-radius: 20px;
+                padding: 8px 15px;
+                margin-right: 10px;
+                outline: none;
+            }}
+            
+            .chat-input button {{
+                background-color: var(--primary-color);
+                color: white;
+                border: none;
+                border-radius: 50%;
+                width: 40px;
+                height: 40px;
+                display: flex;
+                align-items: center;
+                justify-content: center;
+                cursor: pointer;
+                transition: transform 0.2s;
+            }}
+            
+            .chat-input button:hover {{
+                transform: scale(1.1);
+            }}
+            
+            .chat-input button i {{
+                font-size: 1.2rem;
+            }}
+            
+            /* Auth Form Demo */
+            .auth-forms {{
+                display: flex;
+                gap: var(--spacing);
+                margin-top: 30px;
+            }}
+            
+            .auth-form {{
+                flex: 1;
+                background: white;
+                border-radius: var(--border-radius);
+                padding: var(--spacing);
+                box-shadow: 0 2px 10px rgba(0,0,0,0.05);
+            }}
+            
+            .auth-form h3 {{
+                margin-bottom: 15px;
+                color: var(--primary-color);
+                text-align: center;
+            }}
+            
+            .form-group {{
+                margin-bottom: 15px;
+            }}
+            
+            .form-group label {{
+                display: block;
+                margin-bottom: 5px;
+                font-weight: 500;
+            }}
+            
+            .form-group input {{
+                width: 100%;
+                padding: 10px;
+                border: 1px solid #E5E5EA;
+                border-radius: 6px;
+                outline: none;
+            }}
+            
+            .form-group input:focus {{
+                border-color: var(--primary-color);
+            }}
+            
+            .auth-form button {{
+                width: 100%;
+                padding: 12px;
+                background-color: var(--primary-color);
+                color: white;
+                border: none;
+                border-radius: 6px;
+                font-weight: 600;
+                cursor: pointer;
+                transition: background-color 0.2s;
+            }}
+            
+            .auth-form button:hover {{
+                background-color: #005ecb;
+            }}
+            
+            @media (max-width: 768px) {{
                 .auth-forms {{
-                    display: flex;
-                    gap: var(--spacing);
-                    margin-top: 30px;
-                }}
-                
-                .auth-form {{
-                    flex: 1;
-                    background: white;
-                    border-radius: var(--border-radius);
-                    padding: var(--spacing);
-                    box-shadow: 0 2px 10px rgba(0,0,0,0.05);
-                }}
-                
-                .auth-form h3 {{
-                    margin-bottom: 15px;
-                    color: var(--primary-color);
-                    text-align: center;
-                }}
-                
-                .form-group {{
-                    margin-bottom: 15px;
-                }}
-                
-                .form-group label {{
-                    display: block;
-                    margin-bottom: 5px;
-                    font-weight: 500;
-                }}
-                
-                .form-group input {{
-                    width: 100%;
-                    padding: 10px;
-                    border: 1px solid #E5E5EA;
-                    border-radius: 6px;
-                    outline: none;
-                }}
-                
-                .form-group input:focus {{
-                    border-color: var(--primary-color);
-                }}
-                
-                .auth-form button {{
-                    width: 100%;
-                    padding: 12px;
-                    background-color: var(--primary-color);
-                    color: white;
-                    border: none;
-                    border-radius: 6px;
-                    font-weight: 600;
-                    cursor: pointer;
-                    transition: background-color 0.2s;
-                }}
-                
-                .auth-form button:hover {{
-                    background-color: #005ecb;
-                }}
-                
-                @media (max-width: 768px) {{
-                    .auth-forms {{
-                        flex-direction: column;
-                    }}
-                }}
-                
-                /* Animation demos */
-                .animation-demo {{
-                    display: flex;
-                    flex-wrap: wrap;
-                    gap: 20px;
-                    margin-top: 20px;
+                    flex-direction: column;
                 }}
-                
+            }}
+            
+            /* Animation demos */
+            .animation-demo {{
+                display: flex;
+                flex-wrap: wrap;
+                gap: 20px;
+                margin-top: 20px;
+            }}
+            
+            .animation-card {{
+                background-color: white;
+                border-radius: var(--border-radius);
+                padding: 15px;
+                width: calc(50% - 10px);
+                box-shadow: 0 2px 5px rgba(0,0,0,0.05);
+                text-align: center;
+            }}
+            
+            @media (max-width: 600px) {{
                 .animation-card {{
-                    background-color: white;
-                    border-radius: var(--border-radius);
-                    padding: 15px;
-                    width: calc(50% - 10px);
-                    box-shadow: 0 2px 5px rgba(0,0,0,0.05);
-                    text-align: center;
-                }}
-                
-                @media (max-width: 600px) {{
-                    .animation-card {{
-                        width: 100%;
-                    }}
-                }}
-                
-                .animation-card h4 {{
-                    margin-bottom: 10px;
-                    color: var(--primary-color);
-                }}
-                
-                .animation-example {{
-                    height: 100px;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                }}
-                
-                .bounce-animation {{
-                    animation: bounce 2s infinite;
-                }}
-                
-                .pulse-animation {{
-                    animation: pulse 2s infinite;
-                }}
-                
-                @keyframes pulse {{
-                    0% {{ transform: scale(1); }};
-                    50% {{ transform: scale(1.1); }}
-                    100% {{ transform: scale(1); }}
-                }}
-                
-                .scale-animation {{
-                    animation: scale 2s infinite;
-                }}
-                
-                @keyframes scale {{
-                    0% {{ transform: scale(1); opacity: 1; }};
-                    50% {{ transform: scale(0.8); opacity: 0.8; }}
-                    100% {{ transform: scale(1); opacity: 1; }}
-                }}
-                
-                .loading-spinner {{
-                    width: 40px;
-                    height: 40px;
-                    border: 3px solid rgba(0, 122, 255, 0.2);
-                    border-radius: 50%;
-                    border-top-color: var(--primary-color);
-                    animation: spin 1s ease-in-out infinite;
-                }}
-                
-                @keyframes spin {{
-                    to {{ transform: rotate(360deg); }}
-                }}
-                
-                /* Tab system */
-                .tab-container {{
-                    margin-bottom: 20px;
-                }}
-                
-                .tab-buttons {{
-                    display: flex;
-                    border-bottom: 1px solid #E5E5EA;
-                }}
-                
-                .tab-button {{
-                    padding: 10px 20px;
-                    background: none;
-                    border: none;
-                    cursor: pointer;
-                    font-weight: 500;
-                    color: var(--text-secondary);
-                    border-bottom: 2px solid transparent;
-                }}
-                
-                .tab-button.active {{
-                    color: var(--primary-color);
-                    border-bottom-color: var(--primary-color);
-                }}
-                
-                .tab-content {{
-                    display: none;
-                    padding: 20px 0;
+                    width: 100%;
                 }}
+            }}
+            
+            .animation-card h4 {{
+                margin-bottom: 10px;
+                color: var(--primary-color);
+            }}
+            
+            .animation-example {{
+                height: 100px;
+                display: flex;
+                align-items: center;
+                justify-content: center;
+            }}
+            
+            .bounce-animation {{
+                animation: bounce 2s infinite;
+            }}
+            
+            .pulse-animation {{
+                animation: pulse 2s infinite;
+            }}
+            
+            @keyframes pulse {{
+                0% {{ transform: scale(1); }};
+                50% {{ transform: scale(1.1); }}
+                100% {{ transform: scale(1); }}
+            }}
+            
+            .scale-animation {{
+                animation: scale 2s infinite;
+            }}
+            
+            @keyframes scale {{
+                0% {{ transform: scale(1); opacity: 1; }};
+                50% {{ transform: scale(0.8); opacity: 0.8; }}
+                100% {{ transform: scale(1); opacity: 1; }}
+            }}
+            
+            .loading-spinner {{
+                width: 40px;
+                height: 40px;
+                border: 3px solid rgba(0, 122, 255, 0.2);
+                border-radius: 50%;
+                border-top-color: var(--primary-color);
+                animation: spin 1s ease-in-out infinite;
+            }}
+            
+            @keyframes spin {{
+                to {{ transform: rotate(360deg); }}
+            }}
+            
+            /* Tab system */
+            .tab-container {{
+                margin-bottom: 20px;
+            }}
+            
+            .tab-buttons {{
+                display: flex;
+                border-bottom: 1px solid #E5E5EA;
+            }}
+            
+            .tab-button {{
+                padding: 10px 20px;
+                background: none;
+                border: none;
+                cursor: pointer;
+                font-weight: 500;
+                color: var(--text-secondary);
+                border-bottom: 2px solid transparent;
+            }}
+            
+            .tab-button.active {{
+                color: var(--primary-color);
+                border-bottom-color: var(--primary-color);
+            }}
+            
+            .tab-content {{
+                display: none;
+                padding: 20px 0;
+            }}
+            
+            .tab-content.active {{
+                display: block;
+            }}
+            
+            footer {{
+                background-color: var(--primary-color);
+                color: white;
+                text-align: center;
+                padding: 20px;
+                margin-top: 40px;
+            }}
+        </style>
+        <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.2/css/all.min.css">
+        <script>
+            document.addEventListener("DOMContentLoaded", function() {{
+                // Set up login status functionality
+                const loginButton = document.getElementById('login-button');
+                const logoutButton = document.getElementById('logout-button');
+                const loggedOutState = document.getElementById('logged-out-state');
+                const loggedInState = document.getElementById('logged-in-state');
+                
+                // Check current server login status
+                checkLoginStatus();
+                
+                // Add event listeners for login/logout
+                loginButton.addEventListener('click', function() {{
+                    // Call the login API
+                    fetch('/api/login')
+                        .then(response => response.json())
+                        .then(data => {{
+                            if (data.status === 'success') {{
+                                // Update UI
+                                loggedOutState.style.display = 'none';
+                                loggedInState.style.display = 'flex';
+                                // Store in localStorage as well
+                                localStorage.setItem('supabaseChat_loggedIn', 'true');
+                                reconnectChatSocket();
+                            }}
+                        }})
+                        .catch(error => console.error('Login error:', error));
+                }});
                 
-                .tab-content.active {{
-                    display: block;
-                }}
+                logoutButton.addEventListener('click', function() {{
+                    // Call the logout API
+                    fetch('/api/logout')
+                        .then(response => response.json())
+                        .then(data => {{
+                            if (data.status === 'success') {{
+                                // Update UI
+                                loggedInState.style.display = 'none';
+                                loggedOutState.style.display = 'flex';
+                                // Store in localStorage as well
+                                localStorage.setItem('supabaseChat_loggedIn', 'false');
+                                reconnectChatSocket();
+                            }}
+                        }})
+                        .catch(error => console.error('Logout error:', error));
+                }});
                 
-                footer {{
-                    background-color: var(--primary-color);
-                    color: white;
-                    text-align: center;
-                    padding: 20px;
-                    margin-top: 40px;
-                }}
-            </style>
-            <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.2/css/all.min.css">
-            <script>
-                document.addEventListener("DOMContentLoaded", function() {{
-                    // Set up login status functionality
-                    const loginButton = document.getElementById('login-button');
-                    const logoutButton = document.getElementById('logout-button');
-                    const loggedOutState = document.getElementById('logged-out-state');
-                    const loggedInState = document.getElementById('logged-in-state');
-                    
-                    // Check current server login status
-                    checkLoginStatus();
-                    
-                    // Add event listeners for login/logout
-                    loginButton.addEventListener('click', function() {{
-                        // Call the login API
-                        fetch('/api/login')
-                            .then(response => response.json())
-                            .then(data => {{
-                                if (data.status === 'success') {{
-                                    // Update UI
+                function checkLoginStatus() {{
+                    // Check server status first, then use localStorage as fallback
+                    fetch('/api/status')
+                        .then(response => response.json())
+                        .then(data => {{
+                            const isLoggedIn = data.logged_in;
+                            
+                            if (isLoggedIn) {{
+                                loggedOutState.style.display = 'none';
+                                loggedInState.style.display = 'flex';
+                                localStorage.setItem('supabaseChat_loggedIn', 'true');
+                            }} else {{
+                                // If not logged in on server, check localStorage
+                                const localLoggedIn = localStorage.getItem('supabaseChat_loggedIn') === 'true';
+                                if (localLoggedIn) {{
+                                    // Local state says logged in, sync with server
+                                    fetch('/api/login')
+                                        .then(() => reconnectChatSocket())
+                                        .catch(e => console.error(e));
                                     loggedOutState.style.display = 'none';
                                     loggedInState.style.display = 'flex';
-                                    // Store in localStorage as well
-                                    localStorage.setItem('supabaseChat_loggedIn', 'true');
-                                }}
-                            }})
-                            .catch(error => console.error('Login error:', error));
-                    }});
-                    
-                    logoutButton.addEventListener('click', function() {{
-                        // Call the logout API
-                        fetch('/api/logout')
-                            .then(response => response.json())
-                            .then(data => {{
-                                if (data.status === 'success') {{
-                                    // Update UI
+                                }} else {{
                                     loggedInState.style.display = 'none';
                                     loggedOutState.style.display = 'flex';
-                                    // Store in localStorage as well
-                                    localStorage.setItem('supabaseChat_loggedIn', 'false');
                                 }}
-                            }})
-                            .catch(error => console.error('Logout error:', error));
+                            }}
+                        }})
+                        .catch(error => {{
+                            console.error('Status check error:', error);
+                            // Fallback to localStorage
+                            const isLoggedIn = localStorage.getItem('supabaseChat_loggedIn') === 'true';
+                            if (isLoggedIn) {{
+                                loggedOutState.style.display = 'none';
+                                loggedInState.style.display = 'flex';
+                            }}
+                        }});
+                }}
+                
+                // Load chat data
+                fetch('/api/data')
+                    .then(response => response.json())
+                    .then(data => populateChat(data))
+                    .catch(error => console.error('Error loading data:', error));
+                
+                // Tab functionality
+                const tabButtons = document.querySelectorAll('.tab-button');
+                const tabContents = document.querySelectorAll('.tab-content');
+                
+                tabButtons.forEach(button => {{
+                    button.addEventListener('click', () => {{
+                        // Remove active class from all buttons and contents
+                        tabButtons.forEach(btn => btn.classList.remove('active'));
+                        tabContents.forEach(content => content.classList.remove('active'));
+                        
+                        // Add active class to current button
+                        button.classList.add('active');
+                        
+                        // Show corresponding content
+                        const tabId = button.getAttribute('data-tab');
+                        document.getElementById(tabId).classList.add('active');
                     }});
-                    
-                    function checkLoginStatus() {{
-                        // Check server status first, then use localStorage as fallback
-                        fetch('/api/status')
-                            .then(response => response.json())
-                            .then(data => {{
-                                const isLoggedIn = data.logged_in;
-                                
-                                if (isLoggedIn) {{
-                                    loggedOutState.style.display = 'none';
-                                    loggedInState.style.display = 'flex';
-                                    localStorage.setItem('supabaseChat_loggedIn', 'true');
-                                }} else {{
-                                    // If not logged in on server, check localStorage
-                                    const localLoggedIn = localStorage.getItem('supabaseChat_loggedIn') === 'true';
-                                    if (localLoggedIn) {{
-                                        // Local state says logged in, sync with server
-                                        fetch('/api/login').catch(e => console.error(e));
-                                        loggedOutState.style.display = 'none';
-                                        loggedInState.style.display = 'flex';
-                                    }} else {{
-                                        loggedInState.style.display = 'none';
-                                        loggedOutState.style.display = 'flex';
-                                    }}
-                                }}
-                            }})
-                            .catch(error => {{
-                                console.error('Status check error:', error);
-                                // Fallback to localStorage
-                                const isLoggedIn = localStorage.getItem('supabaseChat_loggedIn') === 'true';
-                                if (isLoggedIn) {{
-                                    loggedOutState.style.display = 'none';
-                                    loggedInState.style.display = 'flex';
-                                }}
-                            }});
+                }});
+                
+                // Set up send button for the chat demo
+                const sendButton = document.getElementById('send-button');
+                const messageInput = document.getElementById('message-input');
+                
+                sendButton.addEventListener('click', function() {{
+                    sendMessage();
+                }});
+                
+                messageInput.addEventListener('keypress', function(e) {{
+                    if (e.key === 'Enter') {{
+                        sendMessage();
+                    }}
+                }});
+                
+                function sendMessage() {{
+                    const messageText = messageInput.value.trim();
+                    if (!messageText) {{
+                        return;
                     }}
                     
-                    // Load chat data
-                    fetch('/api/data')
-                        .then(response => response.json())
-                        .then(data => populateChat(data))
-                        .catch(error => console.error('Error loading data:', error));
+                    // Clear input
+                    messageInput.value = '';
                     
-                    // Tab functionality
-                    const tabButtons = document.querySelectorAll('.tab-button');
-                    const tabContents = document.querySelectorAll('.tab-content');
+                    if (chatSocket && chatSocket.readyState === WebSocket.OPEN) {{
+                        // The hub echoes the message back to every client, including this one;
+                        // the server takes the author from this browser's session
+                        chatSocket.send(JSON.stringify({{content: messageText}}));
+                        return;
+                    }}
                     
-                    tabButtons.forEach(button => {{
-                        button.addEventListener('click', () => {{
-                            // Remove active class from all buttons and contents
-                            tabButtons.forEach(btn => btn.classList.remove('active'));
-                            tabContents.forEach(content => content.classList.remove('active'));
-                            
-                            // Add active class to current button
-                            button.classList.add('active');
-                            
-                            // Show corresponding content
-                            const tabId = button.getAttribute('data-tab');
-                            document.getElementById(tabId).classList.add('active');
-                        }});
-                    }});
+                    // Offline: add message to UI locally
+                    const messagesContainer = document.querySelector('.chat-messages');
+                    messagesContainer.appendChild(buildMessageElement(
+                        true, 'https://ui-avatars.com/api/?name=Y&background=007BFF&color=fff', 'You',
+                        messageText, 'Just now'));
                     
-                    // Set up send button for the chat demo
-                    const sendButton = document.getElementById('send-button');
-                    const messageInput = document.getElementById('message-input');
+                    // Scroll to bottom
+                    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+                }}
+                
+                // Real-time messages from the server's WebSocket hub
+                connectChatSocket();
+            }});
+            
+            let chatSocket = null;
+            let chatUsers = {{}};
+            
+            function connectChatSocket() {{
+                const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+                chatSocket = new WebSocket(`${{scheme}}://${{window.location.host}}/ws`);
+                chatSocket.addEventListener('message', event => {{
+                    const data = JSON.parse(event.data);
+                    if (data.type === 'message') {{
+                        appendMessage(data.message);
+                        const messagesContainer = document.querySelector('.chat-messages');
+                        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+                    }} else if (data.type === 'resync') {{
+                        // We fell behind and the server dropped our backlog; reload history
+                        fetch('/api/data')
+                            .then(response => response.json())
+                            .then(data => populateChat(data))
+                            .catch(error => console.error('Error loading data:', error));
+                    }}
+                }});
+                chatSocket.addEventListener('close', () => {{
+                    chatSocket = null;
+                    setTimeout(connectChatSocket, 2000);
+                }});
+            }}
+            
+            // The socket sends as the session its cookie had when it opened,
+            // so open a new one after logging in or out
+            function reconnectChatSocket() {{
+                if (chatSocket) {{
+                    chatSocket.close();
+                }}
+            }}
+            
+            function populateChat(data) {{
+                const messagesContainer = document.querySelector('.chat-messages');
+                chatUsers = data.users.reduce((acc, user) => {{
+                    acc[user.id] = user;
+                    return acc;
+                }}, {{}});
+                
+                // Empty the container first
+                messagesContainer.innerHTML = '';
+                
+                // Add messages in chronological order
+                data.messages.forEach(message => appendMessage(message));
+                
+                // Scroll to bottom
+                messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            }}
+            
+            function appendMessage(message) {{
+                const messagesContainer = document.querySelector('.chat-messages');
+                const user = chatUsers[message.user_id] || {{
+                    username: message.user_id,
+                    avatar_url: `https://ui-avatars.com/api/?name=${{encodeURIComponent(message.user_id)}}`
+                }};
+                const isCurrentUser = message.user_id === 'user1'; // Just for demo
+                
+                // Format date
+                const date = new Date(message.created_at);
+                const timeString = date.toLocaleTimeString([], {{hour: '2-digit', minute:'2-digit'}});
+                
+                messagesContainer.appendChild(buildMessageElement(
+                    isCurrentUser, user.avatar_url, user.username, message.content, timeString));
+            }}
+            
+            // Message text, names and avatar URLs come from other clients, so
+            // they are set as text and properties, never parsed as HTML
+            function buildMessageElement(sent, avatarUrl, username, content, timeString) {{
+                const messageEl = document.createElement('div');
+                messageEl.className = `message ${{sent ? 'sent' : 'received'}}`;
+                
+                const avatar = document.createElement('div');
+                avatar.className = 'message-avatar';
+                const img = document.createElement('img');
+                img.src = String(avatarUrl);
+                img.alt = String(username);
+                avatar.appendChild(img);
+                messageEl.appendChild(avatar);
+                
+                const wrapper = document.createElement('div');
+                wrapper.className = 'message-content-wrapper';
+                if (!sent) {{
+                    const info = document.createElement('div');
+                    info.className = 'message-info';
+                    info.textContent = username;
+                    wrapper.appendChild(info);
+                }}
+                const bubble = document.createElement('div');
+                bubble.className = 'message-bubble';
+                bubble.textContent = content;
+                wrapper.appendChild(bubble);
+                const time = document.createElement('div');
+                time.className = 'message-time';
+                time.textContent = timeString;
+                wrapper.appendChild(time);
+                messageEl.appendChild(wrapper);
+                return messageEl;
+            }}
+        </script>
+    </head>
+    <body>
+        <header>
+            <div class="container">
+                <div class="header-content">
+                    <h1><i class="fas fa-comment-dots"></i> SupabaseChat - SwiftUI App</h1>
+                    <div class="user-status">
+                        <div id="logged-out-state">
+                            <span class="status-indicator offline"></span>
+                            <span>Not logged in</span>
+                            <button id="login-button" class="login-button">Login</button>
+                        </div>
+                        <div id="logged-in-state" style="display: none;">
+                            <span class="status-indicator online"></span>
+                            <span>Logged in as</span>
+                            <span class="username">sarah_dev</span>
+                            <div class="avatar-small">
+                                <img src="https://ui-avatars.com/api/?name=S&background=0D8ABC&color=fff" alt="User">
+                            </div>
+                            <button id="logout-button" class="logout-button">Logout</button>
+                        </div>
+                    </div>
+                </div>
+            </div>
+        </header>
+        
+        <div class="container">
+            <div class="main-content">
+                <div class="sidebar">
+                    <div class="card">
+                        <h2><i class="fas fa-info-circle"></i> About</h2>
+                        <p>SupabaseChat is a real-time chat application built with SwiftUI and powered by Supabase's real-time features and authentication services.</p>
+                        <p>As a SwiftUI app, it's designed to run natively on Apple platforms (iOS, macOS) and cannot be viewed directly in a web browser. This page provides a demonstration of its features.</p>
+                    </div>
                     
-                    sendButton.addEventListener('click', function() {{
-                        sendMessage();
-                    }});
+                    <div class="card">
+                        <h2><i class="fas fa-cogs"></i> Configuration</h2>
+                        <p>Status of your Supabase environment variables:</p>
+                        
+                        <p style="margin-top: 10px;">
+                            <strong>SUPABASE_URL:</strong> 
+                            <span class="status {supabase_url_status_class}">
+                                {("Set" if supabase_url != "Not set" else "Not set")}
+                            </span>
+                        </p>
+                        
+                        <p style="margin-top: 10px;">
+                            <strong>SUPABASE_KEY:</strong> 
+                            <span class="status {supabase_key_status_class}">
+                                {supabase_key_status}
+                            </span>
+                        </p>
+                    </div>
                     
-                    messageInput.addEventListener('keypress', function(e) {{
-                        if (e.key === 'Enter') {{
-                            sendMessage();
-                        }}
-                    }});
+                    <div class="card">
+                        <h2><i class="fas fa-folder-open"></i> Project Structure</h2>
+                        <ul>
+                            <li><strong>Models:</strong> Message, User</li>
+                            <li><strong>Services:</strong> 
+                                <ul>
+                                    <li>SupabaseService</li>
+                                    <li>AuthenticationService</li>
+                                    <li>ChatService</li>
+                                </ul>
+                            </li>
+                            <li><strong>Views:</strong>
+                                <ul>
+                                    <li>ContentView</li>
+                                    <li>ChatView</li>
+                                    <li>MessageRow</li>
+                                    <li>AuthenticationView</li>
+                                    <li>SignInView</li>
+                                    <li>SignUpView</li>
+                                    <li>ProfileView</li>
+                                </ul>
+                            </li>
+                        </ul>
+                    </div>
                     
-                    function sendMessage() {{
-                        const messageText = messageInput.value.trim();
-                        if (messageText) {{
-                            // Add message to UI
-                            const messagesContainer = document.querySelector('.chat-messages');
-                            const messageEl = document.createElement('div');
-                            messageEl.className = 'message sent';
-                            messageEl.innerHTML = `
-                                <div class="message-avatar">
-                                    <img src="https://ui-avatars.com/api/?name=Y&background=007BFF&color=fff" alt="You">
-                                </div>
-                                <div class="message-content-wrapper">
-                                    <div class="message-bubble">${{messageText}}</div>
-                                    <div class="message-time">Just now</div>
-                                </div>
-                            `;
-                            messagesContainer.appendChild(messageEl);
-                            
-                            // Clear input
-                            messageInput.value = '';
-                            
-                            // Scroll to bottom
-                            messagesContainer.scrollTop = messagesContainer.scrollHeight;
-                            
-                            // Simulate response after a delay
-                            setTimeout(() => {{
-                                const responseEl = document.createElement('div');
-                                responseEl.className = 'message received';
-                                responseEl.innerHTML = `
+                    <div class="card">
+                        <h2><i class="fas fa-user-shield"></i> Authentication</h2>
+                        <p>The app implements comprehensive user authentication with:</p>
+                        <ul>
+                            <li>Email/password sign-up & sign-in</li>
+                            <li>Session management</li>
+                            <li>User profile data storage</li>
+                            <li>Secure token handling</li>
+                        </ul>
+                    </div>
+                </div>
+                
+                <div class="content">
+                    <div class="card">
+                        <h2><i class="fas fa-comment-alt"></i> Chat Interface Demo</h2>
+                        <p>This is a demonstration of how the SupabaseChat interface looks and functions:</p>
+                        
+                        <div class="chat-demo">
+                            <div class="chat-header">
+                                <h3>SupabaseChat Room</h3>
+                            </div>
+                            <div class="chat-messages">
+                                <div class="message received">
                                     <div class="message-avatar">
                                         <img src="https://ui-avatars.com/api/?name=S&background=0D8ABC&color=fff" alt="Sarah">
                                     </div>
@@ -840,376 +1397,584 @@ class SupabaseChatHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                                         <div class="message-info">
                                             sarah_dev
                                         </div>
-                                        <div class="message-bubble">Thanks for trying the SupabaseChat demo! This is a simulated response.</div>
+                                        <div class="message-bubble">Loading messages...</div>
                                         <div class="message-time">Just now</div>
                                     </div>
-                                `;
-                                messagesContainer.appendChild(responseEl);
-                                messagesContainer.scrollTop = messagesContainer.scrollHeight;
-                            }}, 1000);
-                        }}
-                    }}
-                }});
-                
-                function populateChat(data) {{
-                    const messagesContainer = document.querySelector('.chat-messages');
-                    const users = data.users.reduce((acc, user) => {{
-                        acc[user.id] = user;
-                        return acc;
-                    }}, {{}});
-                    
-                    // Empty the container first
-                    messagesContainer.innerHTML = '';
-                    
-                    // Add messages in chronological order
-                    data.messages.forEach(message => {{
-                        const user = users[message.user_id];
-                        const messageEl = document.createElement('div');
-                        const isCurrentUser = message.user_id === 'user1'; // Just for demo
-                        messageEl.className = `message ${{isCurrentUser ? 'sent' : 'received'}}`;
-                        
-                        // Format date
-                        const date = new Date(message.created_at);
-                        const timeString = date.toLocaleTimeString([], {{hour: '2-digit', minute:'2-digit'}});
-                        
-                        // Create message with new avatar structure
-                        let html = `
-                            <div class="message-avatar">
-                                <img src="${{user.avatar_url}}" alt="${{user.username}}">
-                            </div>
-                            <div class="message-content-wrapper">
-                        `;
-                        
-                        if (!isCurrentUser) {{
-                            html += `
-                                <div class="message-info">
-                                    ${{user.username}}
                                 </div>
-                            `;
-                        }}
-                        
-                        html += `
-                                <div class="message-bubble">${{message.content}}</div>
-                                <div class="message-time">${{timeString}}</div>
-                            </div>
-                        `;
-                        
-                        messageEl.innerHTML = html;
-                        messagesContainer.appendChild(messageEl);
-                    }});
-                    
-                    // Scroll to bottom
-                    messagesContainer.scrollTop = messagesContainer.scrollHeight;
-                }}
-            </script>
-        </head>
-        <body>
-            <header>
-                <div class="container">
-                    <div class="header-content">
-                        <h1><i class="fas fa-comment-dots"></i> SupabaseChat - SwiftUI App</h1>
-                        <div class="user-status">
-                            <div id="logged-out-state">
-                                <span class="status-indicator offline"></span>
-                                <span>Not logged in</span>
-                                <button id="login-button" class="login-button">Login</button>
                             </div>
-                            <div id="logged-in-state" style="display: none;">
-                                <span class="status-indicator online"></span>
-                                <span>Logged in as</span>
-                                <span class="username">sarah_dev</span>
-                                <div class="avatar-small">
-                                    <img src="https://ui-avatars.com/api/?name=S&background=0D8ABC&color=fff" alt="User">
-                                </div>
-                                <button id="logout-button" class="logout-button">Logout</button>
+                            <div class="chat-input">
+                                <input type="text" id="message-input" placeholder="Type a message...">
+                                <button id="send-button"><i class="fas fa-paper-plane"></i></button>
                             </div>
                         </div>
-                    </div>
-                </div>
-            </header>
-            
-            <div class="container">
-                <div class="main-content">
-                    <div class="sidebar">
-                        <div class="card">
-                            <h2><i class="fas fa-info-circle"></i> About</h2>
-                            <p>SupabaseChat is a real-time chat application built with SwiftUI and powered by Supabase's real-time features and authentication services.</p>
-                            <p>As a SwiftUI app, it's designed to run natively on Apple platforms (iOS, macOS) and cannot be viewed directly in a web browser. This page provides a demonstration of its features.</p>
-                        </div>
-                        
-                        <div class="card">
-                            <h2><i class="fas fa-cogs"></i> Configuration</h2>
-                            <p>Status of your Supabase environment variables:</p>
-                            
-                            <p style="margin-top: 10px;">
-                                <strong>SUPABASE_URL:</strong> 
-                                <span class="status {supabase_url_status_class}">
-                                    {("Set" if supabase_url != "Not set" else "Not set")}
-                                </span>
-                            </p>
-                            
-                            <p style="margin-top: 10px;">
-                                <strong>SUPABASE_KEY:</strong> 
-                                <span class="status {supabase_key_status_class}">
-                                    {supabase_key_status}
-                                </span>
-                            </p>
-                        </div>
-                        
-                        <div class="card">
-                            <h2><i class="fas fa-folder-open"></i> Project Structure</h2>
-                            <ul>
-                                <li><strong>Models:</strong> Message, User</li>
-                                <li><strong>Services:</strong> 
-                                    <ul>
-                                        <li>SupabaseService</li>
-                                        <li>AuthenticationService</li>
-                                        <li>ChatService</li>
-                                    </ul>
-                                </li>
-                                <li><strong>Views:</strong>
-                                    <ul>
-                                        <li>ContentView</li>
-                                        <li>ChatView</li>
-                                        <li>MessageRow</li>
-                                        <li>AuthenticationView</li>
-                                        <li>SignInView</li>
-                                        <li>SignUpView</li>
-                                        <li>ProfileView</li>
-                                    </ul>
-                                </li>
-                            </ul>
-                        </div>
                         
-                        <div class="card">
-                            <h2><i class="fas fa-user-shield"></i> Authentication</h2>
-                            <p>The app implements comprehensive user authentication with:</p>
-                            <ul>
-                                <li>Email/password sign-up & sign-in</li>
-                                <li>Session management</li>
-                                <li>User profile data storage</li>
-                                <li>Secure token handling</li>
-                            </ul>
-                        </div>
+                        <p style="margin-top: 15px;"><strong>Try it:</strong> Type a message and click send to simulate the chat experience!</p>
                     </div>
                     
-                    <div class="content">
-                        <div class="card">
-                            <h2><i class="fas fa-comment-alt"></i> Chat Interface Demo</h2>
-                            <p>This is a demonstration of how the SupabaseChat interface looks and functions:</p>
-                            
-                            <div class="chat-demo">
-                                <div class="chat-header">
-                                    <h3>SupabaseChat Room</h3>
-                                </div>
-                                <div class="chat-messages">
-                                    <div class="message received">
+                    <div class="card">
+                        <h2><i class="fas fa-magic"></i> Playful Animations</h2>
+                        <p>The app features various playful animations to enhance the user experience:</p>
+                        
+                        <div class="animation-demo">
+                            <div class="animation-card">
+                                <h4>Message Bounce</h4>
+                                <div class="animation-example">
+                                    <div class="message bounce-animation" style="margin: 0;">
                                         <div class="message-avatar">
-                                            <img src="https://ui-avatars.com/api/?name=S&background=0D8ABC&color=fff" alt="Sarah">
+                                            <img src="https://ui-avatars.com/api/?name=Y&background=007BFF&color=fff" alt="You">
                                         </div>
                                         <div class="message-content-wrapper">
-                                            <div class="message-info">
-                                                sarah_dev
-                                            </div>
-                                            <div class="message-bubble">Loading messages...</div>
-                                            <div class="message-time">Just now</div>
+                                            <div class="message-bubble" style="background: var(--primary-color); color: white;">Hello there!</div>
                                         </div>
                                     </div>
                                 </div>
-                                <div class="chat-input">
-                                    <input type="text" id="message-input" placeholder="Type a message...">
-                                    <button id="send-button"><i class="fas fa-paper-plane"></i></button>
+                            </div>
+                            
+                            <div class="animation-card">
+                                <h4>Pulsing Button</h4>
+                                <div class="animation-example">
+                                    <button class="button pulse-animation" style="margin: 0;">
+                                        <i class="fas fa-paper-plane"></i> Send
+                                    </button>
+                                </div>
+                            </div>
+                            
+                            <div class="animation-card">
+                                <h4>Loading Indicator</h4>
+                                <div class="animation-example">
+                                    <div class="loading-spinner"></div>
                                 </div>
                             </div>
                             
-                            <p style="margin-top: 15px;"><strong>Try it:</strong> Type a message and click send to simulate the chat experience!</p>
+                            <div class="animation-card">
+                                <h4>Scale Transition</h4>
+                                <div class="animation-example">
+                                    <div class="scale-animation" style="background: var(--primary-color); color: white; padding: 15px; border-radius: 10px;">
+                                        New Message!
+                                    </div>
+                                </div>
+                            </div>
                         </div>
+                    </div>
+                    
+                    <div class="card">
+                        <h2><i class="fas fa-user-lock"></i> Authentication Demo</h2>
+                        <p>The app provides a complete authentication system with sign-up, sign-in, and profile management:</p>
                         
-                        <div class="card">
-                            <h2><i class="fas fa-magic"></i> Playful Animations</h2>
-                            <p>The app features various playful animations to enhance the user experience:</p>
+                        <div class="tab-container">
+                            <div class="tab-buttons">
+                                <button class="tab-button active" data-tab="sign-in-tab">Sign In</button>
+                                <button class="tab-button" data-tab="sign-up-tab">Sign Up</button>
+                                <button class="tab-button" data-tab="profile-tab">Profile</button>
+                            </div>
                             
-                            <div class="animation-demo">
-                                <div class="animation-card">
-                                    <h4>Message Bounce</h4>
-                                    <div class="animation-example">
-                                        <div class="message bounce-animation" style="margin: 0;">
-                                            <div class="message-avatar">
-                                                <img src="https://ui-avatars.com/api/?name=Y&background=007BFF&color=fff" alt="You">
-                                            </div>
-                                            <div class="message-content-wrapper">
-                                                <div class="message-bubble" style="background: var(--primary-color); color: white;">Hello there!</div>
-                                            </div>
-                                        </div>
+                            <div class="tab-content active" id="sign-in-tab">
+                                <div class="auth-form">
+                                    <h3>Sign In</h3>
+                                    <div class="form-group">
+                                        <label for="email">Email Address</label>
+                                        <input type="email" id="email" placeholder="your@email.com">
                                     </div>
-                                </div>
-                                
-                                <div class="animation-card">
-                                    <h4>Pulsing Button</h4>
-                                    <div class="animation-example">
-                                        <button class="button pulse-animation" style="margin: 0;">
-                                            <i class="fas fa-paper-plane"></i> Send
-                                        </button>
+                                    <div class="form-group">
+                                        <label for="password">Password</label>
+                                        <input type="password" id="password" placeholder="••••••••">
                                     </div>
+                                    <button>Sign In</button>
                                 </div>
-                                
-                                <div class="animation-card">
-                                    <h4>Loading Indicator</h4>
-                                    <div class="animation-example">
-                                        <div class="loading-spinner"></div>
+                            </div>
+                            
+                            <div class="tab-content" id="sign-up-tab">
+                                <div class="auth-form">
+                                    <h3>Create Account</h3>
+                                    <div class="form-group">
+                                        <label for="username">Username</label>
+                                        <input type="text" id="username" placeholder="Choose a username">
                                     </div>
-                                </div>
-                                
-                                <div class="animation-card">
-                                    <h4>Scale Transition</h4>
-                                    <div class="animation-example">
-                                        <div class="scale-animation" style="background: var(--primary-color); color: white; padding: 15px; border-radius: 10px;">
-                                            New Message!
-                                        </div>
+                                    <div class="form-group">
+                                        <label for="email-signup">Email Address</label>
+                                        <input type="email" id="email-signup" placeholder="your@email.com">
                                     </div>
+                                    <div class="form-group">
+                                        <label for="password-signup">Password</label>
+                                        <input type="password" id="password-signup" placeholder="Choose a password">
+                                    </div>
+                                    <div class="form-group">
+                                        <label for="password-confirm">Confirm Password</label>
+                                        <input type="password" id="password-confirm" placeholder="Confirm your password">
+                                    </div>
+                                    <button>Create Account</button>
                                 </div>
                             </div>
-                        </div>
-                        
-                        <div class="card">
-                            <h2><i class="fas fa-user-lock"></i> Authentication Demo</h2>
-                            <p>The app provides a complete authentication system with sign-up, sign-in, and profile management:</p>
                             
-                            <div class="tab-container">
-                                <div class="tab-buttons">
-                                    <button class="tab-button active" data-tab="sign-in-tab">Sign In</button>
-                                    <button class="tab-button" data-tab="sign-up-tab">Sign Up</button>
-                                    <button class="tab-button" data-tab="profile-tab">Profile</button>
-                                </div>
-                                
-                                <div class="tab-content active" id="sign-in-tab">
-                                    <div class="auth-form">
-                                        <h3>Sign In</h3>
-                                        <div class="form-group">
-                                            <label for="email">Email Address</label>
-                                            <input type="email" id="email" placeholder="your@email.com">
-                                        </div>
-                                        <div class="form-group">
-                                            <label for="password">Password</label>
-                                            <input type="password" id="password" placeholder="••••••••">
-                                        </div>
-                                        <button>Sign In</button>
+                            <div class="tab-content" id="profile-tab">
+                                <div class="auth-form">
+                                    <h3>Edit Profile</h3>
+                                    <div class="form-group">
+                                        <label for="profile-username">Username</label>
+                                        <input type="text" id="profile-username" value="sarah_dev">
                                     </div>
-                                </div>
-                                
-                                <div class="tab-content" id="sign-up-tab">
-                                    <div class="auth-form">
-                                        <h3>Create Account</h3>
-                                        <div class="form-group">
-                                            <label for="username">Username</label>
-                                            <input type="text" id="username" placeholder="Choose a username">
-                                        </div>
-                                        <div class="form-group">
-                                            <label for="email-signup">Email Address</label>
-                                            <input type="email" id="email-signup" placeholder="your@email.com">
-                                        </div>
-                                        <div class="form-group">
-                                            <label for="password-signup">Password</label>
-                                            <input type="password" id="password-signup" placeholder="Choose a password">
-                                        </div>
-                                        <div class="form-group">
-                                            <label for="password-confirm">Confirm Password</label>
-                                            <input type="password" id="password-confirm" placeholder="Confirm your password">
-                                        </div>
-                                        <button>Create Account</button>
+                                    <div class="form-group">
+                                        <label for="profile-email">Email Address</label>
+                                        <input type="email" id="profile-email" value="sarah@example.com">
                                     </div>
-                                </div>
-                                
-                                <div class="tab-content" id="profile-tab">
-                                    <div class="auth-form">
-                                        <h3>Edit Profile</h3>
-                                        <div class="form-group">
-                                            <label for="profile-username">Username</label>
-                                            <input type="text" id="profile-username" value="sarah_dev">
-                                        </div>
-                                        <div class="form-group">
-                                            <label for="profile-email">Email Address</label>
-                                            <input type="email" id="profile-email" value="sarah@example.com">
-                                        </div>
-                                        <div class="form-group">
-                                            <label for="profile-avatar">Avatar URL</label>
-                                            <input type="text" id="profile-avatar" value="https://ui-avatars.com/api/?name=Sarah&background=0D8ABC&color=fff">
-                                        </div>
-                                        <button>Update Profile</button>
+                                    <div class="form-group">
+                                        <label for="profile-avatar">Avatar URL</label>
+                                        <input type="text" id="profile-avatar" value="https://ui-avatars.com/api/?name=Sarah&background=0D8ABC&color=fff">
                                     </div>
+                                    <button>Update Profile</button>
                                 </div>
                             </div>
                         </div>
+                    </div>
+                    
+                    <div class="card">
+                        <h2><i class="fas fa-star"></i> Key Features</h2>
+                        <p>SupabaseChat combines powerful back-end capabilities with an elegant, animated user interface:</p>
                         
-                        <div class="card">
-                            <h2><i class="fas fa-star"></i> Key Features</h2>
-                            <p>SupabaseChat combines powerful back-end capabilities with an elegant, animated user interface:</p>
-                            
-                            <div style="display: grid; grid-template-columns: repeat(2, 1fr); gap: 15px; margin-top: 20px;">
-                                <div style="background-color: white; border-radius: 10px; padding: 15px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">
-                                    <div style="width: 30px; height: 30px; background-color: #007AFF; color: white; border-radius: 50%; display: flex; align-items: center; justify-content: center; margin-bottom: 10px;">
-                                        <i class="fas fa-bolt"></i>
-                                    </div>
-                                    <h4 style="margin: 0 0 5px 0; color: #007AFF;">Real-time Messaging</h4>
-                                    <p style="margin: 0;">Instant message delivery using Supabase Realtime.</p>
+                        <div style="display: grid; grid-template-columns: repeat(2, 1fr); gap: 15px; margin-top: 20px;">
+                            <div style="background-color: white; border-radius: 10px; padding: 15px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">
+                                <div style="width: 30px; height: 30px; background-color: #007AFF; color: white; border-radius: 50%; display: flex; align-items: center; justify-content: center; margin-bottom: 10px;">
+                                    <i class="fas fa-bolt"></i>
                                 </div>
-                                
-                                <div style="background-color: white; border-radius: 10px; padding: 15px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">
-                                    <div style="width: 30px; height: 30px; background-color: #007AFF; color: white; border-radius: 50%; display: flex; align-items: center; justify-content: center; margin-bottom: 10px;">
-                                        <i class="fas fa-user-shield"></i>
-                                    </div>
-                                    <h4 style="margin: 0 0 5px 0; color: #007AFF;">Secure Authentication</h4>
-                                    <p style="margin: 0;">Full user authentication with Supabase Auth.</p>
+                                <h4 style="margin: 0 0 5px 0; color: #007AFF;">Real-time Messaging</h4>
+                                <p style="margin: 0;">Instant message delivery using Supabase Realtime.</p>
+                            </div>
+                            
+                            <div style="background-color: white; border-radius: 10px; padding: 15px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">
+                                <div style="width: 30px; height: 30px; background-color: #007AFF; color: white; border-radius: 50%; display: flex; align-items: center; justify-content: center; margin-bottom: 10px;">
+                                    <i class="fas fa-user-shield"></i>
                                 </div>
-                                
-                                <div style="background-color: white; border-radius: 10px; padding: 15px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">
-                                    <div style="width: 30px; height: 30px; background-color: #007AFF; color: white; border-radius: 50%; display: flex; align-items: center; justify-content: center; margin-bottom: 10px;">
-                                        <i class="fas fa-magic"></i>
-                                    </div>
-                                    <h4 style="margin: 0 0 5px 0; color: #007AFF;">Playful Animations</h4>
-                                    <p style="margin: 0;">Delightful animations throughout the interface.</p>
+                                <h4 style="margin: 0 0 5px 0; color: #007AFF;">Secure Authentication</h4>
+                                <p style="margin: 0;">Full user authentication with Supabase Auth.</p>
+                            </div>
+                            
+                            <div style="background-color: white; border-radius: 10px; padding: 15px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">
+                                <div style="width: 30px; height: 30px; background-color: #007AFF; color: white; border-radius: 50%; display: flex; align-items: center; justify-content: center; margin-bottom: 10px;">
+                                    <i class="fas fa-magic"></i>
                                 </div>
-                                
-                                <div style="background-color: white; border-radius: 10px; padding: 15px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">
-                                    <div style="width: 30px; height: 30px; background-color: #007AFF; color: white; border-radius: 50%; display: flex; align-items: center; justify-content: center; margin-bottom: 10px;">
-                                        <i class="fas fa-database"></i>
-                                    </div>
-                                    <h4 style="margin: 0 0 5px 0; color: #007AFF;">Message Persistence</h4>
-                                    <p style="margin: 0;">Messages stored securely in Supabase database.</p>
+                                <h4 style="margin: 0 0 5px 0; color: #007AFF;">Playful Animations</h4>
+                                <p style="margin: 0;">Delightful animations throughout the interface.</p>
+                            </div>
+                            
+                            <div style="background-color: white; border-radius: 10px; padding: 15px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">
+                                <div style="width: 30px; height: 30px; background-color: #007AFF; color: white; border-radius: 50%; display: flex; align-items: center; justify-content: center; margin-bottom: 10px;">
+                                    <i class="fas fa-database"></i>
                                 </div>
+                                <h4 style="margin: 0 0 5px 0; color: #007AFF;">Message Persistence</h4>
+                                <p style="margin: 0;">Messages stored securely in Supabase database.</p>
                             </div>
                         </div>
-                        
-                        <div class="card">
-                            <h2><i class="fas fa-book"></i> Documentation</h2>
-                            <p>For more information about this project:</p>
-                            <ul>
-                                <li>See the <strong>README.md</strong> for project overview</li>
-                                <li>Follow <strong>Setup.md</strong> for Supabase configuration steps</li>
-                                <li>Explore the code in the <strong>SupabaseChat</strong> directory</li>
-                            </ul>
-                            <p>The app uses these key technologies:</p>
-                            <ul>
-                                <li>SwiftUI - Apple's declarative UI framework</li>
-                                <li>Supabase Swift SDK - for backend communication</li>
-                                <li>Supabase Auth - for user authentication</li>
-                                <li>Supabase Realtime - for real-time messaging</li>
-                            </ul>
-                        </div>
+                    </div>
+                    
+                    <div class="card">
+                        <h2><i class="fas fa-book"></i> Documentation</h2>
+                        <p>For more information about this project:</p>
+                        <ul>
+                            <li>See the <strong>README.md</strong> for project overview</li>
+                            <li>Follow <strong>Setup.md</strong> for Supabase configuration steps</li>
+                            <li>Explore the code in the <strong>SupabaseChat</strong> directory</li>
+                        </ul>
+                        <p>The app uses these key technologies:</p>
+                        <ul>
+                            <li>SwiftUI - Apple's declarative UI framework</li>
+                            <li>Supabase Swift SDK - for backend communication</li>
+                            <li>Supabase Auth - for user authentication</li>
+                            <li>Supabase Realtime - for real-time messaging</li>
+                        </ul>
                     </div>
                 </div>
             </div>
+        </div>
+        
+        <footer>
+            <div class="container">
+                <p>SupabaseChat - A real-time chat application built with SwiftUI and Supabase</p>
+            </div>
+        </footer>
+    </body>
+    </html>
+    """
+    
+    return html
+
+# The page only depends on values read at import time, so it is rendered and
+# compressed once instead of on every request
+LANDING_PAGE = page_cache.CachedPage(render_landing_page().encode(), "text/html; charset=utf-8")
+
+class SupabaseChatHTTPRequestHandler(metrics.RequestMetricsMixin, serving.KeepAliveHandlerMixin,
+                                     http.server.SimpleHTTPRequestHandler):
+    def metrics_route(self, path):
+        path = path.partition("?")[0]
+        if path in METRICS_ROUTES:
+            return path
+        if path.startswith("/api/channels/"):
+            return "/api/channels/{id}/messages"
+        return "other"
+
+    def do_GET(self):
+        if rate_limiter is not None and not rate_limiter.allow(self, self.request_route()):
+            return
+
+        if self.path == "/api/data":
+            if self._synced("messages"):
+                self._send_json(HTTPStatus.OK, get_chat_data())
+            return
+        
+        elif self.path == "/api/login":
+            # Starts a session for this browser, unless it has one
+            self._login()
+            return
             
-            <footer>
-                <div class="container">
-                    <p>SupabaseChat - A real-time chat application built with SwiftUI and Supabase</p>
-                </div>
-            </footer>
-        </body>
-        </html>
-        """
+        elif self.path == "/api/logout":
+            # Ends this browser's session
+            self._logout()
+            return
+            
+        elif self.path == "/api/search" or self.path.startswith("/api/search?"):
+            if self._synced("messages"):
+                self._search()
+            return
+            
+        elif self.path.startswith("/api/channels/"):
+            if self._synced("messages"):
+                self._get_channel_messages()
+            return
+
+        elif self.path == "/api/unread" or self.path.startswith("/api/unread?"):
+            if self._synced("messages") and self._synced("receipts"):
+                self._unread()
+            return
+
+        elif self.path == "/api/reactions/hottest" or self.path.startswith("/api/reactions/hottest?"):
+            if self._synced("reactions"):
+                self._hottest()
+            return
+
+        elif self.path == "/api/reactions" or self.path.startswith("/api/reactions?"):
+            if self._synced("reactions"):
+                self._reactions()
+            return
+            
+        elif self.path == "/ws":
+            self._upgrade_websocket()
+            return
+            
+        elif self.path == "/metrics":
+            metrics.send(self)
+            return
+
+        elif self.path.startswith("/debug/"):
+            debug.handle(self)
+            return
+            
+        elif self.path == "/api/status":
+            # Return this browser's login status
+            if self._synced("sessions"):
+                session = self._session()
+                self._send_json(HTTPStatus.OK, {"logged_in": session is not None,
+                                                "user_id": session[1]["user_id"] if session else None})
+            return
+        
+        LANDING_PAGE.send(self)
         
-        self.wfile.write(html.encode())
+    def do_POST(self):
+        if rate_limiter is not None and not rate_limiter.allow(self, self.request_route()):
+            return
+
+        if self.path == "/api/messages":
+            data = self._read_body()
+            if data is None:
+                return
+            user_id = self._caller(data)
+            if user_id is None:
+                return
+            try:
+                message = create_message(data, user_id)
+            except (ValueError, KeyError, TypeError) as error:
+                self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+                return
+            except cluster.OwnerUnavailable as error:
+                self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)})
+                return
+            self._send_json(HTTPStatus.CREATED, message)
+            return
+
+        if self.path == "/api/read":
+            self._read_receipt()
+            return
+
+        if self.path == "/api/reactions":
+            self._change_reaction("add")
+            return
+
+        if self.path == "/api/hooks/profiles":
+            self._profile_hook()
+            return
+
+        self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
+
+    def do_DELETE(self):
+        if rate_limiter is not None and not rate_limiter.allow(self, self.request_route()):
+            return
+
+        if self.path == "/api/reactions":
+            self._change_reaction("remove")
+            return
+
+        self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
+
+    def _synced(self, feed):
+        # In --workers mode, waits until this worker has every change made
+        # through any worker; answers 503 and returns False if it cannot
+        if _cluster is None:
+            return True
+        try:
+            _cluster.sync(feed)
+            return True
+        except cluster.OwnerUnavailable as error:
+            self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)})
+            return False
+
+    def _session(self):
+        # (session id, {"user_id", "logged_in_at"}) of the request's session,
+        # or None
+        session_id = sessions.session_id_from(self.headers)
+        if session_id is None:
+            return None
+        data = session_updates.get(session_id)
+        return None if data is None else (session_id, data)
+
+    def _caller(self, data):
+        # The logged-in user making a write, or None after answering 401 (no
+        # session) or 403 (the body's user_id, if it has one, is someone else)
+        if not self._synced("sessions"):
+            return None
+        session = self._session()
+        if session is None:
+            self._send_json(HTTPStatus.UNAUTHORIZED, {"error": "log in first"})
+            return None
+        user_id = session[1]["user_id"]
+        if "user_id" in data and str(data["user_id"]) != user_id:
+            self._send_json(HTTPStatus.FORBIDDEN, {"error": "user_id is not the logged-in user"})
+            return None
+        return user_id
+
+    def _read_body(self):
+        # The request's JSON object, or None after answering 400
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if not 0 < length <= MAX_BODY_BYTES:
+                raise ValueError("body must be 1 to 65536 bytes of JSON")
+            data = json.loads(self.rfile.read(length))
+            if not isinstance(data, dict):
+                raise ValueError("body must be a JSON object")
+        except ValueError as error:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+            return None
+        return data
+
+    def _login(self):
+        if not self._synced("sessions"):
+            return
+        session = self._session()
+        try:
+            session_id = session[0] if session else session_updates.create(
+                {"user_id": DEMO_USER_ID, "logged_in_at": int(time.time())})
+        except cluster.OwnerUnavailable as error:
+            self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)})
+            return
+        self._send_json(HTTPStatus.OK, {"status": "success", "logged_in": True},
+                        [("Set-Cookie", sessions.set_cookie(session_id))])
+
+    def _logout(self):
+        session_id = sessions.session_id_from(self.headers)
+        if session_id is not None:
+            try:
+                session_updates.delete(session_id)
+            except cluster.OwnerUnavailable as error:
+                self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)})
+                return
+        self._send_json(HTTPStatus.OK, {"status": "success", "logged_in": False},
+                        [("Set-Cookie", sessions.set_cookie(None))])
+
+    def _unread(self):
+        # /api/unread?user_id=<id>: unread messages in every channel
+        user_id = parse_qs(urlparse(self.path).query).get("user_id", [""])[0]
+        if not user_id:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "user_id is required"})
+            return
+        channels = get_unread_counts().unread(user_id)
+        self._send_json(HTTPStatus.OK, {"user_id": user_id, "channels": channels, "total": sum(channels.values())})
+
+    def _read_receipt(self):
+        # {"channel_id", "last_read_message_id"}, as in read_receipts, for
+        # the logged-in user
+        data = self._read_body()
+        if data is None:
+            return
+        user_id = self._caller(data)
+        if user_id is None or not self._synced("messages"):
+            return
+        try:
+            channel_id = str(data["channel_id"])
+            unread = mark_read(user_id, channel_id, str(data["last_read_message_id"]))
+        except (ValueError, KeyError, TypeError) as error:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+            return
+        except cluster.OwnerUnavailable as error:
+            self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)})
+            return
+        self._send_json(HTTPStatus.OK, {"user_id": user_id, "channel_id": channel_id, "unread": unread})
+
+    def _reactions(self):
+        # /api/reactions?message_ids=<id>,<id>,...&user_id=<id>: reaction
+        # counts of a page of messages, and the user's own if one is given
+        query_params = parse_qs(urlparse(self.path).query)
+        message_ids = [message_id for message_id in query_params.get("message_ids", [""])[0].split(",") if message_id]
+        if not message_ids:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "message_ids is required"})
+            return
+        if len(message_ids) > MAX_PAGE_SIZE:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": f"at most {MAX_PAGE_SIZE} message_ids"})
+            return
+        user_id = query_params.get("user_id", [None])[0] or None
+        self._send_json(HTTPStatus.OK, {"reactions": get_reactions().summaries(message_ids, user_id)})
+
+    def _hottest(self):
+        # /api/reactions/hottest?channel_id=<id>&limit=N: the channel's
+        # messages with the most reactions
+        query_params = parse_qs(urlparse(self.path).query)
+        channel_id = query_params.get("channel_id", [channel_index.DEFAULT_CHANNEL])[0]
+        try:
+            limit = int(query_params.get("limit", [DEFAULT_HOTTEST_LIMIT])[0])
+        except ValueError:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "limit must be an integer"})
+            return
+        limit = max(1, min(limit, MAX_HOTTEST_LIMIT))
+        index = get_reactions()
+        hottest = index.hottest(channel_id, limit)
+        summaries = index.summaries([message_id for message_id, _ in hottest])
+        self._send_json(HTTPStatus.OK, {"channel_id": channel_id, "messages": [
+            {"message_id": message_id, "total": total, "counts": summaries[message_id]["counts"]}
+            for message_id, total in hottest]})
+
+    def _change_reaction(self, op):
+        # {"message_id", "channel_id", "reaction"}, as in message_reactions,
+        # for the logged-in user; POST adds it, DELETE removes it (channel_id
+        # is only needed to add)
+        data = self._read_body()
+        if data is None:
+            return
+        user_id = self._caller(data)
+        if user_id is None or op == "add" and not self._synced("messages"):
+            return
+        try:
+            message_id, reaction = str(data["message_id"]), str(data["reaction"])
+            if not 0 < len(reaction) <= MAX_REACTION_LENGTH:
+                raise ValueError(f"reaction must be 1 to {MAX_REACTION_LENGTH} characters")
+            if op == "add":
+                channel_id = str(data.get("channel_id", channel_index.DEFAULT_CHANNEL))
+                change = ["add", message_id, channel_id, user_id, reaction]
+            else:
+                change = ["remove", message_id, user_id, reaction]
+            summary = change_reaction(change)
+        except (ValueError, KeyError, TypeError) as error:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+            return
+        except cluster.OwnerUnavailable as error:
+            self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)})
+            return
+        self._send_json(HTTPStatus.OK, dict(summary, message_id=message_id))
+
+    def _profile_hook(self):
+        # Supabase database webhook for the profiles table, sent with the
+        # X-Webhook-Secret header; keeps the profile cache current
+        if PROFILE_WEBHOOK_SECRET is None:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
+            return
+        if not hmac.compare_digest(self.headers.get("X-Webhook-Secret", "").encode(),
+                                   PROFILE_WEBHOOK_SECRET.encode()):
+            self._send_json(HTTPStatus.FORBIDDEN, {"error": "X-Webhook-Secret is missing or wrong"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if not 0 < length <= MAX_BODY_BYTES:
+                raise ValueError("body must be 1 to 65536 bytes of JSON")
+            change = profile_change(json.loads(self.rfile.read(length)))
+            if _cluster is not None:
+                _cluster.call("profiles.change", change)
+            else:
+                profiles.apply(change)
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+            return
+        except cluster.OwnerUnavailable as error:
+            self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)})
+            return
+        self._send_json(HTTPStatus.OK, {"status": "success"})
+
+    def _search(self):
+        # /api/search?q=<text>&channel=<id>&limit=N&offset=M
+        query_params = parse_qs(urlparse(self.path).query)
+        query = query_params.get("q", [""])[0]
+        channel_id = query_params.get("channel", [None])[0]
+        try:
+            limit = int(query_params.get("limit", [DEFAULT_SEARCH_LIMIT])[0])
+            offset = int(query_params.get("offset", [0])[0])
+            if not 1 <= limit <= MAX_SEARCH_LIMIT or offset < 0:
+                raise ValueError(f"limit must be between 1 and {MAX_SEARCH_LIMIT} and offset not negative")
+        except ValueError as error:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+            return
+        self._send_json(HTTPStatus.OK, search_messages(query, channel_id, limit, offset))
+
+    def _get_channel_messages(self):
+        # /api/channels/{id}/messages?before=<cursor>&limit=N
+        parsed_url = urlparse(self.path)
+        parts = parsed_url.path.split("/")
+        if len(parts) != 5 or parts[4] != "messages" or not parts[3]:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
+            return
+        query_params = parse_qs(parsed_url.query)
+        before = query_params.get("before", [None])[0]
+        try:
+            limit = int(query_params.get("limit", [DEFAULT_PAGE_SIZE])[0])
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+            page = get_channel_page(parts[3], before, limit)
+        except ValueError as error:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+            return
+        self._send_json(HTTPStatus.OK, page)
+
+    def _send_json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _upgrade_websocket(self):
+        key = self.headers.get("Sec-WebSocket-Key")
+        if (self.headers.get("Upgrade", "").lower() != "websocket" or not key
+                or self.headers.get("Sec-WebSocket-Version") != "13"
+                or not serving.supports_detach(self)):
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "WebSocket upgrade required"},
+                            headers=[("Sec-WebSocket-Version", "13")])
+            return
+        extensions = websocket_hub.negotiate_deflate(self.headers.get("Sec-WebSocket-Extensions"))
+        self.send_response(HTTPStatus.SWITCHING_PROTOCOLS)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", websocket_hub.accept_key(key))
+        if extensions:
+            self.send_header("Sec-WebSocket-Extensions", extensions)
+        self.end_headers()
+        serving.detach(self, chat_hub.protocol(deflate_enabled=extensions is not None,
+                                               context=sessions.session_id_from(self.headers)))
         
     def log_message(self, format, *args):
         # Disable logging
@@ -1217,13 +1982,195 @@ class SupabaseChatHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
 
 # Set up the server
 PORT = 5000
-handler = SupabaseChatHTTPRequestHandler
-socketserver.TCPServer.allow_reuse_address = True
 
-with socketserver.TCPServer(("", PORT), handler) as httpd:
-    print(f"\nServer started at http://0.0.0.0:{PORT}")
-    print("Press Ctrl+C to stop the server")
-    try:
-        httpd.serve_forever()
-    except KeyboardInterrupt:
-        print("\nServer stopped.")
\ No newline at end of file
+def run_server(port=PORT, engine=serving.DEFAULT_ENGINE, threads=serving.DEFAULT_THREADS, workers=1):
+    # Print environment variables for debugging
+    print("Environment variables:")
+    print(f"SUPABASE_URL: {supabase_url}")
+    if os.environ.get('SUPABASE_KEY'):
+        print("SUPABASE_KEY: [Set but not displayed for security]")
+    else:
+        print("SUPABASE_KEY: Not set")
+    if upstream is not None:
+        print(f"Supabase REST: {upstream.url} (up to {postgrest.POOL_SIZE} connections)")
+    else:
+        print("Supabase REST: not used, serving demo data")
+
+    print("\nSupabaseChat app information:")
+    print("This is a server displaying information about the Swift Supabase chat project")
+    print("See README.md for more information about this project")
+
+    if workers > 1:
+        run_workers(port, engine, threads, workers)
+        return
+
+    log = get_message_log()
+    print(f"\nMessage log: {log.directory} ({len(log)} messages)")
+
+    handler = SupabaseChatHTTPRequestHandler
+    handler.access_log = access_log.open_log("server")
+    if handler.access_log is not None:
+        print(f"Access log: {handler.access_log.path}")
+    with serving.make_server(("", port), handler, engine=engine, threads=threads) as httpd:
+        print(f"\nServer started at http://0.0.0.0:{port} ({engine} engine)")
+        print("Press Ctrl+C to stop the server")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\nServer stopped.")
+
+def _serve_owner(workers):
+    # Owner process: appends messages, read receipts and reactions and holds
+    # the sessions. The messages feed is versioned by the number of records
+    # written to the log, so a worker that has applied version N can read
+    # offsets below N; it carries on across owner restarts because the log
+    # does. Sessions are kept in
+    # memory only: a restarted owner starts with none, and its snapshot
+    # empties the replicas.
+    log = open_message_log()
+    messages_lock = threading.Lock()
+    # Session changes are made one at a time, so they are published in order
+    sessions_lock = threading.Lock()
+    # Versions carry on from the last owner's
+    sessions_version = [workers.version("sessions")]
+    profiles_lock = threading.Lock()
+    profiles_version = [workers.version("profiles")]
+    # The furthest receipt of each user in each channel; workers get these
+    # on connecting, then every receipt that moves one further
+    receipts = message_log.MessageLog(RECEIPTS_DIR, fsync=False)
+    receipts_lock = threading.Lock()
+    receipts_version = [workers.version("receipts")]
+    furthest = {}
+    for _, receipt in receipts.scan():
+        key = receipt["user_id"], receipt["channel_id"]
+        if key not in furthest or furthest[key]["number"] < receipt["number"]:
+            furthest[key] = receipt
+    # Every reaction; workers get them all on connecting, then each change
+    reaction_log = message_log.MessageLog(REACTIONS_DIR, fsync=False)
+    reactions_lock = threading.Lock()
+    reactions_version = [workers.version("reactions")]
+    held_reactions = reactions.ReactionIndex()
+    for _, change in reaction_log.scan():
+        held_reactions.apply(change)
+
+    def append(message):
+        log.append(message)
+        with messages_lock:
+            workers.publish("messages", len(log), message)
+
+    def publish_session(change):
+        # Called with sessions_lock held
+        sessions_version[0] += 1
+        workers.publish("sessions", sessions_version[0], change)
+
+    def change_profile(change):
+        with profiles_lock:
+            profiles_version[0] += 1
+            workers.publish("profiles", profiles_version[0], change)
+
+    def mark_read(receipt):
+        key = receipt["user_id"], receipt["channel_id"]
+        with receipts_lock:
+            if key in furthest and furthest[key]["number"] >= receipt["number"]:
+                return
+            receipts.append(receipt)
+            furthest[key] = receipt
+            receipts_version[0] += 1
+            workers.publish("receipts", receipts_version[0], receipt)
+
+    def change_reaction(change):
+        with reactions_lock:
+            if not held_reactions.apply(change):
+                return
+            reaction_log.append(change)
+            reactions_version[0] += 1
+            workers.publish("reactions", reactions_version[0], change)
+
+    def serialized(method):
+        def call(*args):
+            with sessions_lock:
+                return method(*args)
+        return call
+
+    session_store.add_listener(publish_session)
+    workers.serve(
+        {"messages.append": append,
+         "sessions.create": serialized(session_store.create),
+         "sessions.touch": serialized(session_store.touch),
+         "sessions.delete": serialized(session_store.delete),
+         "profiles.change": change_profile,
+         "receipts.mark": mark_read,
+         "reactions.change": change_reaction},
+        {"messages": (messages_lock, lambda: (len(log), None)),
+         "sessions": (sessions_lock, lambda: (sessions_version[0], session_store.entries())),
+         # The owner keeps no profiles; a worker that (re)connects may have
+         # missed changes, so it starts its cache over
+         "profiles": (profiles_lock, lambda: (profiles_version[0], None)),
+         "receipts": (receipts_lock, lambda: (receipts_version[0], list(furthest.values()))),
+         "reactions": (reactions_lock, lambda: (reactions_version[0], held_reactions.entries()))})
+
+def _apply_messages(version, message, snapshot):
+    # Worker: reads and indexes the records the owner has written, then
+    # hands a new message to this worker's /ws clients
+    global _indexed
+    log = get_message_log()
+    with _message_log_lock:
+        end = log.refresh(version)
+        if end > _indexed:
+            index_messages(log, _channel_index, _search_index, _unread_counts, _indexed, end)
+        _indexed = max(_indexed, end)
+    if message is not None:
+        chat_hub.publish({"type": "message", "message": message})
+
+def _apply_sessions(version, data, snapshot):
+    # Worker: keeps session_store a replica of the owner's
+    if snapshot:
+        session_store.load(data)
+    else:
+        session_store.apply([data])
+
+def _apply_receipts(version, data, snapshot):
+    # Worker: receipts only move forward, so a snapshot is applied like a
+    # batch of them. The messages they point to were reported first.
+    unread = get_unread_counts()
+    for receipt in data if snapshot else [data]:
+        apply_receipt(unread, receipt)
+
+def _apply_reactions(version, data, snapshot):
+    # Worker: keeps its reaction index a replica of the owner's and tells its
+    # /ws clients about each change
+    index = get_reactions()
+    if snapshot:
+        index.load(data)
+    elif index.apply(data):
+        publish_reactions(index, data[1])
+
+def _apply_profiles(version, change, snapshot):
+    # Worker: keeps its profile cache current
+    if snapshot:
+        profiles.clear()
+    else:
+        profiles.apply(change)
+
+def run_workers(port, engine, threads, count):
+    workers = cluster.Cluster(count, ["messages", "sessions", "profiles", "receipts", "reactions"])
+
+    def serve_worker():
+        global _cluster, session_updates
+        _cluster, session_updates = workers, _OwnerSessions()
+        workers.connect({"messages": _apply_messages, "sessions": _apply_sessions, "profiles": _apply_profiles,
+                         "receipts": _apply_receipts, "reactions": _apply_reactions})
+        SupabaseChatHTTPRequestHandler.access_log = access_log.open_log("server", workers.worker_number)
+        with serving.make_server(("", port), SupabaseChatHTTPRequestHandler, engine=engine, threads=threads,
+                                 reuse_port=True) as httpd:
+            httpd.serve_forever()
+
+    print(f"\nMessage log: {MESSAGE_LOG_DIR}")
+    print(f"\nServer started at http://0.0.0.0:{port} ({count} workers, {engine} engine)")
+    print("Press Ctrl+C to stop the server", flush=True)
+    workers.run(lambda: _serve_owner(workers), serve_worker)
+    print("\nServer stopped.")
+
+if __name__ == "__main__":
+    args = serving.parse_args(PORT, description="SupabaseChat demo server")
+    run_server(args.port, args.engine, args.threads, args.workers)
@@ -0,0 +1,680 @@
+#!/usr/bin/env python3
+# Serving engines shared by server.py and user_api.py.
+#
+# Every engine drives an unmodified http.server request handler class:
+#   single  - the original socketserver.TCPServer, one connection at a time
+#   thread  - connections are handled on a bounded pool of worker threads
+#   asyncio - connections are multiplexed on one event loop; a worker thread is
+#             only borrowed while a request is actually being handled, so idle
+#             keep-alive clients cost no thread at all
+#
+# Handlers that stream for a long time (server-sent events, WebSockets) can
+# call detach() to move their connection onto an event loop, so an idle
+# subscriber costs a socket and a small buffer rather than a thread.
+#
+# Handlers that mix in KeepAliveHandlerMixin speak HTTP/1.1 with persistent
+# connections. Between requests the thread engine parks an idle connection on
+# the same event loop instead of blocking a worker on it, and every engine
+# closes connections that stay idle for KEEPALIVE_TIMEOUT seconds or have
+# served MAX_KEEPALIVE_REQUESTS requests.
+#
+# With reuse_port, several processes can each run a server on the same port
+# (SO_REUSEPORT); the kernel spreads new connections across them. See
+# cluster.py for the --workers mode built on it.
+import argparse
+import asyncio
+import io
+import os
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+ENGINES = ("single", "thread", "asyncio")
+DEFAULT_ENGINE = os.environ.get("SERVER_ENGINE", "thread")
+DEFAULT_THREADS = int(os.environ.get("SERVER_THREADS", "32"))
+DEFAULT_WORKERS = int(os.environ.get("SERVER_WORKERS", "1"))
+
+# Accepted connections allowed to wait for a pool thread before accept() stalls
+DEFAULT_PENDING = 256
+LISTEN_BACKLOG = 1024
+
+# asyncio engine limits
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BUFFERED_BYTES = 1024 * 1024
+# Bodies are buffered whole before the handler runs; this is at least the
+# largest one any handler accepts (user_api.py's status batches)
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+# Persistent connection limits
+# An unread request body up to this size is read and discarded to keep the
+# connection; a larger one closes it
+MAX_DRAIN_BYTES = 64 * 1024
+KEEPALIVE_TIMEOUT = float(os.environ.get("KEEPALIVE_TIMEOUT", "15"))
+MAX_KEEPALIVE_REQUESTS = int(os.environ.get("MAX_KEEPALIVE_REQUESTS", "1000"))
+
+
+class _Reactor:
+    # Background event loop for connections handed off by the socketserver
+    # engines, so long-lived streams do not pin a worker thread each
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                ready = threading.Event()
+                thread = threading.Thread(target=self._run, args=(ready,), name="reactor", daemon=True)
+                thread.start()
+                ready.wait()
+            return self._loop
+
+    def _run(self, ready):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        ready.set()
+        loop.run_forever()
+
+
+_reactor = _Reactor()
+
+
+class _DetachMixin:
+    # Lets a handler give its connection to an asyncio.Protocol on the reactor
+    # loop instead of holding a server thread for the life of the stream
+
+    def __init__(self, *args, **kwargs):
+        self._detached = set()
+        # Requests already served on parked connections, by socket
+        self._served = {}
+        super().__init__(*args, **kwargs)
+
+    def detach(self, handler, protocol):
+        handler.wfile.flush()
+        handler.close_connection = True
+        sock = handler.connection
+        sock.setblocking(False)
+        try:
+            # Bytes the client sent after the request that are already buffered
+            leftover = handler.rfile.peek()
+        except (OSError, ValueError):
+            leftover = b""
+        self._detached.add(sock)
+        loop = _reactor.loop()
+
+        async def adopt():
+            await loop.connect_accepted_socket(lambda: protocol, sock)
+            if leftover:
+                protocol.data_received(leftover)
+
+        asyncio.run_coroutine_threadsafe(adopt(), loop)
+
+    def shutdown_request(self, request):
+        if request in self._detached:
+            self._detached.discard(request)
+            return
+        super().shutdown_request(request)
+
+
+class SingleThreadTCPServer(_DetachMixin, socketserver.TCPServer):
+    allow_reuse_address = True
+    # Every request is a new connection here, so don't drop them at accept
+    request_queue_size = LISTEN_BACKLOG
+    # An idle persistent connection would block every other client
+    keep_alive = False
+
+
+class ThreadPoolTCPServer(_DetachMixin, socketserver.TCPServer):
+    allow_reuse_address = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def __init__(self, server_address, handler_class, threads=DEFAULT_THREADS,
+                 max_pending=DEFAULT_PENDING, bind_and_activate=True):
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self.threads = threads
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http-worker")
+        # Once the pool and its queue are full the accept loop blocks here, so
+        # a connection flood backs up in the kernel backlog instead of memory
+        self._slots = threading.BoundedSemaphore(threads + max_pending)
+        # Sockets parked between requests, until their handler has finished
+        self._parked = {}
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            self._pool.submit(self._process_request, request, client_address)
+        except RuntimeError:
+            # Pool already shut down
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process_request(self, request, client_address, slot=True):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            if slot:
+                self._slots.release()
+
+    def park(self, handler):
+        # Called by a keep-alive handler between requests when the client has
+        # not sent anything yet: the worker thread is released and the reactor
+        # waits for the next request, or closes the connection once it has
+        # been idle for KEEPALIVE_TIMEOUT
+        self._parked[handler.connection] = handler.client_address
+        self._served[handler.connection] = handler.requests_served
+
+    def shutdown_request(self, request):
+        # The reactor only takes a parked connection once its handler is done
+        client_address = self._parked.pop(request, None)
+        if client_address is None:
+            super().shutdown_request(request)
+            return
+        loop = _reactor.loop()
+        loop.call_soon_threadsafe(self._watch, loop, request, client_address)
+
+    def _watch(self, loop, sock, client_address):
+        # Runs on the reactor loop
+        def readable():
+            loop.remove_reader(sock)
+            timer.cancel()
+            try:
+                # Parked connections do not take an accept slot again
+                self._pool.submit(self._process_request, sock, client_address, False)
+            except RuntimeError:
+                self._served.pop(sock, None)
+                self.shutdown_request(sock)
+
+        def idle():
+            loop.remove_reader(sock)
+            self._served.pop(sock, None)
+            self.shutdown_request(sock)
+
+        timer = loop.call_later(KEEPALIVE_TIMEOUT, idle)
+        try:
+            loop.add_reader(sock, readable)
+        except (OSError, ValueError):
+            # Closed while it was being parked
+            timer.cancel()
+            idle()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncioHTTPServer:
+    # Mirrors the parts of the socketserver API that the entry points use:
+    # server_address, serve_forever(), shutdown(), server_close() and "with".
+
+    def __init__(self, server_address, handler_class, threads=DEFAULT_THREADS, reuse_port=False):
+        self.RequestHandlerClass = handler_class
+        self.socket = socket.create_server(server_address, backlog=LISTEN_BACKLOG, reuse_port=reuse_port)
+        self.server_address = self.socket.getsockname()[:2]
+        self.threads = threads
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http-worker")
+        self._handler_class = _buffered_handler_class(handler_class)
+        self._loop = None
+        self._stopping = None
+        self._started = threading.Event()
+        self._stopped = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    def serve_forever(self, poll_interval=None):
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self._stopped.set()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        server = await self._loop.create_server(
+            lambda: _HTTPProtocol(self), sock=self.socket, backlog=LISTEN_BACKLOG)
+        self._started.set()
+        async with server:
+            await self._stopping.wait()
+
+    def shutdown(self):
+        # Returns once serve_forever() has, as socketserver's does, so that
+        # server_close() does not pull the socket from under the loop
+        self._started.wait()
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        self._stopped.wait()
+
+    def server_close(self):
+        self.socket.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def detach(self, handler, protocol):
+        # Picked up by the connection once the handler returns
+        handler.close_connection = True
+        handler._serving_connection._upgrade = protocol
+
+    def handle_error(self, client_address):
+        print("-" * 40, file=sys.stderr)
+        print(f"Exception occurred during processing of request from {client_address}", file=sys.stderr)
+        traceback.print_exc()
+        print("-" * 40, file=sys.stderr)
+
+
+def _buffered_handler_class(handler_class):
+    # The asyncio engine keeps one handler instance per connection and feeds it
+    # complete requests from memory, so the socket plumbing is switched off.
+    class BufferedHandler(handler_class):
+        def setup(self):
+            pass
+
+        def handle(self):
+            pass
+
+        def finish(self):
+            pass
+
+        def handle_expect_100(self):
+            # The engine has already answered "100 Continue" on the transport
+            return True
+
+    BufferedHandler.__name__ = handler_class.__name__
+    BufferedHandler.__qualname__ = handler_class.__qualname__
+    return BufferedHandler
+
+
+def _content_length(head):
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            try:
+                return max(int(value.strip()), 0)
+            except ValueError:
+                return 0
+    return 0
+
+
+class _HTTPProtocol(asyncio.Protocol):
+    def __init__(self, server):
+        self._server = server
+        self._buffer = bytearray()
+        self._busy = False
+        self._reading_paused = False
+        self._writing_paused = False
+        self._continue_sent = False
+        self._transport = None
+        self._handler = None
+        self._upgrade = None
+        self._idle_timer = None
+        self._last_activity = 0.0
+
+    def connection_made(self, transport):
+        self._transport = transport
+        peer = transport.get_extra_info("peername") or ("", 0)
+        self._handler = self._server._handler_class(None, peer[:2], self._server)
+        self._handler._serving_connection = self
+        self._touch()
+
+    def connection_lost(self, exc):
+        self._buffer.clear()
+        self._cancel_idle_timer()
+
+    def _touch(self):
+        # Restarts the idle clock; one timer per connection is re-armed lazily
+        # rather than rescheduled on every read
+        loop = self._server._loop
+        self._last_activity = loop.time()
+        if self._idle_timer is None:
+            self._idle_timer = loop.call_later(KEEPALIVE_TIMEOUT, self._check_idle)
+
+    def _check_idle(self):
+        self._idle_timer = None
+        if self._busy or self._transport.is_closing():
+            return
+        remaining = self._last_activity + KEEPALIVE_TIMEOUT - self._server._loop.time()
+        if remaining > 0:
+            self._idle_timer = self._server._loop.call_later(remaining, self._check_idle)
+        else:
+            self._transport.close()
+
+    def _cancel_idle_timer(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def data_received(self, data):
+        self._buffer += data
+        self._touch()
+        # Stop reading while a pipelined backlog waits behind a busy handler
+        if self._busy and len(self._buffer) > MAX_BUFFERED_BYTES and not self._reading_paused:
+            self._reading_paused = True
+            self._transport.pause_reading()
+        self._dispatch()
+
+    def pause_writing(self):
+        self._writing_paused = True
+
+    def resume_writing(self):
+        self._writing_paused = False
+        self._dispatch()
+
+    def _dispatch(self):
+        if self._busy or self._writing_paused or self._transport.is_closing():
+            return
+        request = self._next_request()
+        if request is None:
+            return
+        self._busy = True
+        self._cancel_idle_timer()
+        future = self._server._loop.run_in_executor(self._server._executor, self._run, request)
+        future.add_done_callback(self._finished)
+
+    def _next_request(self):
+        end = self._buffer.find(b"\r\n\r\n")
+        if end < 0:
+            if len(self._buffer) > MAX_HEADER_BYTES:
+                self._transport.write(
+                    b"HTTP/1.1 431 Request Header Fields Too Large\r\n"
+                    b"Connection: close\r\nContent-Length: 0\r\n\r\n")
+                self._transport.close()
+            return None
+        head = bytes(self._buffer[:end])
+        length = _content_length(head)
+        if length > MAX_BODY_BYTES:
+            self._transport.write(
+                b"HTTP/1.1 413 Payload Too Large\r\n"
+                b"Connection: close\r\nContent-Length: 0\r\n\r\n")
+            self._transport.close()
+            return None
+        total = end + 4 + length
+        if len(self._buffer) < total:
+            if not self._continue_sent and b"100-continue" in head.lower():
+                self._continue_sent = True
+                self._transport.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            return None
+        request = bytes(self._buffer[:total])
+        del self._buffer[:total]
+        self._continue_sent = False
+        return request
+
+    def _run(self, request):
+        # Runs on a worker thread
+        handler = self._handler
+        handler.rfile = io.BytesIO(request)
+        handler.wfile = io.BytesIO()
+        handler.close_connection = True
+        handler.handle_one_request()
+        return handler.wfile.getvalue(), handler.close_connection
+
+    def _finished(self, future):
+        self._busy = False
+        if self._transport.is_closing():
+            return
+        try:
+            response, close = future.result()
+        except Exception:
+            self._server.handle_error(self._handler.client_address)
+            self._transport.close()
+            return
+        if response:
+            self._transport.write(response)
+        if self._upgrade is not None:
+            self._switch_protocol(self._upgrade)
+            return
+        if close:
+            self._transport.close()
+            return
+        if self._reading_paused and len(self._buffer) <= MAX_BUFFERED_BYTES:
+            self._reading_paused = False
+            self._transport.resume_reading()
+        self._touch()
+        self._dispatch()
+
+    def _switch_protocol(self, protocol):
+        self._cancel_idle_timer()
+        leftover = bytes(self._buffer)
+        self._buffer.clear()
+        self._transport.set_protocol(protocol)
+        protocol.connection_made(self._transport)
+        if self._reading_paused:
+            self._transport.resume_reading()
+        if leftover:
+            protocol.data_received(leftover)
+
+
+class _BodyReader:
+    # rfile while a request is handled: reads stop at the end of its
+    # Content-Length body, and what is left unread is counted, so a reply
+    # sent without reading the body does not leave it to be parsed as the
+    # next request
+
+    def __init__(self, rfile, length):
+        self.raw = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.raw.read(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.raw.readline(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def peek(self, size=0):
+        return self.raw.peek(size)
+
+
+class KeepAliveHandlerMixin:
+    # Mix in before http.server's handler classes for HTTP/1.1 persistent
+    # connections. Responses should carry Content-Length, or use
+    # start_chunked()/write_chunk()/end_chunked(); any other response ends
+    # the connection, as its body is delimited by the close. HTTP/1.0
+    # clients keep the connection only if they ask for it. A request body
+    # the handler did not read is discarded before the response (up to
+    # MAX_DRAIN_BYTES; a larger one closes the connection).
+    protocol_version = "HTTP/1.1"
+    # Socket timeout while reading a request on the socketserver engines
+    timeout = KEEPALIVE_TIMEOUT
+    # Headers and small bodies go out in one segment, flushed per response
+    wbufsize = io.DEFAULT_BUFFER_SIZE
+    disable_nagle_algorithm = True
+    requests_served = 0
+    # Status of the last response started on the connection (101 included)
+    # and the length of its body, as far as it is known
+    response_status = 0
+    response_bytes = 0
+    _response_code = None
+    _framed = False
+    _chunked = False
+    _connection_sent = False
+
+    def setup(self):
+        super().setup()
+        served = getattr(self.server, "_served", None)
+        if served:
+            # Resuming a parked connection
+            self.requests_served = served.pop(self.connection, 0)
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        park = getattr(self.server, "park", None)
+        while not self.close_connection:
+            if park is not None and not self._input_pending():
+                park(self)
+                return
+            self.handle_one_request()
+
+    def _input_pending(self):
+        # Whether the client has already sent more (e.g. pipelined requests)
+        sock = self.connection
+        timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            return bool(self.rfile.peek())
+        except (OSError, ValueError):
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    def handle_one_request(self):
+        self.requests_served += 1
+        try:
+            super().handle_one_request()
+        finally:
+            if isinstance(self.rfile, _BodyReader):
+                self.rfile = self.rfile.raw
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        if self.headers.get("Transfer-Encoding"):
+            # Bodies are only delimited by Content-Length here
+            self.close_connection = True
+            return True
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+        elif length:
+            self.rfile = _BodyReader(self.rfile, length)
+        return True
+
+    def _discard_body(self):
+        # Before a final response: drops what is left of the request body,
+        # or gives up the connection if that is too much
+        body = self.rfile
+        if not isinstance(body, _BodyReader) or not body.remaining or self.close_connection:
+            return
+        if body.remaining > MAX_DRAIN_BYTES:
+            self.close_connection = True
+            return
+        try:
+            while body.remaining and body.read(body.remaining):
+                pass
+        except OSError:
+            pass
+        if body.remaining:
+            # The client sent less than it declared
+            self.close_connection = True
+
+    def send_response_only(self, code, message=None):
+        super().send_response_only(code, message)
+        if code != HTTPStatus.CONTINUE:
+            self.response_status = code
+            self.response_bytes = 0
+        if code >= 200:
+            self._response_code = code
+            self._framed = self._chunked = self._connection_sent = False
+
+    def send_header(self, keyword, value):
+        super().send_header(keyword, value)
+        name = keyword.lower()
+        if name == "content-length":
+            self._framed = True
+            self.response_bytes = int(value)
+        elif name == "transfer-encoding":
+            self._framed = True
+        elif name == "connection":
+            self._connection_sent = True
+
+    def end_headers(self):
+        code, self._response_code = self._response_code, None
+        if code is not None:
+            self._discard_body()
+        if code is not None and not self._connection_sent:
+            has_body = code not in (HTTPStatus.NO_CONTENT, HTTPStatus.NOT_MODIFIED) and self.command != "HEAD"
+            if (self.close_connection or (has_body and not self._framed)
+                    or self.requests_served >= MAX_KEEPALIVE_REQUESTS
+                    or not getattr(self.server, "keep_alive", True)):
+                self.send_header("Connection", "close")
+            elif self.request_version == "HTTP/1.0":
+                self.send_header("Connection", "keep-alive")
+        super().end_headers()
+
+    def start_chunked(self):
+        # Call before end_headers() instead of sending Content-Length
+        if self.request_version != "HTTP/1.0":
+            self.send_header("Transfer-Encoding", "chunked")
+            self._chunked = True
+
+    def write_chunk(self, data):
+        if not data or self.command == "HEAD":
+            return
+        self.response_bytes += len(data)
+        if self._chunked:
+            self.wfile.write(b"%x\r\n" % len(data))
+            self.wfile.write(data)
+            self.wfile.write(b"\r\n")
+        else:
+            self.wfile.write(data)
+
+    def end_chunked(self):
+        if self._chunked and self.command != "HEAD":
+            self.wfile.write(b"0\r\n\r\n")
+        self._chunked = False
+
+
+def supports_detach(handler):
+    return hasattr(handler.server, "detach")
+
+
+def detach(handler, protocol):
+    # Hands the handler's connection to `protocol` (an asyncio.Protocol) on an
+    # event loop once the response headers written so far have been sent. The
+    # handler must not touch rfile/wfile afterwards. Returns False when the
+    # server running the handler cannot do this.
+    server_detach = getattr(handler.server, "detach", None)
+    if server_detach is None:
+        return False
+    server_detach(handler, protocol)
+    return True
+
+
+def make_server(server_address, handler_class, engine=DEFAULT_ENGINE, threads=DEFAULT_THREADS,
+                reuse_port=False):
+    if engine == "asyncio":
+        return AsyncioHTTPServer(server_address, handler_class, threads=threads, reuse_port=reuse_port)
+    if engine == "single":
+        server = SingleThreadTCPServer(server_address, handler_class, bind_and_activate=False)
+    elif engine == "thread":
+        server = ThreadPoolTCPServer(server_address, handler_class, threads=threads, bind_and_activate=False)
+    else:
+        raise ValueError(f"Unknown serving engine: {engine!r} (expected one of {', '.join(ENGINES)})")
+    server.allow_reuse_port = reuse_port
+    try:
+        server.server_bind()
+        server.server_activate()
+    except BaseException:
+        server.server_close()
+        raise
+    return server
+
+
+def parse_args(default_port, description=None, argv=None):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--engine", choices=ENGINES, default=DEFAULT_ENGINE,
+                        help="serving engine (default: %(default)s)")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS,
+                        help="worker threads for the thread and asyncio engines (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="worker processes sharing the port, restarted if they exit (default: %(default)s)")
+    return parser.parse_args(argv)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# Login sessions for server.py.
+#
+# A session is a random id in a SessionStore, handed to the browser as a
+# signed cookie ("<id>.<keyed BLAKE2b of the id>"), so forged or mangled
+# cookies are turned away before the store is even looked at. BLAKE2b's
+# keyed mode is a MAC on its own, and takes a fraction of the time of an
+# HMAC-SHA256. SESSION_SECRET is the key; without it a random key is made at import, which --workers processes
+# share because they are forked after it.
+#
+# The store is split into SHARDS ordered dicts, each in least recently used
+# order with its own lock. Looking a session up takes no lock: it is one dict
+# read and a check of the expiry time. Sessions expire SESSION_TTL_SECONDS
+# after they were last renewed; a lookup renews a session (moving it to the
+# most recently used end, under its shard's lock) only once it is more than
+# TOUCH_INTERVAL old, so a busy session does not take the lock on every
+# request. Each shard holds at most MAX_SESSIONS / SHARDS sessions: adding
+# one to a full shard evicts its least recently used session, and expired
+# sessions at that end are dropped whenever one is added.
+#
+# A store can also be a replica of one in another process (server.py
+# --workers): listeners get every create, renewal and delete as a change,
+# and load() and apply() take them in another store; a replica leaves
+# renewals to the store it copies (see lookup()).
+import collections
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+COOKIE_NAME = "session"
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+TOUCH_INTERVAL = 60.0
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", "1000000"))
+SHARDS = 64
+# Expired sessions dropped from a shard each time one is added
+EXPIRED_PER_CREATE = 4
+
+_secret = os.environ.get("SESSION_SECRET")
+# BLAKE2b keys are at most 64 bytes, so the secret is hashed down to one
+_SECRET = hashlib.blake2b(_secret.encode()).digest() if _secret else secrets.token_bytes(32)
+
+
+def _signature(session_id):
+    return hashlib.blake2b(session_id.encode(), key=_SECRET, digest_size=16).hexdigest()
+
+
+def sign(session_id):
+    return f"{session_id}.{_signature(session_id)}"
+
+
+def verify(token):
+    # The session id in a cookie value, or None if it is not one we signed
+    session_id, _, signature = token.partition(".")
+    # compare_digest() only takes ASCII strings
+    if not session_id or not signature.isascii() or not hmac.compare_digest(signature, _signature(session_id)):
+        return None
+    return session_id
+
+
+def session_id_from(headers):
+    # The verified session id in the request's Cookie header, if any
+    for cookie in headers.get_all("Cookie") or ():
+        for part in cookie.split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == COOKIE_NAME:
+                return verify(value)
+    return None
+
+
+def set_cookie(session_id, ttl=SESSION_TTL_SECONDS):
+    # Set-Cookie value for a session; None clears the cookie
+    if session_id is None:
+        return f"{COOKIE_NAME}=; Path=/; Max-Age=0; HttpOnly; SameSite=Lax"
+    return f"{COOKIE_NAME}={sign(session_id)}; Path=/; Max-Age={int(ttl)}; HttpOnly; SameSite=Lax"
+
+
+class SessionStore:
+    def __init__(self, ttl=SESSION_TTL_SECONDS, capacity=MAX_SESSIONS, shards=SHARDS,
+                 touch_interval=TOUCH_INTERVAL):
+        if shards & (shards - 1):
+            raise ValueError("shards must be a power of two")
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self._mask = shards - 1
+        self._shard_capacity = max(capacity // shards, 1)
+        # id -> [expires, data], least recently used first
+        self._shards = [collections.OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._listeners = []
+        # Per shard, each counted under its shard's lock
+        self._evicted = [0] * shards
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    @property
+    def evicted(self):
+        return sum(self._evicted)
+
+    def add_listener(self, listener):
+        # listener(change), called under the shard's lock with
+        # ["put", id, expires, data] or ["delete", id]
+        self._listeners.append(listener)
+
+    def _notify(self, change):
+        for listener in self._listeners:
+            listener(change)
+
+    def lookup(self, session_id, now=None):
+        # (data, due for renewal), or (None, False) for no live session
+        index = hash(session_id) & self._mask
+        entry = self._shards[index].get(session_id)
+        if entry is None:
+            return None, False
+        now = time.time() if now is None else now
+        expires = entry[0]
+        if expires <= now:
+            return None, False
+        return entry[1], expires - now < self.ttl - self.touch_interval
+
+    def get(self, session_id, now=None):
+        # The session's data, renewing it when due; None if there is none
+        data, due = self.lookup(session_id, now)
+        if due:
+            self.touch(session_id, now)
+        return data
+
+    def create(self, data, now=None):
+        # Starts a session holding `data` (not None); returns its id
+        session_id = secrets.token_urlsafe(18)
+        self._put(session_id, (time.time() if now is None else now) + self.ttl, data)
+        return session_id
+
+    def touch(self, session_id, now=None):
+        # Renews a live session; False if there is none
+        index = hash(session_id) & self._mask
+        shard = self._shards[index]
+        now = time.time() if now is None else now
+        with self._locks[index]:
+            entry = shard.get(session_id)
+            if entry is None or entry[0] <= now:
+                return False
+            entry[0] = now + self.ttl
+            shard.move_to_end(session_id)
+            if self._listeners:
+                self._notify(["put", session_id, entry[0], entry[1]])
+        return True
+
+    def delete(self, session_id):
+        index = hash(session_id) & self._mask
+        with self._locks[index]:
+            if self._shards[index].pop(session_id, None) is None:
+                return False
+            if self._listeners:
+                self._notify(["delete", session_id])
+        return True
+
+    def _put(self, session_id, expires, data, notify=True):
+        index = hash(session_id) & self._mask
+        shard = self._shards[index]
+        now = time.time()
+        with self._locks[index]:
+            # Renewed sessions move to the end, so expired ones are at the front
+            for _ in range(EXPIRED_PER_CREATE):
+                if not shard:
+                    break
+                oldest = next(iter(shard))
+                if oldest == session_id or shard[oldest][0] > now:
+                    break
+                del shard[oldest]
+            shard[session_id] = [expires, data]
+            shard.move_to_end(session_id)
+            while len(shard) > self._shard_capacity:
+                shard.popitem(last=False)
+                self._evicted[index] += 1
+            if notify and self._listeners:
+                self._notify(["put", session_id, expires, data])
+
+    # Replicas
+
+    def entries(self):
+        # [[id, expires, data], ...] of every session, least recently used
+        # first within each shard; takes each shard's lock in turn
+        entries = []
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                entries.extend([session_id, entry[0], entry[1]] for session_id, entry in shard.items())
+        return entries
+
+    def load(self, entries):
+        # Replaces every session with those from another store's entries()
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.clear()
+        self.apply([["put", *entry] for entry in entries])
+
+    def apply(self, changes):
+        for change in changes:
+            if change[0] == "put":
+                self._put(change[1], change[2], change[3], notify=False)
+            else:
+                index = hash(change[1]) & self._mask
+                with self._locks[index]:
+                    self._shards[index].pop(change[1], None)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# Server-sent events fan-out.
+#
+# Subscribers are asyncio protocols on the serving engine's event loop (see
+# serving.detach), so thousands of idle dashboards cost no threads. publish()
+# may be called from any thread; each event is encoded once and written to
+# every subscriber's transport without blocking. Recent events are kept in a
+# ring buffer so a reconnecting client can resume from Last-Event-ID.
+import asyncio
+import collections
+import json
+import threading
+
+REPLAY_SIZE = 4096
+# The replay buffer also stops growing at this many bytes of encoded events
+REPLAY_BYTES = 16 * 1024 * 1024
+# A subscriber this far behind is disconnected; it can resume via Last-Event-ID
+MAX_BUFFERED_BYTES = 256 * 1024
+KEEPALIVE_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+
+def encode_event(event_id, event, payload):
+    data = json.dumps(payload, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n".encode()
+
+
+class _Subscriber(asyncio.Protocol):
+    def __init__(self, hub, last_event_id):
+        self._hub = hub
+        self.last_event_id = last_event_id
+        self.transport = None
+        self.loop = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+        transport.write(f"retry: {RETRY_MILLISECONDS}\n\n".encode())
+        self._hub._attach(self)
+
+    def data_received(self, data):
+        # Clients do not send anything on an event stream
+        pass
+
+    def connection_lost(self, exc):
+        self._hub._detach(self)
+
+    def send(self, event_id, frame):
+        if event_id <= self.last_event_id:
+            return
+        self.last_event_id = event_id
+        self.write(frame)
+
+    def write(self, frame):
+        transport = self.transport
+        if transport.is_closing():
+            return
+        if transport.get_write_buffer_size() > MAX_BUFFERED_BYTES:
+            self._hub.dropped += 1
+            transport.abort()
+            return
+        transport.write(frame)
+
+
+class EventStreamHub:
+    # `snapshot` returns (event_id, frame) describing the full current state;
+    # it is sent to new subscribers and to those whose Last-Event-ID is no
+    # longer in the replay buffer.
+
+    def __init__(self, snapshot, replay_size=REPLAY_SIZE):
+        self._snapshot = snapshot
+        self._replay = collections.deque()
+        self._replay_size = replay_size
+        self._replay_bytes = 0
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._keepalive_loops = set()
+        self.dropped = 0
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def protocol(self, last_event_id=None):
+        return _Subscriber(self, last_event_id)
+
+    def publish(self, event_id, event, payload):
+        # Event ids must increase; callers publish while holding their own
+        # state lock so events arrive here in order
+        frame = encode_event(event_id, event, payload)
+        with self._lock:
+            self._replay.append((event_id, frame))
+            self._replay_bytes += len(frame)
+            while len(self._replay) > 1 and (len(self._replay) > self._replay_size
+                                             or self._replay_bytes > REPLAY_BYTES):
+                self._replay_bytes -= len(self._replay.popleft()[1])
+            loops = list(self._subscribers)
+        for loop in loops:
+            loop.call_soon_threadsafe(self._fan_out, loop, event_id, frame)
+
+    def _fan_out(self, loop, event_id, frame):
+        for subscriber in list(self._subscribers.get(loop, ())):
+            subscriber.send(event_id, frame)
+
+    def _covers(self, event_id):
+        # Caller holds the lock
+        if not self._replay:
+            return False
+        return self._replay[0][0] <= event_id + 1 and event_id <= self._replay[-1][0]
+
+    def _attach(self, subscriber):
+        # Runs on the subscriber's loop
+        last_event_id = subscriber.last_event_id
+        while True:
+            with self._lock:
+                resumable = last_event_id is not None and self._covers(last_event_id)
+            if not resumable:
+                last_event_id, frame = self._snapshot()
+                subscriber.write(frame)
+            with self._lock:
+                if self._replay and self._replay[0][0] > last_event_id + 1:
+                    # The ring moved past us while taking the snapshot
+                    last_event_id = None
+                    continue
+                self._subscribers.setdefault(subscriber.loop, set()).add(subscriber)
+                if subscriber.loop not in self._keepalive_loops:
+                    self._keepalive_loops.add(subscriber.loop)
+                    self._schedule_keepalive(subscriber.loop)
+                backlog = [entry for entry in self._replay if entry[0] > last_event_id]
+            break
+        subscriber.last_event_id = last_event_id
+        for event_id, frame in backlog:
+            subscriber.send(event_id, frame)
+
+    def _detach(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.loop)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+
+    def _schedule_keepalive(self, loop):
+        # One timer per loop rather than one per subscriber
+        loop.call_later(KEEPALIVE_SECONDS, self._keepalive, loop)
+
+    def _keepalive(self, loop):
+        with self._lock:
+            subscribers = list(self._subscribers.get(loop, ()))
+            if not subscribers:
+                self._subscribers.pop(loop, None)
+                self._keepalive_loops.discard(loop)
+                return
+        for subscriber in subscribers:
+            subscriber.write(b": keepalive\n\n")
+        self._schedule_keepalive(loop)
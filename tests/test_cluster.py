@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# cluster._Client calls that the owner never answers.
+#
+#   python -m pytest tests/test_cluster.py
+import os
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cluster  # noqa: E402
+
+
+def test_timed_out_call_is_forgotten(monkeypatch):
+    monkeypatch.setattr(cluster, "CALL_TIMEOUT", 0.05)
+    client = cluster._Client(None, {})
+    owner, client._sock = socket.socketpair()
+    try:
+        for _ in range(3):
+            with pytest.raises(cluster.OwnerUnavailable):
+                client.call("heartbeat", {"user_id": "user1"})
+        assert client._pending == {}
+    finally:
+        owner.close()
+        client._sock.close()
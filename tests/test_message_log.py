@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# message_log.MessageLog under concurrent use, and recovery of a torn tail.
+#
+#   python -m pytest tests/test_message_log.py
+import os
+import random
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import message_log  # noqa: E402
+
+
+def _record(writer, number):
+    return {"id": f"msg-{writer}-{number}", "content": "x" * (number % 200)}
+
+
+def test_reads_while_appending(tmp_path):
+    # Readers follow the active segment as it grows (and is remapped) and
+    # rolls over to new ones
+    log = message_log.MessageLog(str(tmp_path), segment_bytes=64 * 1024, fsync=False)
+    writers, per_writer = 2, 2000
+    done = threading.Event()
+    errors = []
+
+    def write(writer):
+        try:
+            for number in range(per_writer):
+                log.append(_record(writer, number))
+        except Exception as error:
+            errors.append(error)
+
+    def read(seed):
+        rng = random.Random(seed)
+        try:
+            while not done.is_set():
+                visible = len(log)
+                if visible:
+                    offset = rng.randrange(max(visible - 50, 0), visible)
+                    assert log.read(offset)["id"].startswith("msg-")
+                    for _, record in log.scan(max(visible - 20, 0), visible):
+                        assert record["id"].startswith("msg-")
+        except Exception as error:
+            errors.append(error)
+
+    readers = [threading.Thread(target=read, args=(seed,)) for seed in range(4)]
+    appenders = [threading.Thread(target=write, args=(writer,)) for writer in range(writers)]
+    for thread in readers + appenders:
+        thread.start()
+    for thread in appenders:
+        thread.join()
+    done.set()
+    for thread in readers:
+        thread.join()
+    try:
+        assert errors == []
+        assert len(log) == writers * per_writer
+        ids = sorted(record["id"] for _, record in log.scan())
+        assert ids == sorted(_record(writer, number)["id"]
+                             for writer in range(writers) for number in range(per_writer))
+    finally:
+        log.close()
+
+
+def test_torn_tail_is_truncated_on_open(tmp_path):
+    with message_log.MessageLog(str(tmp_path), fsync=False) as log:
+        for number in range(10):
+            log.append(_record(0, number))
+        path = log._segments[-1].path
+    # A crash halfway through writing an eleventh record
+    payload = b'{"id":"msg-0-10","content":""}'
+    with open(path, "ab") as file:
+        file.write(message_log.encode_record(payload)[:-5])
+    size = os.path.getsize(path)
+
+    with message_log.MessageLog(str(tmp_path), fsync=False) as log:
+        assert len(log) == 10
+        assert os.path.getsize(path) < size
+        assert [record["id"] for _, record in log.scan()] == [f"msg-0-{number}" for number in range(10)]
+        assert log.append(_record(0, 10)) == 10
+        assert log.read(10)["id"] == "msg-0-10"
+
+    with message_log.MessageLog(str(tmp_path), fsync=False) as log:
+        assert len(log) == 11
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# ratelimit.RateLimiter's 429 answers on persistent connections.
+#
+#   python -m pytest tests/test_ratelimit.py
+import http.server
+import os
+import socket
+import sys
+import threading
+from http import HTTPStatus
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ratelimit  # noqa: E402
+import serving  # noqa: E402
+
+limiter = ratelimit.RateLimiter({"/limited": (0.001, 1, "ip")})
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # Plain HTTP/1.1 handler: nothing but the limiter looks at the body of
+    # a refused request
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Length", str(len(self.path)))
+        self.end_headers()
+        self.wfile.write(self.path.encode())
+
+    def do_POST(self):
+        if not limiter.allow(self, self.path):
+            return
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(HTTPStatus.NO_CONTENT)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_limited_request_body_is_not_parsed_as_a_request():
+    server = serving.make_server(("127.0.0.1", 0), _Handler, engine="thread", threads=2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        smuggled = b"GET /smuggled HTTP/1.1\r\nHost: test\r\n\r\n"
+        post = b"POST /limited HTTP/1.1\r\nHost: test\r\nContent-Length: %d\r\n\r\n" % len(smuggled) + smuggled
+        with socket.create_connection(server.server_address, timeout=5) as sock:
+            # The first request uses the burst, the second is refused
+            sock.sendall(post + post)
+            data = b""
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert data.startswith(b"HTTP/1.1 204 ")
+    assert b"HTTP/1.1 429 " in data
+    assert b"/smuggled" not in data
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# search_index.SearchIndex refusing documents added out of offset order.
+#
+#   python -m pytest tests/test_search_index.py
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import search_index  # noqa: E402
+
+
+def test_out_of_order_document_is_refused():
+    index = search_index.SearchIndex()
+    index.add(0, "hello world", "general")
+    index.add(2, "hello again", "general")
+    for doc in (1, 2):
+        with pytest.raises(ValueError):
+            index.add(doc, "hello there", "general")
+    # The refused documents left no postings behind
+    assert len(index) == 2
+    assert [doc for doc, _ in index.search("hello")[1]] == [2, 0]
+    assert index.search("there") == (0, [])
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# Request framing on persistent connections, on every serving engine.
+#
+#   python -m pytest tests/test_serving.py
+import http.server
+import os
+import socket
+import sys
+import threading
+from http import HTTPStatus
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import serving  # noqa: E402
+
+
+class _Handler(serving.KeepAliveHandlerMixin, http.server.BaseHTTPRequestHandler):
+    # Answers POST without reading the body, like an unknown path or a
+    # rejected request does in the servers
+    def do_GET(self):
+        self._reply(HTTPStatus.OK, self.path.encode())
+
+    def do_POST(self):
+        self._reply(HTTPStatus.NOT_FOUND, b"not found")
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(params=serving.ENGINES)
+def port(request):
+    server = serving.make_server(("127.0.0.1", 0), _Handler, engine=request.param, threads=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    thread.join(5)
+
+
+def _post(path, body, keep_alive=True):
+    return (f"POST {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode() + body
+
+
+def _responses(port, raw):
+    # Sends `raw` and reads until the server closes: [(status, body), ...]
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+        sock.sendall(raw)
+        data = b""
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    responses = []
+    while data:
+        head, _, data = data.partition(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        headers = dict(line.lower().split(": ", 1) for line in lines[1:])
+        length = int(headers.get("content-length", 0))
+        responses.append((int(lines[0].split(" ")[1]), data[:length], headers.get("connection")))
+        data = data[length:]
+    return responses
+
+
+def test_unread_body_is_not_parsed_as_a_request(port):
+    smuggled = b"GET /smuggled HTTP/1.1\r\nHost: test\r\n\r\n"
+    raw = _post("/nope", smuggled) + b"GET /next HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n"
+    responses = [(status, body) for status, body, _ in _responses(port, raw)]
+    # The single engine answers one request per connection
+    assert responses in ([(404, b"not found"), (200, b"/next")], [(404, b"not found")])
+
+
+def test_large_unread_body_closes_the_connection(port):
+    body = b"x" * (serving.MAX_DRAIN_BYTES + 1)
+    raw = _post("/nope", body) + b"GET /next HTTP/1.1\r\nHost: test\r\n\r\n"
+    responses = _responses(port, raw)
+    assert responses[0][:2] == (404, b"not found")
+    # The asyncio engine frames requests itself and may keep going
+    assert responses[0][2] == "close" or responses[1:] == [(200, b"/next", None)]
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# Hierarchical timing wheel for many keyed deadlines.
+#
+# Time is counted in ticks of `tick` seconds. Level 0 has one slot per tick
+# for the next SLOTS ticks; each higher level has slots SLOTS times wider.
+# A key lives in exactly one slot, and slots are dicts, so scheduling,
+# rescheduling and cancelling are O(1). Advancing one tick empties one level 0
+# slot; at the start of every level l span the matching level l slot is
+# re-placed one level down (cascading), so each key moves at most LEVELS - 1
+# times before it expires. Nothing ever scans the whole set of keys.
+import collections
+import math
+import time
+
+SLOTS = 64
+LEVELS = 4
+_BITS = SLOTS.bit_length() - 1
+
+
+class TimingWheel:
+    def __init__(self, tick=1.0, now=None):
+        self.tick = tick
+        self._tick = self._to_tick(time.monotonic() if now is None else now)
+        self._wheels = [[{} for _ in range(SLOTS)] for _ in range(LEVELS)]
+        # key -> the slot dict holding it
+        self._slots = {}
+        # Expired keys not yet handed out by advance()
+        self._due = collections.deque()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def _to_tick(self, seconds):
+        return math.floor(seconds / self.tick)
+
+    def schedule(self, key, deadline):
+        # (Re)sets the key to expire at `deadline` (time.monotonic() seconds)
+        self.cancel(key)
+        # Deadlines already passed fire on the next tick
+        self._place(key, max(math.ceil(deadline / self.tick), self._tick + 1))
+
+    def cancel(self, key):
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            del slot[key]
+
+    def _place(self, key, deadline):
+        current = self._tick
+        # Deadlines past the top level wait in its furthest slot and are
+        # placed again, with the real deadline, when that slot cascades
+        position = min(deadline, current + SLOTS ** LEVELS - 1)
+        for level in range(LEVELS):
+            shift = _BITS * level
+            if (position >> shift) - (current >> shift) < SLOTS:
+                break
+        slot = self._wheels[level][(position >> shift) & (SLOTS - 1)]
+        slot[key] = deadline
+        self._slots[key] = slot
+
+    def advance(self, now=None, limit=None):
+        # Moves the wheel up to `now` and returns the keys whose deadline has
+        # passed, at most `limit` at a time; the rest are returned by the
+        # next call
+        target = self._to_tick(time.monotonic() if now is None else now)
+        if not self._slots:
+            self._tick = max(self._tick, target)
+        while self._tick < target and (limit is None or len(self._due) < limit):
+            self._tick += 1
+            current = self._tick
+            # Higher levels first, so keys they hand down can cascade again
+            for level in range(LEVELS - 1, 0, -1):
+                shift = _BITS * level
+                if current & ((1 << shift) - 1) == 0:
+                    slot = self._wheels[level][(current >> shift) & (SLOTS - 1)]
+                    if slot:
+                        entries = list(slot.items())
+                        slot.clear()
+                        for key, deadline in entries:
+                            self._place(key, deadline)
+            slot = self._wheels[0][current & (SLOTS - 1)]
+            if slot:
+                self._due.extend(slot)
+                for key in slot:
+                    del self._slots[key]
+                slot.clear()
+        due = self._due
+        if limit is None or len(due) <= limit:
+            self._due = collections.deque()
+            return list(due)
+        return [due.popleft() for _ in range(limit)]
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# Unread message counts per user and channel for server.py.
+#
+# Counts follow read_receipts in create.sql: a user has read a channel up to
+# their last_read_message_id, and every message appended to the channel
+# after it is unread. Messages are numbered within their channel in log
+# order (1, 2, ...); each channel keeps how many it has, and each user how
+# many of each channel's messages they have read. A new message adds one to
+# its channel, a receipt moves the user's number for the channel up to its
+# message's (never down), and posting in a channel counts as reading it, so
+# a user's unread counts are one subtraction per channel with no history
+# scanned.
+#
+# Message ids are kept by hash, packed with their channel and number in one
+# int, as receipts only need to find a message's number.
+#
+# Counting a large range of the log (at startup) is spread over up to
+# REBUILD_PROCESSES forked processes, each decoding slices of the log (JSON
+# decoding is most of the work) and sending back the channels and id hashes
+# as arrays; count_log() starts them and the counts are merged here in log
+# order while the caller does its own scan. The children only read the log
+# files through objects they create, so forking while the server's threads
+# hold their locks is safe; hashes match because the children inherit the
+# parent's hash seed.
+import multiprocessing
+import os
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import channel_index
+import message_log
+
+REBUILD_PROCESSES = int(os.environ.get("UNREAD_REBUILD_PROCESSES", str(os.cpu_count() or 1)))
+# Ranges smaller than this are counted in the calling process
+REBUILD_MIN_MESSAGES = 50000
+SLICES_PER_PROCESS = 4
+# A message's channel and number, packed as channel << _SHIFT | number
+_SHIFT = 40
+_NUMBER_MASK = (1 << _SHIFT) - 1
+
+
+def _count_slice(directory, visible, start, end):
+    # In a rebuild process: (channel ids in order of first appearance, each
+    # message's channel as an index into them, each message's id hash,
+    # {(user id, channel index): number within the slice of their last post})
+    log = message_log.MessageLog(directory, readonly=True)
+    try:
+        log.refresh(visible)
+        channels = {}
+        counts = []
+        channel_of = array("i")
+        hashes = array("q")
+        posts = {}
+        for _, message in log.scan(start, end):
+            channel_id = message.get("channel_id", channel_index.DEFAULT_CHANNEL)
+            local = channels.get(channel_id)
+            if local is None:
+                local = channels[channel_id] = len(counts)
+                counts.append(0)
+            counts[local] += 1
+            channel_of.append(local)
+            hashes.append(hash(message["id"]))
+            posts[message["user_id"], local] = counts[local]
+        return list(channels), channel_of, hashes, posts
+    finally:
+        log.close()
+
+
+class UnreadCounts:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Channel number -> id, id -> number, number -> messages
+        self._channel_ids = []
+        self._channel_numbers = {}
+        self._counts = array("q")
+        # hash(message id) -> channel << _SHIFT | number in the channel
+        self._messages = {}
+        # user id -> {channel number: messages read}
+        self._read = {}
+
+    def __len__(self):
+        return len(self._messages)
+
+    def _channel(self, channel_id):
+        # Caller holds the lock
+        number = self._channel_numbers.get(channel_id)
+        if number is None:
+            number = self._channel_numbers[channel_id] = len(self._channel_ids)
+            self._channel_ids.append(channel_id)
+            self._counts.append(0)
+        return number
+
+    def _advance(self, user_id, channel, number):
+        # Caller holds the lock
+        read = self._read.get(user_id)
+        if read is None:
+            self._read[user_id] = {channel: number}
+        elif read.get(channel, 0) < number:
+            read[channel] = number
+
+    def add_message(self, message):
+        # Call in log order: numbers are given out in the order messages come
+        # (server.index_appended() orders concurrent appends)
+        key = hash(message["id"])
+        with self._lock:
+            channel = self._channel(message.get("channel_id", channel_index.DEFAULT_CHANNEL))
+            number = self._counts[channel] + 1
+            self._counts[channel] = number
+            self._messages[key] = channel << _SHIFT | number
+            self._advance(message["user_id"], channel, number)
+
+    def position(self, channel_id, message_id):
+        # The message's number in the channel; ValueError if it is not there
+        with self._lock:
+            packed = self._messages.get(hash(message_id))
+            channel = self._channel_numbers.get(channel_id)
+        if packed is None or channel is None or packed >> _SHIFT != channel:
+            raise ValueError(f"no message {message_id!r} in channel {channel_id!r}")
+        return packed & _NUMBER_MASK
+
+    def advance(self, user_id, channel_id, number):
+        # Marks the channel's first `number` messages read by the user
+        with self._lock:
+            self._advance(user_id, self._channel(channel_id), number)
+
+    def mark_read(self, user_id, channel_id, message_id):
+        # A receipt; ValueError if the message is not in the channel
+        self.advance(user_id, channel_id, self.position(channel_id, message_id))
+
+    def unread(self, user_id):
+        # {channel id: unread messages} for every channel
+        with self._lock:
+            read = self._read.get(user_id, {})
+            counts = self._counts
+            return {channel_id: counts[channel] - read.get(channel, 0)
+                    for channel, channel_id in enumerate(self._channel_ids)}
+
+    def count_log(self, log, start, end, processes=REBUILD_PROCESSES):
+        # Starts counting records [start, end) of `log` in other processes.
+        # Returns a function that waits for them and adds the counts, which
+        # must be called before any later message is added; or None if the
+        # range is too small to be worth it, and the caller is to
+        # add_message() each record itself.
+        if processes <= 1 or end - start < REBUILD_MIN_MESSAGES:
+            return None
+        slices = processes * SLICES_PER_PROCESS
+        bounds = [start + (end - start) * index // slices for index in range(slices + 1)]
+        pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("fork"))
+        futures = [pool.submit(_count_slice, log.directory, end, low, high)
+                   for low, high in zip(bounds, bounds[1:])]
+
+        def finish():
+            try:
+                for future in futures:
+                    self._merge(*future.result())
+            finally:
+                pool.shutdown(cancel_futures=True)
+
+        return finish
+
+    def _merge(self, channel_ids, channel_of, hashes, posts):
+        with self._lock:
+            channels = [self._channel(channel_id) for channel_id in channel_ids]
+            counts = self._counts
+            before = [counts[channel] for channel in channels]
+            messages = self._messages
+            for local, key in zip(channel_of, hashes):
+                channel = channels[local]
+                number = counts[channel] + 1
+                counts[channel] = number
+                messages[key] = channel << _SHIFT | number
+            for (user_id, local), number in posts.items():
+                self._advance(user_id, channels[local], before[local] + number)
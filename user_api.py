@@ -2,81 +2,442 @@
 import os
 import json
 import http.server
-import socketserver
+import threading
 from http import HTTPStatus
 from urllib.parse import urlparse, parse_qs
 
+import access_log
+import cluster
+import debug
+import metrics
+import page_cache
+import postgrest
+import presence
+import presence_table
+import ratelimit
+import serving
+import sse
+
 # Get Supabase environment variables - needed for Swift app integration
 supabase_url = os.environ.get('SUPABASE_URL', 'Not set')
 supabase_key_status = 'Set' if os.environ.get('SUPABASE_KEY') else 'Not set'
 
-# User status tracking (would be in a database in a real app)
-users = {
-    "user1": {"id": "user1", "username": "sarah_dev", "is_online": False},
-    "user2": {"id": "user2", "username": "alex_swift", "is_online": False},
-    "user3": {"id": "user3", "username": "taylor_code", "is_online": False}
-}
+# User status tracking (would be in a database in a real app). A compact
+# table (see presence_table.py) that reads and writes like a dict of user
+# dicts.
+users = presence_table.PresenceTable([
+    {"id": "user1", "username": "sarah_dev", "is_online": False, "last_seen": None},
+    {"id": "user2", "username": "alex_swift", "is_online": False, "last_seen": None},
+    {"id": "user3", "username": "taylor_code", "is_online": False, "last_seen": None}
+])
+
+# Supabase REST client (see postgrest.py), or None to keep the users above
+upstream = postgrest.from_environment()
+
+# Versioned view of `users` that records every status change and expires
+# online users who stop sending heartbeats
+store = presence.PresenceStore(users)
+
+# Upper bound for the long-poll `wait` parameter, in seconds
+MAX_WAIT_SECONDS = 60
+
+# Page size limits for GET /api/users?online=&cursor=&limit=
+DEFAULT_USERS_LIMIT = 100
+MAX_USERS_LIMIT = 1000
+# Query parameters that ask /api/users for a filtered page or a count
+USERS_QUERY_PARAMS = ("online", "cursor", "limit", "count_only")
+
+# Limits for POST /api/users/status
+MAX_BATCH_SIZE = 50000
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+
+# Server-sent events for /api/users/stream; event ids are store versions
+def _presence_snapshot_event():
+    version, user_list = store.snapshot()
+    return version, sse.encode_event(version, "snapshot", {"users": user_list, "version": version})
+
+presence_stream = sse.EventStreamHub(_presence_snapshot_event)
+
+# A single change is a "presence" event with the user; a batch is one
+# "presence-batch" event listing every user it changed
+def _publish_presence(version, changes):
+    if len(changes) == 1:
+        presence_stream.publish(version, "presence", changes[0])
+    else:
+        presence_stream.publish(version, "presence-batch", {"changes": changes})
+
+store.add_listener(_publish_presence)
 
 # Helper function to get all user statuses
 def get_user_statuses():
-    return {"users": list(users.values())}
+    version, user_list = store.snapshot()
+    return {"users": user_list, "version": version}
+
+# Encoded response bodies for /api/users and /api/users/{id}. Each user's JSON
+# is kept as bytes and re-encoded only when that user changes; the full list
+# is joined from those bytes the first time it is read after a change, by one
+# reader while concurrent ones wait for it, then served as-is until the next
+# change. The bytes match json.dumps(get_user_statuses()).
+class SnapshotCache:
+    def __init__(self, store):
+        self._store = store
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._parts = {}
+        self.version = 0
+        # (version, body) of the last full list built
+        self._body = None
+        self.rebuilds = 0
+        store.add_listener(self._changed)
+        self.reload()
+
+    def reload(self):
+        # Re-encodes every user; needed only if `users` is modified directly
+        with self._store.locked():
+            version, user_list = self._store.snapshot()
+            parts = {user["id"]: json.dumps(user).encode() for user in user_list}
+            with self._lock:
+                self._parts, self.version, self._body = parts, version, None
+
+    def _changed(self, version, changes):
+        # Store listener: runs with the store lock held
+        encoded = [(user["id"], json.dumps(user).encode()) for user in changes]
+        with self._lock:
+            self._parts.update(encoded)
+            self.version = version
+
+    def user(self, user_id):
+        return self._parts.get(user_id)
+
+    def users(self):
+        # Returns (version, body) for the current state
+        body = self._body
+        if body is not None and body[0] == self.version:
+            return body
+        with self._build_lock:
+            body = self._body
+            if body is not None and body[0] == self.version:
+                return body
+            with self._lock:
+                version = self.version
+                parts = list(self._parts.values())
+            body = b'{"users": [' + b", ".join(parts) + b'], "version": ' + str(version).encode() + b"}"
+            self._body = (version, body)
+            self.rebuilds += 1
+            return self._body
+
+snapshot_cache = SnapshotCache(store)
+
+# Adds the project's users (profiles, with last_seen from user_status) to
+# `users` before serving. They start offline, as being online is a lease
+# only heartbeats grant. Keeps the users above if Supabase cannot be reached.
+def load_roster():
+    if upstream is None:
+        return
+    try:
+        profiles = upstream.profiles(columns="id,username")
+        statuses = {row["id"]: row for row in upstream.user_statuses()}
+    except (postgrest.UpstreamUnavailable, postgrest.UpstreamError) as error:
+        print(f"Could not load users from Supabase ({error})")
+        return
+    with store.locked():
+        for profile in profiles:
+            status = statuses.get(profile["id"], {})
+            users.setdefault(profile["id"], {"id": profile["id"], "username": profile["username"],
+                                             "is_online": False, "last_seen": status.get("last_status_change")})
+    snapshot_cache.reload()
+
+# Served on /metrics with the request metrics (see metrics.py); read when scraped
+metrics.REGISTRY.gauge("presence_users", "Known users.", function=lambda: len(users))
+metrics.REGISTRY.gauge("presence_online_users", "Users online.", function=lambda: store.online)
+metrics.REGISTRY.gauge("presence_table_bytes", "Memory held by the user table.", function=lambda: users.nbytes)
+metrics.REGISTRY.gauge("presence_version", "Latest presence version.", function=lambda: store.version)
+metrics.REGISTRY.gauge("sse_subscribers", "Open /api/users/stream connections.",
+                       function=lambda: presence_stream.subscriber_count())
+metrics.REGISTRY.counter("sse_dropped_subscribers_total", "Event stream clients dropped for falling behind.",
+                         function=lambda: presence_stream.dropped)
+metrics.REGISTRY.counter("presence_snapshot_rebuilds_total", "Full /api/users bodies encoded.",
+                         function=lambda: snapshot_cache.rebuilds)
+
+# Requests per second, burst and client key of rate-limited routes (see
+# ratelimit.py; RATE_LIMITS overrides them)
+RATE_LIMITS = {
+    "/api/toggle-status": (5, 20, "ip"),
+    "/api/heartbeat": (20, 100, "ip"),
+    "/api/users/status": (2, 10, "ip"),
+}
+rate_limiter = ratelimit.from_environment(RATE_LIMITS)
+
+# Route labels for metrics; any other path gets the HTML page
+METRICS_ROUTES = frozenset(("/", "/api/users", "/api/users/stream", "/api/users/status", "/api/heartbeat",
+                            "/api/toggle-status", "/metrics", "/debug/profile", "/debug/heap"))
+
+# Versions restart from zero with the process, so ETags also carry a
+# per-process id (in --workers mode, made before forking, so it is the same in
+# every worker; versions continue across owner restarts there)
+_ETAG_PREFIX = os.urandom(6).hex()
+
+# --workers mode (see cluster.py): the owner process holds the real store and
+# runs expiry; each worker's `store` is a replica of it, and status changes
+# go through `presence_updates`
+_cluster = None
+
+class _OwnerPresence:
+    # Stands in for the store's update methods in a worker: changes are
+    # applied by the owner, and are in this worker's replica by the time a
+    # call returns
+    def toggle(self, user_id):
+        return _cluster.call("presence.toggle", user_id)
+
+    def heartbeat(self, user_id):
+        return _cluster.call("presence.heartbeat", user_id)
+
+    def apply_batch(self, updates):
+        return _cluster.call("presence.apply_batch", updates)
+
+presence_updates = store
+
+# Turns the body of POST /api/users/status into [(user_id, is_online), ...];
+# raises ValueError describing the first bad item
+def parse_status_updates(data):
+    if not isinstance(data, list):
+        raise ValueError("body must be a JSON array of {user_id, is_online}")
+    if len(data) > MAX_BATCH_SIZE:
+        raise ValueError(f"at most {MAX_BATCH_SIZE} updates per request")
+    updates = []
+    for position, item in enumerate(data):
+        if not isinstance(item, dict):
+            raise ValueError(f"item {position} must be an object")
+        user_id = item.get("user_id")
+        is_online = item.get("is_online")
+        if not isinstance(user_id, str) or not isinstance(is_online, bool):
+            raise ValueError(f"item {position} needs a string user_id and a boolean is_online")
+        updates.append((user_id, is_online))
+    return updates
+
+# Turns "true"/"false" (or 1/0) into a bool; raises ValueError otherwise
+def parse_flag(name, value):
+    if value in ("true", "1"):
+        return True
+    if value in ("false", "0"):
+        return False
+    raise ValueError(f"{name} must be true or false")
+
+# Turns the query string of a filtered /api/users request into keyword
+# arguments for store.query(); raises ValueError describing a bad parameter
+def parse_users_query(query_params):
+    query = {"limit": DEFAULT_USERS_LIMIT}
+    if "online" in query_params:
+        query["online"] = parse_flag("online", query_params["online"][0])
+    if "count_only" in query_params:
+        query["count_only"] = parse_flag("count_only", query_params["count_only"][0])
+    try:
+        cursor = int(query_params.get("cursor", ["0"])[0] or 0)
+        limit = int(query_params.get("limit", [DEFAULT_USERS_LIMIT])[0])
+    except ValueError:
+        raise ValueError("cursor and limit must be integers") from None
+    if cursor < 0:
+        raise ValueError("cursor must not be negative")
+    query["cursor"] = cursor
+    query["limit"] = max(1, min(limit, MAX_USERS_LIMIT))
+    return query
 
 # API Request Handler
-class UserStatusHandler(http.server.SimpleHTTPRequestHandler):
+class UserStatusHandler(metrics.RequestMetricsMixin, serving.KeepAliveHandlerMixin,
+                        http.server.SimpleHTTPRequestHandler):
+    def metrics_route(self, path):
+        path = path.partition("?")[0]
+        if path in METRICS_ROUTES:
+            return path
+        if path.startswith("/api/users/"):
+            return "/api/users/{id}"
+        return "other"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")  # CORS for testing
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_encoded(self, body, etag=None):
+        # Sends pre-encoded JSON, or 304 when the client already has `etag`
+        if etag is not None and page_cache.etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            return
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")  # CORS for testing
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_presence(self):
+        # Event stream of presence changes; resumes after Last-Event-ID
+        last_event_id = self.headers.get("Last-Event-ID")
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        if not serving.detach(self, presence_stream.protocol(last_event_id)):
+            self.close_connection = True
+
+    def _owner_unavailable(self, error):
+        self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)})
+
+    def _heartbeat(self):
+        # Keeps a user online for another store.ttl seconds
+        user_id = parse_qs(urlparse(self.path).query).get("user_id", [""])[0]
+        try:
+            user = presence_updates.heartbeat(user_id)
+        except cluster.OwnerUnavailable as error:
+            self._owner_unavailable(error)
+            return
+        if user is not None:
+            self._send_json(HTTPStatus.OK, dict(user, expires_in=store.ttl))
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "User not found"})
+
+    def do_POST(self):
+        if rate_limiter is not None and not rate_limiter.allow(self, self.request_route()):
+            return
+        path = urlparse(self.path).path
+        if path == "/api/heartbeat":
+            self._heartbeat()
+            return
+        if path != "/api/users/status":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "Not found"})
+            return
+        # Set the status of many users at once; either every valid update
+        # is applied or, if any item is malformed, none is
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if not 0 < length <= MAX_BATCH_BYTES:
+                raise ValueError(f"body must be 1 to {MAX_BATCH_BYTES} bytes of JSON")
+            updates = parse_status_updates(json.loads(self.rfile.read(length)))
+        except ValueError as error:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+            return
+        try:
+            version, results = presence_updates.apply_batch(updates)
+        except cluster.OwnerUnavailable as error:
+            self._owner_unavailable(error)
+            return
+        updated = results.count("updated")
+        self._send_json(HTTPStatus.OK, {"version": version, "updated": updated, "results": results})
+
     def do_GET(self):
+        if rate_limiter is not None and not rate_limiter.allow(self, self.request_route()):
+            return
+
         # Parse URL and extract path and query parameters
         parsed_url = urlparse(self.path)
         path = parsed_url.path
         query_params = parse_qs(parsed_url.query)
 
+        if path.startswith("/debug/"):
+            # Diagnostics of this process; no need to be in sync
+            debug.handle(self)
+            return
+
+        if _cluster is not None and path != "/api/users/stream":
+            # Don't answer from a replica that is missing a change made
+            # through another worker (the stream catches up by itself)
+            try:
+                _cluster.sync("presence")
+            except cluster.OwnerUnavailable as error:
+                self._owner_unavailable(error)
+                return
+
         # Handle API endpoints
         if path == "/api/users":
-            # Return all users and their statuses
-            self.send_response(HTTPStatus.OK)
-            self.send_header("Content-type", "application/json")
-            self.send_header("Access-Control-Allow-Origin", "*")  # CORS for testing
-            self.end_headers()
-            self.wfile.write(json.dumps(get_user_statuses()).encode())
+            if "since" not in query_params and any(name in query_params for name in USERS_QUERY_PARAMS):
+                # A page of users, all or only online or offline ones, or
+                # just the counts
+                try:
+                    query = parse_users_query(query_params)
+                except ValueError as error:
+                    self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+                    return
+                result = store.query(**query)
+                if result.get("next_cursor") is not None:
+                    result["next_cursor"] = str(result["next_cursor"])
+                self._send_json(HTTPStatus.OK, result)
+                return
+
+            if "since" not in query_params:
+                # Return all users and their statuses
+                version, body = snapshot_cache.users()
+                self._send_encoded(body, f'"{_ETAG_PREFIX}-{version}"')
+                return
+
+            # Return only the changes after version `since`, waiting up to
+            # `wait` seconds for one if there is nothing new yet
+            try:
+                since = int(query_params["since"][0])
+                wait = float(query_params.get("wait", ["0"])[0])
+            except ValueError:
+                self._send_json(HTTPStatus.BAD_REQUEST, {"error": "since and wait must be numbers"})
+                return
+            wait = min(max(wait, 0), MAX_WAIT_SECONDS)
+            self._send_json(HTTPStatus.OK, store.changes_since(since, wait))
+            return
+
+        elif path == "/api/users/stream":
+            self._stream_presence()
             return
 
         elif path.startswith("/api/users/"):
             # Get user by ID
             user_id = path.split("/")[-1]
-            if user_id in users:
-                self.send_response(HTTPStatus.OK)
-                self.send_header("Content-type", "application/json")
-                self.send_header("Access-Control-Allow-Origin", "*")
-                self.end_headers()
-                self.wfile.write(json.dumps(users[user_id]).encode())
+            body = snapshot_cache.user(user_id)
+            if body is not None:
+                self._send_encoded(body)
             else:
-                self.send_response(HTTPStatus.NOT_FOUND)
-                self.send_header("Content-type", "application/json")
-                self.send_header("Access-Control-Allow-Origin", "*")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "User not found"}).encode())
+                self._send_json(HTTPStatus.NOT_FOUND, {"error": "User not found"})
+            return
+
+        elif path == "/api/heartbeat":
+            self._heartbeat()
+            return
+
+        elif path == "/metrics":
+            metrics.send(self)
             return
 
         elif path == "/api/toggle-status":
             # Toggle user online status
             user_id = query_params.get("user_id", [""])[0]
-            if user_id in users:
-                users[user_id]["is_online"] = not users[user_id]["is_online"]
-                self.send_response(HTTPStatus.OK)
-                self.send_header("Content-type", "application/json")
-                self.send_header("Access-Control-Allow-Origin", "*")
-                self.end_headers()
-                self.wfile.write(json.dumps(users[user_id]).encode())
+            try:
+                user = presence_updates.toggle(user_id)
+            except cluster.OwnerUnavailable as error:
+                self._owner_unavailable(error)
+                return
+            if user is not None:
+                self._send_json(HTTPStatus.OK, user)
             else:
-                self.send_response(HTTPStatus.NOT_FOUND)
-                self.send_header("Content-type", "application/json")
-                self.send_header("Access-Control-Allow-Origin", "*")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "User not found"}).encode())
+                self._send_json(HTTPStatus.NOT_FOUND, {"error": "User not found"})
             return
 
-        # If not an API endpoint, serve an HTML page with instructions
+        # If not an API endpoint, serve an HTML page with instructions. Its
+        # length grows with the user list, so it is sent in chunks.
         self.send_response(HTTPStatus.OK)
         self.send_header("Content-type", "text/html")
+        self.start_chunked()
         self.end_headers()
         
         html = f"""
@@ -175,6 +536,23 @@ class UserStatusHandler(http.server.SimpleHTTPRequestHandler):
                 <pre><code>{json.dumps(get_user_statuses(), indent=2)}</code></pre>
             </div>
             
+            <div class="endpoint">
+                <h3><span class="method">GET</span> /api/users?since=:version&amp;wait=:seconds</h3>
+                <p>Get only the users whose status changed after <code>version</code>. If nothing has changed yet, the request waits up to <code>wait</code> seconds (max {MAX_WAIT_SECONDS}) for a change. When the version is too old, a full snapshot is returned with <code>"snapshot": true</code>.</p>
+                <p>Example: <code>/api/users?since=0&amp;wait=30</code></p>
+            </div>
+            
+            <div class="endpoint">
+                <h3><span class="method">GET</span> /api/users?online=:bool&amp;cursor=:cursor&amp;limit=:n&amp;count_only=:bool</h3>
+                <p>Get a page of up to <code>limit</code> users (default {DEFAULT_USERS_LIMIT}, max {MAX_USERS_LIMIT}), only online or offline ones with <code>online=true</code> or <code>online=false</code>. The response has <code>count</code>, the number of users the filter matches, <code>online</code>, the number online, and <code>next_cursor</code> to pass as <code>cursor</code> for the next page (<code>null</code> on the last one). With <code>count_only=true</code>, only the counts are returned.</p>
+                <p>Example: <code>/api/users?online=true&amp;limit=50</code></p>
+            </div>
+            
+            <div class="endpoint">
+                <h3><span class="method">GET</span> /api/users/stream</h3>
+                <p>Server-sent events stream. Starts with a <code>snapshot</code> event holding every user, then sends a <code>presence</code> event for each status change, or one <code>presence-batch</code> event with a <code>changes</code> list for a batched update. Reconnecting clients send <code>Last-Event-ID</code> to resume without a new snapshot.</p>
+            </div>
+            
             <div class="endpoint">
                 <h3><span class="method">GET</span> /api/users/:id</h3>
                 <p>Get status information for a specific user by ID.</p>
@@ -189,12 +567,32 @@ class UserStatusHandler(http.server.SimpleHTTPRequestHandler):
                 <p>Example: <code>/api/toggle-status?user_id=user1</code></p>
             </div>
             
+            <div class="endpoint">
+                <h3><span class="method">GET</span>/<span class="method">POST</span> /api/heartbeat?user_id=:id</h3>
+                <p>Mark a user online for the next {store.ttl:g} seconds. Online users, however they went online, are set offline when that long passes without a heartbeat; every status change updates <code>last_seen</code>.</p>
+                <p>Example: <code>/api/heartbeat?user_id=user1</code></p>
+            </div>
+            
+            <div class="endpoint">
+                <h3><span class="method">POST</span> /api/users/status</h3>
+                <p>Set the online status of up to {MAX_BATCH_SIZE} users in one request. The body is a JSON array; the batch is applied atomically as a single version and the response has a <code>results</code> list with, for each item in order, <code>updated</code>, <code>unchanged</code> or <code>not_found</code>. A malformed item rejects the whole request with 400.</p>
+                <p>Example body: <code>[{{"user_id": "user1", "is_online": true}}, {{"user_id": "user2", "is_online": false}}]</code></p>
+            </div>
+            
+            <div class="endpoint">
+                <h3><span class="method">GET</span> /metrics</h3>
+                <p>Counters, gauges (requests in flight, open streams, online users) and per-route, per-status latency histograms in the Prometheus text format.</p>
+            </div>
+            
             <h2>Current Users</h2>
             <ul class="user-list">
             """
+        self.write_chunk(html.encode())
+        html = ""
         
         # Add each user with toggle button
-        for user_id, user in users.items():
+        for position, user in enumerate(store.snapshot()[1], 1):
+            user_id = user["id"]
             status_class = "status-online" if user["is_online"] else "status-offline"
             status_text = "Online" if user["is_online"] else "Offline"
             avatar_text = user["username"][0].upper()
@@ -210,6 +608,9 @@ class UserStatusHandler(http.server.SimpleHTTPRequestHandler):
                     <button class="toggle-button" onclick="toggleStatus('{user_id}')">Toggle Status</button>
                 </li>
             """
+            if position % 256 == 0:
+                self.write_chunk(html.encode())
+                html = ""
         
         html += """
             </ul>
@@ -229,12 +630,21 @@ class UserStatusHandler(http.server.SimpleHTTPRequestHandler):
         </html>
         """
         
-        self.wfile.write(html.encode())
+        self.write_chunk(html.encode())
+        self.end_chunked()
 
-def run_server(port=5002):
+def run_server(port=5002, engine=serving.DEFAULT_ENGINE, threads=serving.DEFAULT_THREADS, workers=1):
     handler = UserStatusHandler
-    with socketserver.TCPServer(("0.0.0.0", port), handler) as httpd:
-        print(f"User Status API server started at http://0.0.0.0:{port}")
+    if workers > 1:
+        run_workers(port, engine, threads, workers)
+        return
+    load_roster()
+    store.start_expiry()
+    handler.access_log = access_log.open_log("user_api")
+    with serving.make_server(("0.0.0.0", port), handler, engine=engine, threads=threads) as httpd:
+        print(f"User Status API server started at http://0.0.0.0:{port} ({engine} engine)")
+        if handler.access_log is not None:
+            print(f"Access log: {handler.access_log.path}")
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
@@ -243,5 +653,50 @@ def run_server(port=5002):
             httpd.server_close()
             print("Server stopped.")
 
+def _serve_presence_owner(workers):
+    # Owner process: the one real store. Versions carry on from the last one
+    # published, so replicas and clients never see them go back after the
+    # owner is restarted.
+    last = workers.version("presence")
+    if last:
+        store.version = last + 1
+
+    def publish(version, changes):
+        workers.publish("presence", version, changes)
+
+    load_roster()
+    store.add_listener(publish)
+    store.start_expiry()
+    workers.serve(
+        {"presence.toggle": store.toggle,
+         "presence.heartbeat": store.heartbeat,
+         "presence.apply_batch": store.apply_batch},
+        {"presence": (store.locked(), store.snapshot)})
+
+def _apply_presence(version, data, snapshot):
+    # Worker: keeps `store` a replica of the owner's
+    if snapshot:
+        store.load(version, data)
+    else:
+        store.apply(version, data)
+
+def run_workers(port, engine, threads, count):
+    workers = cluster.Cluster(count, ["presence"])
+
+    def serve_worker():
+        global _cluster, presence_updates
+        _cluster, presence_updates = workers, _OwnerPresence()
+        workers.connect({"presence": _apply_presence})
+        UserStatusHandler.access_log = access_log.open_log("user_api", workers.worker_number)
+        with serving.make_server(("0.0.0.0", port), UserStatusHandler, engine=engine, threads=threads,
+                                 reuse_port=True) as httpd:
+            httpd.serve_forever()
+
+    print(f"User Status API server started at http://0.0.0.0:{port} ({count} workers, {engine} engine)",
+          flush=True)
+    workers.run(lambda: _serve_presence_owner(workers), serve_worker)
+    print("Server stopped.")
+
 if __name__ == "__main__":
-    run_server()
\ No newline at end of file
+    args = serving.parse_args(5002, description="User Status API server")
+    run_server(args.port, args.engine, args.threads, args.workers)
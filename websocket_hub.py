@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# Minimal RFC 6455 WebSocket support and a broadcast hub for server.py.
+#
+# The HTTP handler answers the upgrade and then detaches the connection onto
+# the serving engine's event loop (see serving.detach), where a hub client
+# protocol takes over. Every broadcast is encoded once - and deflated once when
+# permessage-deflate is negotiated, which is why the server never keeps a
+# compression context between messages - and the same bytes are written to
+# every client.
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import os
+import struct
+import threading
+import zlib
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_INVALID_DATA = 1007
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TOO_BIG = 1009
+CLOSE_TRY_AGAIN_LATER = 1013
+
+MAX_MESSAGE_BYTES = 64 * 1024
+# Messages waiting for a client whose socket buffer is full
+MAX_QUEUED_MESSAGES = 256
+# Transport buffer above which a client counts as slow and messages are queued
+WRITE_HIGH_WATER = 64 * 1024
+# Payloads shorter than this are not worth deflating
+DEFLATE_MIN_BYTES = 128
+PING_INTERVAL_SECONDS = 30
+
+_DEFLATE_TAIL = b"\x00\x00\xff\xff"
+
+
+class ProtocolError(Exception):
+    def __init__(self, message, code=CLOSE_PROTOCOL_ERROR):
+        super().__init__(message)
+        self.code = code
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + GUID).encode()).digest()).decode()
+
+
+def negotiate_deflate(extensions_header):
+    # Returns the Sec-WebSocket-Extensions response value, or None
+    for offer in (extensions_header or "").split(","):
+        params = [param.strip() for param in offer.split(";")]
+        if params[0].lower() == "permessage-deflate":
+            # No server context takeover lets one deflated frame serve every client
+            return "permessage-deflate; server_no_context_takeover"
+    return None
+
+
+def deflate(payload):
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data[:-4] if data.endswith(_DEFLATE_TAIL) else data
+
+
+def encode_frame(opcode, payload, rsv1=False, mask=False):
+    first = 0x80 | opcode | (0x40 if rsv1 else 0)
+    length = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header = struct.pack("!BB", first, mask_bit | length)
+    elif length < 65536:
+        header = struct.pack("!BBH", first, mask_bit | 126, length)
+    else:
+        header = struct.pack("!BBQ", first, mask_bit | 127, length)
+    if not mask:
+        return header + payload
+    key = os.urandom(4)
+    return header + key + _apply_mask(payload, key)
+
+
+def _apply_mask(payload, key):
+    if not payload:
+        return b""
+    repeated = (key * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(len(payload), "big")
+
+
+def close_frame(code, reason=""):
+    return encode_frame(OP_CLOSE, struct.pack("!H", code) + reason.encode()[:120])
+
+
+class EncodedMessage:
+    # A text message encoded once for plain and deflate clients
+    __slots__ = ("plain", "_deflated", "_payload")
+
+    def __init__(self, payload):
+        self._payload = payload
+        self.plain = encode_frame(OP_TEXT, payload)
+        self._deflated = None
+
+    def frame(self, deflate_enabled):
+        if not deflate_enabled or len(self._payload) < DEFLATE_MIN_BYTES:
+            return self.plain
+        if self._deflated is None:
+            self._deflated = encode_frame(OP_TEXT, deflate(self._payload), rsv1=True)
+        return self._deflated
+
+
+class FrameParser:
+    # Incremental parser. feed() returns complete (opcode, payload) messages;
+    # fragmented messages are reassembled and inflated when RSV1 is set.
+
+    def __init__(self, expect_masked=True, deflate_enabled=False, max_message_bytes=MAX_MESSAGE_BYTES):
+        self._buffer = bytearray()
+        self._expect_masked = expect_masked
+        self._deflate = deflate_enabled
+        self._inflater = zlib.decompressobj(-zlib.MAX_WBITS) if deflate_enabled else None
+        self._max = max_message_bytes
+        self._fragments = []
+        self._fragment_opcode = None
+        self._fragment_compressed = False
+        self._fragment_size = 0
+
+    def feed(self, data):
+        self._buffer += data
+        messages = []
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return messages
+            message = self._assemble(*frame)
+            if message is not None:
+                messages.append(message)
+
+    def _next_frame(self):
+        buffer = self._buffer
+        if len(buffer) < 2:
+            return None
+        first, second = buffer[0], buffer[1]
+        fin, rsv1, opcode = bool(first & 0x80), bool(first & 0x40), first & 0x0F
+        if first & 0x30:
+            raise ProtocolError("reserved bits set")
+        masked, length = bool(second & 0x80), second & 0x7F
+        if masked != self._expect_masked:
+            raise ProtocolError("unexpected masking")
+        offset = 2
+        if length == 126:
+            if len(buffer) < 4:
+                return None
+            length = struct.unpack_from("!H", buffer, 2)[0]
+            offset = 4
+        elif length == 127:
+            if len(buffer) < 10:
+                return None
+            length = struct.unpack_from("!Q", buffer, 2)[0]
+            offset = 10
+        if length > self._max:
+            raise ProtocolError("message too big", CLOSE_TOO_BIG)
+        key = None
+        if masked:
+            if len(buffer) < offset + 4:
+                return None
+            key = bytes(buffer[offset:offset + 4])
+            offset += 4
+        if len(buffer) < offset + length:
+            return None
+        payload = bytes(buffer[offset:offset + length])
+        del buffer[:offset + length]
+        if key is not None:
+            payload = _apply_mask(payload, key)
+        return fin, rsv1, opcode, payload
+
+    def _assemble(self, fin, rsv1, opcode, payload):
+        if opcode >= 0x8:
+            if not fin or len(payload) > 125:
+                raise ProtocolError("invalid control frame")
+            return opcode, payload
+        if rsv1 and not self._deflate:
+            raise ProtocolError("compressed frame without permessage-deflate")
+        if opcode == OP_CONTINUATION:
+            if self._fragment_opcode is None:
+                raise ProtocolError("unexpected continuation frame")
+        else:
+            if self._fragment_opcode is not None:
+                raise ProtocolError("expected continuation frame")
+            self._fragment_opcode = opcode
+            self._fragment_compressed = rsv1
+        self._fragments.append(payload)
+        self._fragment_size += len(payload)
+        if self._fragment_size > self._max:
+            raise ProtocolError("message too big", CLOSE_TOO_BIG)
+        if not fin:
+            return None
+        opcode, data = self._fragment_opcode, b"".join(self._fragments)
+        compressed = self._fragment_compressed
+        self._fragments, self._fragment_opcode, self._fragment_size = [], None, 0
+        if compressed:
+            data = self._inflater.decompress(data + _DEFLATE_TAIL, self._max + 1)
+            if len(data) > self._max:
+                raise ProtocolError("message too big", CLOSE_TOO_BIG)
+        return opcode, data
+
+
+class _HubClient(asyncio.Protocol):
+    def __init__(self, hub, deflate_enabled, context):
+        self._hub = hub
+        self.deflate = deflate_enabled
+        self.context = context
+        self._parser = FrameParser(expect_masked=True, deflate_enabled=deflate_enabled)
+        self._queue = collections.deque()
+        self._paused = False
+        self._closing = False
+        self.transport = None
+        self.loop = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+        transport.set_write_buffer_limits(high=WRITE_HIGH_WATER)
+        self._hub._attach(self)
+
+    def connection_lost(self, exc):
+        self._queue.clear()
+        self._hub._detach(self)
+
+    def pause_writing(self):
+        self._paused = True
+
+    def resume_writing(self):
+        self._paused = False
+        while self._queue and not self._paused:
+            self.transport.write(self._queue.popleft())
+
+    def data_received(self, data):
+        if self._closing:
+            return
+        try:
+            messages = self._parser.feed(data)
+        except ProtocolError as error:
+            self.close(error.code, str(error))
+            return
+        for opcode, payload in messages:
+            if opcode == OP_PING:
+                self.transport.write(encode_frame(OP_PONG, payload))
+            elif opcode == OP_CLOSE:
+                code = struct.unpack("!H", payload[:2])[0] if len(payload) >= 2 else CLOSE_NORMAL
+                self.close(code)
+                return
+            elif opcode == OP_TEXT:
+                try:
+                    text = payload.decode("utf-8")
+                except UnicodeDecodeError:
+                    self.close(CLOSE_INVALID_DATA, "invalid utf-8")
+                    return
+                self._hub._received(self, text)
+
+    def send(self, message):
+        # message is an EncodedMessage shared with every other client
+        if self._closing:
+            return
+        frame = message.frame(self.deflate)
+        if not self._paused:
+            self.transport.write(frame)
+            return
+        if len(self._queue) < MAX_QUEUED_MESSAGES:
+            self._queue.append(frame)
+            return
+        self._hub.slow_consumers += 1
+        if self._hub.slow_consumer_policy == "coalesce":
+            # Replace the backlog with one notice telling the client to refetch
+            self._queue.clear()
+            self._queue.append(self._hub.resync_message.frame(self.deflate))
+        else:
+            self.close(CLOSE_TRY_AGAIN_LATER, "client too slow")
+
+    def ping(self):
+        if not self._closing and not self._paused:
+            self.transport.write(encode_frame(OP_PING, b""))
+
+    def close(self, code=CLOSE_NORMAL, reason=""):
+        if self._closing:
+            return
+        self._closing = True
+        self._queue.clear()
+        self.transport.write(close_frame(code, reason))
+        self.transport.close()
+
+
+class BroadcastHub:
+    # `on_message(text, context)` runs on an executor thread and turns a
+    # client's text message into a payload dict to broadcast, or returns None
+    # to ignore it; `context` is what protocol() was given for the connection
+    # (e.g. its session), and PermissionError closes the connection as a
+    # policy violation. publish() may be called from any thread. slow_consumer_policy is "coalesce" (swap the backlog for a single
+    # resync notice) or "drop" (disconnect the client).
+
+    def __init__(self, on_message=None, slow_consumer_policy="coalesce"):
+        if slow_consumer_policy not in ("coalesce", "drop"):
+            raise ValueError(f"Unknown slow consumer policy: {slow_consumer_policy!r}")
+        self.on_message = on_message
+        self.slow_consumer_policy = slow_consumer_policy
+        self.resync_message = EncodedMessage(json.dumps({"type": "resync"}).encode())
+        self.slow_consumers = 0
+        self.broadcasts = 0
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._ping_loops = set()
+
+    def protocol(self, deflate_enabled=False, context=None):
+        return _HubClient(self, deflate_enabled, context)
+
+    def client_count(self):
+        with self._lock:
+            return sum(len(clients) for clients in self._clients.values())
+
+    def publish(self, payload):
+        message = EncodedMessage(json.dumps(payload, separators=(",", ":")).encode())
+        with self._lock:
+            loops = list(self._clients)
+        for loop in loops:
+            loop.call_soon_threadsafe(self._fan_out, loop, message)
+
+    def _fan_out(self, loop, message):
+        self.broadcasts += 1
+        for client in list(self._clients.get(loop, ())):
+            client.send(message)
+
+    def _received(self, client, text):
+        if self.on_message is None:
+            return
+        # on_message may block (e.g. on a durable write), so keep it off the loop
+        client.loop.run_in_executor(None, self._handle_message, client, text)
+
+    def _handle_message(self, client, text):
+        try:
+            payload = self.on_message(text, client.context)
+        except (ValueError, KeyError, TypeError):
+            client.loop.call_soon_threadsafe(client.close, CLOSE_INVALID_DATA, "invalid message")
+            return
+        except PermissionError as error:
+            client.loop.call_soon_threadsafe(client.close, CLOSE_POLICY_VIOLATION, str(error))
+            return
+        if payload is not None:
+            self.publish(payload)
+
+    def _attach(self, client):
+        with self._lock:
+            self._clients.setdefault(client.loop, set()).add(client)
+            if client.loop not in self._ping_loops:
+                self._ping_loops.add(client.loop)
+                client.loop.call_later(PING_INTERVAL_SECONDS, self._ping, client.loop)
+
+    def _detach(self, client):
+        with self._lock:
+            clients = self._clients.get(client.loop)
+            if clients is not None:
+                clients.discard(client)
+
+    def _ping(self, loop):
+        # One timer per loop keeps idle connections alive through proxies
+        with self._lock:
+            clients = list(self._clients.get(loop, ()))
+            if not clients:
+                self._clients.pop(loop, None)
+                self._ping_loops.discard(loop)
+                return
+        for client in clients:
+            client.ping()
+        loop.call_later(PING_INTERVAL_SECONDS, self._ping, loop)